@@ -1,23 +1,41 @@
 from __future__ import annotations
 
-import base64
-import io
+import asyncio
+import logging
+import math
 import os
-from typing import List, Optional
+import threading
+from typing import TYPE_CHECKING, Any, Iterator, List, Optional
 
+import orjson
 from dotenv import load_dotenv
-from fastapi import FastAPI, Header, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from openai import OpenAI
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
 
 import food_analysis as fa
+import metrics
+import usage
+from circuit_breaker import CircuitOpenError
+from logging_config import setup_logging, shutdown_logging
+from middleware.admin import require_admin
+from middleware.rate_limit import rate_limit
+from profiling import ProfilingMiddleware, profile_current_thread
+from refinement import RefinementSessions
+from request_context import RequestContextMiddleware
 from subscription_routes import router as subscription_router, webhook_router
 
+if TYPE_CHECKING:
+    from openai import OpenAI
+
 
 load_dotenv()
+setup_logging()
+
+logger = logging.getLogger(__name__)
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,14 +44,103 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(RequestContextMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 
 app.include_router(subscription_router)
 app.include_router(webhook_router)
 
+refinement_sessions = RefinementSessions()
+
+_usage_flusher: Optional[usage.UsageFlusher] = None
+_lag_monitor: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+def start_usage_flusher() -> None:
+    global _usage_flusher
+    interval = float(os.getenv("USAGE_FLUSH_INTERVAL_SECONDS", "0") or 0)
+    if interval <= 0:
+        return
+    from stripe_service import get_supabase
+
+    supabase = get_supabase()
+    if supabase is None:
+        logger.warning("USAGE_FLUSH_INTERVAL_SECONDS set but Supabase is not configured - usage flush disabled")
+        return
+    _usage_flusher = usage.UsageFlusher(supabase, interval)
+    _usage_flusher.start()
+
+
+@app.on_event("shutdown")
+def stop_usage_flusher() -> None:
+    if _usage_flusher is not None:
+        _usage_flusher.stop()
+
+
+@app.on_event("startup")
+async def start_event_loop_lag_monitor() -> None:
+    global _lag_monitor
+    interval = float(os.getenv("EVENT_LOOP_LAG_INTERVAL_SECONDS", "0.5") or 0)
+    if interval > 0:
+        _lag_monitor = asyncio.create_task(metrics.monitor_event_loop_lag(interval))
+
+
+@app.on_event("shutdown")
+async def stop_event_loop_lag_monitor() -> None:
+    if _lag_monitor is not None:
+        _lag_monitor.cancel()
+
+
+@app.on_event("shutdown")
+def flush_logs() -> None:
+    shutdown_logging()
+
+
 api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
-    print("WARNING: OPENAI_API_KEY environment variable not set!")
-client = OpenAI(api_key=api_key)
+    logger.warning("OPENAI_API_KEY environment variable not set!")
+
+# Built by get_client() on the first analysis request; benchmarks may assign it directly
+client: Optional["OpenAI"] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> "OpenAI":
+    """Shared OpenAI client, importing the SDK on first use"""
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                from openai import OpenAI
+
+                client = OpenAI(api_key=api_key)
+    return client
+
+
+class ModelJSONResponse(ORJSONResponse):
+    """
+    Response for a model the route already built and validated
+
+    Returning it skips FastAPI's ``response_model`` re-validation and
+    ``jsonable_encoder`` pass; pydantic-core serializes the model straight to
+    bytes. ``response_model`` on the route still documents the schema.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return content.model_dump_json().encode("utf-8")
+        return super().render(content)
+
+
+def _unavailable(exc: CircuitOpenError) -> HTTPException:
+    """503 for requests no model can serve right now, instead of waiting on a failing upstream"""
+    return HTTPException(
+        status_code=503,
+        detail="Analysis temporarily unavailable",
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
 
 
 class ImageRequest(BaseModel):
@@ -41,6 +148,16 @@ class ImageRequest(BaseModel):
     image_url: Optional[str] = None
     filename: Optional[str] = "image.jpg"
     context_text: Optional[str] = None
+    # From a needs_clarification response; with context_text, skips re-upload and stage 1
+    session_id: Optional[str] = None
+
+
+class MealImagesRequest(BaseModel):
+    """Several photos of one meal (e.g. different angles), analyzed together"""
+
+    images: List[str] = Field(default_factory=list)
+    image_urls: List[str] = Field(default_factory=list)
+    context_text: Optional[str] = None
 
 
 class TextRequest(BaseModel):
@@ -69,11 +186,36 @@ class FoodAnalysisResponseFlat(BaseModel):
     items: Optional[List[fa.FoodAnalysisItem]] = Field(default=None)
 
 
-@app.post("/analyze_food/image", response_model=fa.FoodAnalysisResponseV2)
-async def analyze_food_image(
+# The analysis handlers are plain ``def`` so FastAPI runs them in its
+# threadpool: Pillow resizes and the OpenAI calls block. Each one calls
+# profile_current_thread() so a profiled request samples its worker thread.
+@app.post(
+    "/analyze_food/image",
+    response_model=fa.FoodAnalysisResponseV2,
+    dependencies=[Depends(rate_limit("image"))],
+)
+def analyze_food_image(
     request: ImageRequest,
     user_id: str = Header(..., alias="X-User-ID"),
 ):
+    profile_current_thread()
+    if request.session_id:
+        if not request.context_text:
+            raise HTTPException(status_code=400, detail="context_text is required with session_id")
+        state = refinement_sessions.get(request.session_id, user_id)
+        if state is not None:
+            try:
+                result = fa.refine_image(get_client(), state, request.context_text)
+            except CircuitOpenError as exc:
+                raise _unavailable(exc) from exc
+            except Exception as exc:
+                logger.exception("Image refinement failed")
+                raise HTTPException(status_code=500, detail="Image analysis failed") from exc
+            refinement_sessions.discard(request.session_id)
+            return ModelJSONResponse(result)
+        if not request.image and not request.image_url:
+            raise HTTPException(status_code=410, detail="refinement_session_expired")
+
     if not request.image and not request.image_url:
         raise HTTPException(
             status_code=400,
@@ -81,54 +223,165 @@ async def analyze_food_image(
         )
 
     try:
-        result = fa.analyze_image(
-            client,
+        result, state = fa.analyze_image_with_state(
+            get_client(),
             image_data=request.image or None,
             image_url=None if request.image else request.image_url,
             context_text=request.context_text or None,
         )
-        return fa.FoodAnalysisResponseV2(**result)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except CircuitOpenError as exc:
+        raise _unavailable(exc) from exc
+    except Exception as exc:
+        logger.exception("Image analysis failed")
+        raise HTTPException(status_code=500, detail="Image analysis failed") from exc
+
+    return _analysis_response(result, state, user_id)
+
+
+def _meal_image_units(request: MealImagesRequest) -> float:
+    """Rate-limit units for a multi-photo request: the shared calls plus one per photo"""
+    return 1.0 + len(request.images) + len(request.image_urls)
+
+
+@app.post(
+    "/analyze_food/images",
+    response_model=fa.FoodAnalysisResponseV2,
+    dependencies=[Depends(rate_limit("meal_image", units=_meal_image_units))],
+)
+def analyze_food_images(
+    request: MealImagesRequest,
+    user_id: str = Header(..., alias="X-User-ID"),
+):
+    profile_current_thread()
+    try:
+        result, state = fa.analyze_meal_images_with_state(
+            get_client(),
+            images=request.images,
+            image_urls=request.image_urls,
+            context_text=request.context_text or None,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except CircuitOpenError as exc:
+        raise _unavailable(exc) from exc
     except Exception as exc:
-        print(f"Image analysis error: {exc}")
+        logger.exception("Image analysis failed")
         raise HTTPException(status_code=500, detail="Image analysis failed") from exc
 
+    return _analysis_response(result, state, user_id)
+
+
+def _analysis_response(
+    result: fa.FoodAnalysisResponseV2, state: fa.ImageRefinementState, user_id: str
+) -> ModelJSONResponse:
+    """Attach a refinement session when the model asked for clarification"""
+    if result.status == "needs_clarification":
+        result.session_id = refinement_sessions.create(state, user_id)
+    return ModelJSONResponse(result)
 
-@app.post("/analyze_food/text", response_model=FoodAnalysisResponseFlat)
-async def analyze_food_text(
+
+@app.post(
+    "/analyze_food/text",
+    response_model=FoodAnalysisResponseFlat,
+    dependencies=[Depends(rate_limit("text"))],
+)
+def analyze_food_text(
     request: TextRequest,
     user_id: str = Header(..., alias="X-User-ID"),
 ):
+    profile_current_thread()
     if not request.text or not request.text.strip():
         raise HTTPException(status_code=400, detail="No text description provided")
 
     try:
-        nutrition = fa.analyze_text(client, request.text)
-        return FoodAnalysisResponseFlat(**nutrition)
+        nutrition = fa.analyze_text(get_client(), request.text)
+        return ModelJSONResponse(FoodAnalysisResponseFlat(**nutrition))
+    except CircuitOpenError as exc:
+        raise _unavailable(exc) from exc
     except Exception as exc:
-        print(f"Text analysis error: {exc}")
+        logger.exception("Text analysis failed")
         raise HTTPException(status_code=500, detail="Text analysis failed") from exc
 
 
-@app.post("/analyze_food/audio", response_model=FoodAnalysisResponseFlat)
-async def analyze_food_audio(
+@app.post(
+    "/analyze_food/text/stream",
+    dependencies=[Depends(rate_limit("text"))],
+)
+async def analyze_food_text_stream(
+    request: TextRequest,
+    user_id: str = Header(..., alias="X-User-ID"),
+):
+    """
+    Newline-delimited JSON events: ``field`` for meal_name and each macro as
+    soon as the model has produced it, then one ``result`` (the same body as
+    ``/analyze_food/text``), or ``error`` if the analysis fails mid-stream
+    """
+    if not request.text or not request.text.strip():
+        raise HTTPException(status_code=400, detail="No text description provided")
+
+    def _events() -> Iterator[bytes]:
+        profile_current_thread()
+        try:
+            for event in fa.analyze_text_stream(get_client(), request.text):
+                if event["type"] == "result":
+                    event["data"] = FoodAnalysisResponseFlat(**event["data"]).model_dump()
+                yield orjson.dumps(event) + b"\n"
+        except CircuitOpenError as exc:
+            event = {"type": "error", "detail": "Analysis temporarily unavailable", "retry_after": math.ceil(exc.retry_after)}
+            yield orjson.dumps(event) + b"\n"
+        except Exception:
+            logger.exception("Text analysis failed")
+            yield orjson.dumps({"type": "error", "detail": "Text analysis failed"}) + b"\n"
+
+    return StreamingResponse(_events(), media_type="application/x-ndjson")
+
+
+@app.post(
+    "/analyze_food/audio",
+    response_model=FoodAnalysisResponseFlat,
+    dependencies=[Depends(rate_limit("audio"))],
+)
+def analyze_food_audio(
     request: AudioRequest,
     user_id: str = Header(..., alias="X-User-ID"),
 ):
+    profile_current_thread()
     if not request.audio:
         raise HTTPException(status_code=400, detail="No audio provided")
 
-    nutrition = predict_nutrition_from_audio(request.audio, request.format)
-    return FoodAnalysisResponseFlat(**nutrition)
+    try:
+        nutrition = predict_nutrition_from_audio(request.audio, request.format)
+        return ModelJSONResponse(FoodAnalysisResponseFlat(**nutrition))
+    except CircuitOpenError as exc:
+        raise _unavailable(exc) from exc
+    except Exception as exc:
+        logger.exception("Audio analysis failed")
+        raise HTTPException(status_code=500, detail="Audio analysis failed") from exc
 
 
-@app.post("/analyze_food", response_model=fa.FoodAnalysisResponseV2)
-async def analyze_food(
+@app.post(
+    "/analyze_food",
+    response_model=fa.FoodAnalysisResponseV2,
+    dependencies=[Depends(rate_limit("image"))],
+)
+def analyze_food(
     request: ImageRequest,
     user_id: str = Header(..., alias="X-User-ID"),
 ):
-    return await analyze_food_image(request, user_id)
+    return analyze_food_image(request, user_id)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(content=metrics.render_metrics(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/admin/usage", dependencies=[Depends(require_admin)], include_in_schema=False)
+async def admin_usage(top_users: int = 50):
+    # Totals cover the worker that served this request only
+    return {**usage.AGGREGATOR.snapshot(top_users=top_users), "worker": os.getpid()}
 
 
 def parse_nutrition_json(raw_content: str) -> dict:
@@ -136,27 +389,9 @@ def parse_nutrition_json(raw_content: str) -> dict:
 
 
 def predict_nutrition_from_audio(audio_data: str, audio_format: str = "mp3") -> dict:
-    try:
-        audio_bytes = base64.b64decode(audio_data)
-        audio_file = io.BytesIO(audio_bytes)
-        audio_file.name = f"audio.{audio_format}"
-
-        transcription = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file,
-        )
-        transcribed_text = transcription.text
-        print(f"Transcribed audio: {transcribed_text}")
-        return fa.analyze_text(client, transcribed_text)
-    except Exception as exc:
-        print(f"Audio processing error: {exc}")
-        return {
-            "meal_name": "Unknown Meal",
-            "calories": 0,
-            "protein": 0,
-            "carbs": 0,
-            "fats": 0,
-        }
+    transcribed_text = fa.transcribe_audio(get_client(), audio_data, audio_format)
+    logger.debug("Transcribed audio", extra={"chars": len(transcribed_text), "sample_rate": 0.1})
+    return fa.analyze_text(get_client(), transcribed_text)
 
 
 if __name__ == "__main__":
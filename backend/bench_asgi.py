@@ -0,0 +1,201 @@
+"""Benchmark the analysis endpoints in-process against recorded OpenAI responses.
+
+Requests are driven through the ASGI app (no sockets) with ``app.client``
+swapped for a ``CassetteClient``, so the numbers reflect our own CPU time,
+allocations and throughput rather than network noise.
+
+Record once against the real API, then replay as often as needed:
+
+    python bench_asgi.py --mode record --cassettes cassettes/ --image meal.jpg
+    python bench_asgi.py --cassettes cassettes/ --image meal.jpg --requests 200 --latency none
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import statistics
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from cassette import AUTO, RECORD, REPLAY, CassetteClient
+
+DEFAULT_TEXTS = [
+    "Two scrambled eggs with a slice of buttered sourdough toast and a small orange juice",
+    "Chicken caesar salad with croutons and parmesan, about 2 cups",
+]
+BENCH_USER_ID = "bench-user"
+
+
+@dataclass
+class BenchResult:
+    endpoint: str
+    requests: int
+    concurrency: int
+    errors: int
+    wall_s: float
+    cpu_s: float
+    throughput_rps: float
+    cpu_ms_per_request: float
+    latency_ms: Dict[str, float] = field(default_factory=dict)
+    # Peak traced memory over the whole run (all concurrent requests), not per request
+    alloc_peak_kb: Optional[float] = None
+    cassette_hits: int = 0
+    cassette_misses: int = 0
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _encode_file(path: str) -> str:
+    with open(path, "rb") as payload_file:
+        return base64.b64encode(payload_file.read()).decode("ascii")
+
+
+def build_payloads(args: argparse.Namespace) -> List[Tuple[str, Dict[str, Any]]]:
+    """(path, json body) pairs cycled through by the runner"""
+    if args.endpoint == "image":
+        if not args.image:
+            raise SystemExit("--image is required for the image endpoint")
+        return [("/analyze_food/image", {"image": _encode_file(path)}) for path in args.image]
+    if args.endpoint == "audio":
+        if not args.audio:
+            raise SystemExit("--audio is required for the audio endpoint")
+        return [
+            ("/analyze_food/audio", {"audio": _encode_file(path), "format": os.path.splitext(path)[1].lstrip(".") or "mp3"})
+            for path in args.audio
+        ]
+    return [("/analyze_food/text", {"text": text}) for text in (args.text or DEFAULT_TEXTS)]
+
+
+async def _drive(app: Any, payloads: List[Tuple[str, Dict[str, Any]]], total: int, concurrency: int) -> Tuple[List[float], int]:
+    import httpx
+
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+
+        async def worker() -> None:
+            nonlocal next_index, errors
+            while next_index < total:
+                path, body = payloads[next_index % len(payloads)]
+                next_index += 1
+                start = time.perf_counter()
+                response = await http.post(path, json=body, headers={"X-User-ID": BENCH_USER_ID})
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def run_benchmark(
+    app_module: Any,
+    cassette_client: CassetteClient,
+    payloads: List[Tuple[str, Dict[str, Any]]],
+    total: int,
+    concurrency: int,
+    trace_allocations: bool = True,
+) -> BenchResult:
+    original_client = app_module.client
+    app_module.client = cassette_client
+    try:
+        # Warm-up pass so imports, schema building and first-hit caches are excluded
+        asyncio.run(_drive(app_module.app, payloads, len(payloads), 1))
+
+        if trace_allocations:
+            tracemalloc.start()
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        latencies, errors = asyncio.run(_drive(app_module.app, payloads, total, concurrency))
+        wall_s = time.perf_counter() - wall_start
+        cpu_s = time.process_time() - cpu_start
+        peak_kb = None
+        if trace_allocations:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            peak_kb = peak / 1024
+    finally:
+        app_module.client = original_client
+
+    return BenchResult(
+        endpoint=payloads[0][0],
+        requests=total,
+        concurrency=concurrency,
+        errors=errors,
+        wall_s=round(wall_s, 4),
+        cpu_s=round(cpu_s, 4),
+        throughput_rps=round(total / wall_s, 2) if wall_s else 0.0,
+        cpu_ms_per_request=round(cpu_s / total * 1000, 3) if total else 0.0,
+        latency_ms={
+            "mean": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50) * 1000, 3),
+            "p95": round(percentile(latencies, 95) * 1000, 3),
+            "p99": round(percentile(latencies, 99) * 1000, 3),
+        },
+        alloc_peak_kb=round(peak_kb, 1) if peak_kb is not None else None,
+        cassette_hits=cassette_client.hits,
+        cassette_misses=cassette_client.misses,
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark /analyze_food/* in-process with recorded OpenAI responses")
+    parser.add_argument("--cassettes", default="cassettes", help="Directory holding recorded responses")
+    parser.add_argument("--mode", choices=[REPLAY, RECORD, AUTO], default=REPLAY)
+    parser.add_argument("--endpoint", choices=["image", "text", "audio"], default="text")
+    parser.add_argument("--text", action="append", help="Text description (repeatable)")
+    parser.add_argument("--image", action="append", help="Image file (repeatable)")
+    parser.add_argument("--audio", action="append", help="Audio file (repeatable)")
+    parser.add_argument("--requests", type=int, default=50, help="Measured requests after warm-up")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument(
+        "--latency",
+        default="none",
+        help="'recorded' to replay recorded latency, 'none', or a fixed number of seconds",
+    )
+    parser.add_argument("--no-tracemalloc", action="store_true", help="Skip allocation tracing (lower overhead)")
+    parser.add_argument("--output", help="Optional path to write the result as JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+    os.environ.setdefault("OPENAI_API_KEY", "replay-only")
+
+    import app as app_module
+
+    latency: Any = args.latency if args.latency in ("recorded", "none") else float(args.latency)
+    cassette_client = CassetteClient(
+        args.cassettes,
+        mode=args.mode,
+        inner=app_module.get_client() if args.mode != REPLAY else None,
+        latency=latency,
+    )
+    result = run_benchmark(
+        app_module,
+        cassette_client,
+        build_payloads(args),
+        args.requests,
+        args.concurrency,
+        trace_allocations=not args.no_tracemalloc,
+    )
+    print(json.dumps(asdict(result), indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(asdict(result), output_file, indent=2)
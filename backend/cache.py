@@ -0,0 +1,288 @@
+"""Small thread-safe caches used by the backend services.
+
+``TTLCache`` lives in one process. When the app runs with several workers
+(see ``serve.py``), caches created through ``shared_cache()`` are backed by
+``SHARED_CACHE_URL`` instead, so every worker sees the same entries and the
+same webhook-driven invalidations:
+
+    SHARED_CACHE_URL=sqlite:///dev/shm/japer-cache.db   # one host, shared memory
+    SHARED_CACHE_URL=redis://localhost:6379/0           # Redis or a compatible server
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+try:
+    import redis as _redis
+    _REDIS_AVAILABLE = True
+except ImportError:
+    _REDIS_AVAILABLE = False
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Bounded LRU mapping with optional per-entry expiry.
+
+    Entries are evicted least-recently-used first once ``maxsize`` is reached,
+    and lazily dropped on read once their TTL has passed. ``ttl=None`` keeps
+    entries until they are evicted or deleted.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: Optional[float] = None) -> None:
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class SQLiteFile:
+    """Per-thread (and per-process, so forked workers reconnect) connections to one SQLite file"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Cache contents are disposable; skip fsync (the file normally lives in tmpfs anyway)
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+class SQLiteCache:
+    """TTL cache stored in a SQLite file shared by every worker on the host.
+
+    Values are stored as JSON, so only JSON-serializable values round-trip.
+    Expiry uses wall-clock time (monotonic clocks differ between processes).
+    Once a namespace grows past ``maxsize``, the oldest writes are trimmed
+    rather than the least recently read, which keeps reads free of writes.
+    """
+
+    _TRIM_EVERY = 256
+
+    def __init__(self, path: str, namespace: str, maxsize: int = 10_000, ttl: Optional[float] = None) -> None:
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._db = SQLiteFile(path)
+        self._writes = 0
+        self._schema_ready = False
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = self._db.connection()
+        if not self._schema_ready:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " expires_at REAL, stored_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+            )
+            self._schema_ready = True
+        return conn
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+            (self.namespace, str(key)),
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return default
+        return json.loads(row[0])
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at, stored_at) VALUES (?, ?, ?, ?, ?)",
+            (self.namespace, str(key), json.dumps(value), now + ttl if ttl is not None else None, now),
+        )
+        self._writes += 1
+        if self._writes % self._TRIM_EVERY == 0:
+            self._trim(conn, now)
+
+    def _trim(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM cache WHERE namespace = ? AND expires_at <= ?", (self.namespace, now))
+        conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND key IN ("
+            " SELECT key FROM cache WHERE namespace = ? ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.maxsize),
+        )
+
+    def delete(self, key: Hashable) -> None:
+        self._conn().execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, str(key)))
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM cache WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (self.namespace, time.time()),
+        ).fetchone()[0]
+
+
+class RedisCache:
+    """TTL cache in Redis (or a compatible server); size is bounded by the server's maxmemory policy"""
+
+    def __init__(self, url: str, namespace: str, ttl: Optional[float] = None) -> None:
+        if not _REDIS_AVAILABLE:
+            raise RuntimeError("redis package is required for a redis:// SHARED_CACHE_URL")
+        self._client = _redis.Redis.from_url(url)
+        self._prefix = f"cache:{namespace}:"
+        self.ttl = ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        raw = self._client.get(self._prefix + str(key))
+        return default if raw is None else json.loads(raw)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        self._client.set(
+            self._prefix + str(key),
+            json.dumps(value),
+            px=max(1, int(ttl * 1000)) if ttl is not None else None,
+        )
+
+    def delete(self, key: Hashable) -> None:
+        self._client.delete(self._prefix + str(key))
+
+    def clear(self) -> None:
+        keys = list(self._client.scan_iter(match=self._prefix + "*"))
+        if keys:
+            self._client.delete(*keys)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return bool(self._client.exists(self._prefix + str(key)))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._client.scan_iter(match=self._prefix + "*"))
+
+
+def shared_cache_path(url: str) -> Optional[str]:
+    """File path of a ``sqlite://`` cache URL, else None"""
+    if url.startswith("sqlite://"):
+        return url[len("sqlite://"):]
+    return None
+
+
+def shared_cache(namespace: str, maxsize: int = 10_000, ttl: Optional[float] = None) -> Any:
+    """
+    Cache shared by all workers when SHARED_CACHE_URL is set, else an in-process TTLCache
+
+    Values must be JSON-serializable when a shared backend is configured.
+    """
+    url = os.getenv("SHARED_CACHE_URL", "")
+    if not url:
+        return TTLCache(maxsize=maxsize, ttl=ttl)
+    path = shared_cache_path(url)
+    if path:
+        return SQLiteCache(path, namespace, maxsize=maxsize, ttl=ttl)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCache(url, namespace, ttl=ttl)
+    raise ValueError(f"Unsupported SHARED_CACHE_URL: {url}")
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one execution.
+
+    The first caller for a key runs ``fn``; callers that arrive while it is
+    running block and receive the same result (or exception).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
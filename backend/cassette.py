@@ -0,0 +1,217 @@
+"""Record/replay layer for the OpenAI client used by ``food_analysis``.
+
+``CassetteClient`` exposes the two client calls the backend makes
+(``chat.completions.create`` and ``audio.transcriptions.create``). In record
+mode it forwards to a real client and stores each response on disk; in
+replay mode it serves stored responses, optionally sleeping for the recorded
+(or a synthetic) latency, so benchmarks can run without the network.
+
+Completions are keyed by the request messages and the response schema name;
+transcriptions by the audio bytes.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Union
+
+RECORD = "record"
+REPLAY = "replay"
+AUTO = "auto"  # replay when present, record otherwise
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode when no recording exists for a request"""
+
+
+def _hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _stable_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Messages with inline image payloads replaced by their hash, for compact keys"""
+    stable: List[Dict[str, Any]] = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            parts = []
+            for part in content:
+                if isinstance(part, dict) and part.get("type") == "image_url":
+                    url = part.get("image_url", {}).get("url", "")
+                    part = {"type": "image_url", "image_url": {"sha256": _hash_bytes(url.encode())}}
+                parts.append(part)
+            content = parts
+        stable.append({**message, "content": content})
+    return stable
+
+
+def completion_key(messages: List[Dict[str, Any]], response_format: Optional[Dict[str, Any]]) -> str:
+    schema_name = ((response_format or {}).get("json_schema") or {}).get("name", "")
+    blob = json.dumps(
+        {"schema": schema_name, "messages": _stable_messages(messages)},
+        sort_keys=True,
+        ensure_ascii=True,
+    )
+    return f"{schema_name or 'completion'}-{_hash_bytes(blob.encode())[:32]}"
+
+
+def _completion_to_dict(response: Any) -> Dict[str, Any]:
+    message = response.choices[0].message
+    usage = getattr(response, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None) if usage is not None else None
+    return {
+        "model": getattr(response, "model", None),
+        "content": getattr(message, "content", "") or "",
+        "usage": {
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+            "cached_tokens": (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0,
+        }
+        if usage is not None
+        else None,
+    }
+
+
+def _completion_from_dict(data: Dict[str, Any]) -> SimpleNamespace:
+    usage = data.get("usage")
+    return SimpleNamespace(
+        model=data.get("model"),
+        choices=[SimpleNamespace(message=SimpleNamespace(content=data.get("content", "")))],
+        usage=SimpleNamespace(
+            prompt_tokens=usage["prompt_tokens"],
+            completion_tokens=usage["completion_tokens"],
+            prompt_tokens_details=SimpleNamespace(cached_tokens=usage.get("cached_tokens", 0)),
+        )
+        if usage
+        else None,
+    )
+
+
+class Cassette:
+    """Directory of recorded responses, one JSON file per request key"""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._memory: Dict[str, Dict[str, Any]] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key in self._memory:
+                return self._memory[key]
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as cassette_file:
+            entry = json.load(cassette_file)
+        with self._lock:
+            self._memory[key] = entry
+        return entry
+
+    def save(self, key: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._memory[key] = entry
+        tmp_path = self._path(key) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as cassette_file:
+            json.dump(entry, cassette_file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self._path(key))
+
+
+LatencyMode = Union[str, float]
+
+
+class CassetteClient:
+    """
+    Drop-in stand-in for ``openai.OpenAI`` backed by a cassette directory
+
+    Args:
+        directory: Where recordings live
+        mode: ``record``, ``replay`` or ``auto``
+        inner: Real client used when recording
+        latency: ``recorded`` to sleep the recorded duration, ``none`` for no
+            delay, or a number of seconds to sleep for every call
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        mode: str = REPLAY,
+        inner: Optional[Any] = None,
+        latency: LatencyMode = "recorded",
+    ) -> None:
+        if mode not in (RECORD, REPLAY, AUTO):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        if mode != REPLAY and inner is None:
+            raise ValueError("Recording requires a real client")
+        self.cassette = Cassette(directory)
+        self.mode = mode
+        self.inner = inner
+        self.latency = latency
+        self.hits = 0
+        self.misses = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self._create_transcription))
+
+    def _sleep(self, recorded_s: float) -> None:
+        if self.latency == "none":
+            return
+        delay = recorded_s if self.latency == "recorded" else float(self.latency)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _replay_or_record(self, key: str, call: Any, to_dict: Any) -> Dict[str, Any]:
+        entry = self.cassette.load(key) if self.mode != RECORD else None
+        if entry is not None:
+            self.hits += 1
+            self._sleep(entry.get("latency_s", 0.0))
+            return entry["response"]
+
+        if self.mode == REPLAY:
+            self.misses += 1
+            raise CassetteMiss(f"No recording for {key} in {self.cassette.directory}")
+
+        start = time.perf_counter()
+        response = call()
+        entry = {
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "latency_s": round(time.perf_counter() - start, 4),
+            "response": to_dict(response),
+        }
+        self.cassette.save(key, entry)
+        return entry["response"]
+
+    def _create_completion(self, **kwargs: Any) -> Any:
+        key = completion_key(kwargs.get("messages", []), kwargs.get("response_format"))
+        data = self._replay_or_record(
+            key,
+            lambda: self.inner.chat.completions.create(**kwargs),
+            _completion_to_dict,
+        )
+        return _completion_from_dict(data)
+
+    def _create_transcription(self, **kwargs: Any) -> Any:
+        audio_file = kwargs["file"]
+        audio_bytes = audio_file.getvalue() if hasattr(audio_file, "getvalue") else audio_file.read()
+        key = f"transcription-{_hash_bytes(audio_bytes)[:32]}"
+
+        def _call() -> Any:
+            if hasattr(audio_file, "seek"):
+                audio_file.seek(0)
+            return self.inner.audio.transcriptions.create(**kwargs)
+
+        data = self._replay_or_record(
+            key,
+            _call,
+            lambda r: {"text": getattr(r, "text", ""), "duration": getattr(r, "duration", None)},
+        )
+        return SimpleNamespace(**data)
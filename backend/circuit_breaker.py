@@ -0,0 +1,232 @@
+"""Per-model circuit breakers for upstream OpenAI calls.
+
+Each model gets a breaker that watches a rolling window of its calls. A call
+counts as bad when it fails with an upstream error (connection, timeout, 429
+or 5xx) or takes longer than ``CIRCUIT_SLOW_CALL_SECONDS``. Once at least
+``CIRCUIT_MIN_CALLS`` calls are in the window and the bad share reaches
+``CIRCUIT_FAILURE_RATE``, the breaker opens and calls to that model are
+rejected without waiting on the network. After ``CIRCUIT_OPEN_SECONDS`` one
+probe call is let through (half-open): success closes the breaker, failure
+opens it again.
+
+``call_with_fallback`` walks a model chain (primary first, then the
+configured fallbacks), skipping models whose breaker is open, and raises
+``CircuitOpenError`` when every model is unavailable. Breaker state lives in
+each worker process and is exported as ``openai_circuit_state``.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from metrics import CIRCUIT_REJECTIONS, CIRCUIT_STATE
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+# Gauge values for openai_circuit_state
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(RuntimeError):
+    """Every model that could serve the call has an open breaker"""
+
+    def __init__(self, models: Sequence[str], retry_after: float) -> None:
+        super().__init__(f"Circuit open for {', '.join(models)}")
+        self.models = list(models)
+        self.retry_after = retry_after
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """
+    Whether an exception means the model endpoint is unhealthy
+
+    Connection errors, timeouts, rate limits and 5xx responses count; a 4xx
+    (our request was wrong) or any other SDK error, such as a truncated or
+    content-filtered completion, does not. openai is imported lazily, so its
+    exception classes are matched by name.
+    """
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    if not type(exc).__module__.startswith("openai"):
+        return False
+    names = {cls.__name__ for cls in type(exc).__mro__}
+    if names & {"APIConnectionError", "APITimeoutError"}:
+        return True
+    if "APIStatusError" in names:
+        status = getattr(exc, "status_code", None)
+        return status is not None and (status == 429 or status >= 500)
+    return False
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, "") or default)
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker over a rolling window of call outcomes"""
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        failure_rate: float = 0.5,
+        min_calls: int = 10,
+        window_seconds: float = 60.0,
+        open_seconds: float = 30.0,
+        slow_call_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._outcomes: Deque[Tuple[float, bool]] = deque()  # (time, bad)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        CIRCUIT_STATE.set(STATE_VALUES[CLOSED], model=name)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def retry_after(self) -> float:
+        """Seconds until the next probe is allowed (0 unless open)"""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.open_seconds - self._clock())
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; a True in half-open reserves the probe"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if self._clock() < self._opened_at + self.open_seconds:
+                    return False
+                self._transition(HALF_OPEN)
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def release_probe(self) -> None:
+        """Free a reserved half-open probe whose call ended without an outcome"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record(self, elapsed: float, failed: bool = False) -> None:
+        bad = failed or elapsed > self.slow_call_seconds
+        with self._lock:
+            now = self._clock()
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+                self._outcomes.clear()
+                self._transition(OPEN if bad else CLOSED, now)
+                return
+            self._outcomes.append((now, bad))
+            while self._outcomes and self._outcomes[0][0] <= now - self.window_seconds:
+                self._outcomes.popleft()
+            if self._state == CLOSED and len(self._outcomes) >= self.min_calls:
+                bad_calls = sum(1 for _, outcome_bad in self._outcomes if outcome_bad)
+                if bad_calls / len(self._outcomes) >= self.failure_rate:
+                    self._outcomes.clear()
+                    self._transition(OPEN, now)
+
+    def _transition(self, state: str, now: Optional[float] = None) -> None:
+        if state == OPEN:
+            self._opened_at = self._clock() if now is None else now
+        if state != self._state:
+            logger.warning("Circuit breaker state changed", extra={"model": self.name, "from": self._state, "to": state})
+        self._state = state
+        CIRCUIT_STATE.set(STATE_VALUES[state], model=self.name)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(model: str) -> CircuitBreaker:
+    """Process-wide breaker for a model, configured from the CIRCUIT_* environment on first use"""
+    with _breakers_lock:
+        breaker = _breakers.get(model)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                model,
+                failure_rate=_env_float("CIRCUIT_FAILURE_RATE", 0.5),
+                min_calls=int(_env_float("CIRCUIT_MIN_CALLS", 10)),
+                window_seconds=_env_float("CIRCUIT_WINDOW_SECONDS", 60.0),
+                open_seconds=_env_float("CIRCUIT_OPEN_SECONDS", 30.0),
+                slow_call_seconds=_env_float("CIRCUIT_SLOW_CALL_SECONDS", 30.0),
+            )
+            _breakers[model] = breaker
+        return breaker
+
+
+def reset_breakers() -> None:
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def fallback_models(env_name: str) -> List[str]:
+    """Comma-separated fallback chain from the environment"""
+    return [name.strip() for name in os.getenv(env_name, "").split(",") if name.strip()]
+
+
+def model_chain(primary: str, fallbacks: Sequence[str]) -> List[str]:
+    return [primary] + [model for model in fallbacks if model != primary]
+
+
+def call_with_fallback(models: Sequence[str], call: Callable[[str], T]) -> T:
+    """
+    Run ``call(model)`` on the first model in ``models`` whose breaker admits it
+
+    An upstream failure is recorded and the next model is tried; any other
+    exception is raised as-is (the endpoint answered, so it is healthy).
+    """
+    last_error: Optional[BaseException] = None
+    for model in models:
+        breaker = get_breaker(model)
+        if not breaker.allow():
+            CIRCUIT_REJECTIONS.inc(model=model)
+            continue
+        start = time.perf_counter()
+        failed: Optional[bool] = None  # stays None when the call is interrupted (e.g. cancelled)
+        try:
+            result = call(model)
+            failed = False
+        except Exception as exc:
+            failed = is_upstream_failure(exc)
+            if not failed:
+                raise
+            logger.warning("Model call failed", extra={"model": model, "exception": type(exc).__name__})
+            last_error = exc
+            continue
+        finally:
+            if failed is None:
+                breaker.release_probe()
+            else:
+                breaker.record(time.perf_counter() - start, failed=failed)
+        if model != models[0]:
+            logger.info("Served by fallback model", extra={"model": model, "primary": models[0]})
+        return result
+
+    if last_error is not None:
+        raise last_error
+    raise CircuitOpenError(models, min(get_breaker(model).retry_after() for model in models))
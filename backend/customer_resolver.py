@@ -0,0 +1,64 @@
+"""Cached, single-flight Supabase user -> Stripe customer resolution."""
+
+from __future__ import annotations
+
+from typing import Callable, Optional
+
+from cache import SingleFlight, shared_cache
+
+# Customer ids never change for a user once assigned; the TTL only limits
+# how long a deleted customer can linger on other instances.
+CUSTOMER_CACHE_TTL_SECONDS = 6 * 60 * 60
+CUSTOMER_CACHE_MAX_ENTRIES = 50_000
+
+CustomerLoader = Callable[[str, bool], Optional[str]]
+
+
+class CustomerResolver:
+    """
+    Resolve a user's Stripe customer id, sharing in-flight work per user
+
+    Concurrent calls for one user share a single lookup (or creation), and
+    resolved ids are served from memory afterwards.
+    """
+
+    def __init__(self, loader: CustomerLoader, ttl: Optional[float] = CUSTOMER_CACHE_TTL_SECONDS) -> None:
+        self._loader = loader
+        self._cache = shared_cache('stripe_customer', maxsize=CUSTOMER_CACHE_MAX_ENTRIES, ttl=ttl)
+        self._flight = SingleFlight()
+
+    def resolve(self, user_id: str, create: bool = False) -> Optional[str]:
+        """
+        Return the Stripe customer id for a user
+
+        Args:
+            user_id: Supabase user ID
+            create: Create a Stripe customer if the user has none yet
+
+        Returns:
+            Stripe customer ID, or None when missing and create is False
+        """
+        customer_id = self._cache.get(user_id)
+        if customer_id:
+            return customer_id
+
+        customer_id = self._flight.do(user_id, lambda: self._load(user_id, create))
+        if customer_id is None and create:
+            # Joined a lookup-only flight that found nothing; run our own creation
+            customer_id = self._flight.do(user_id, lambda: self._load(user_id, True))
+        return customer_id
+
+    def remember(self, user_id: str, customer_id: str) -> None:
+        self._cache.set(user_id, customer_id)
+
+    def forget(self, user_id: str) -> None:
+        self._cache.delete(user_id)
+
+    def _load(self, user_id: str, create: bool) -> Optional[str]:
+        customer_id = self._cache.get(user_id)
+        if customer_id:
+            return customer_id
+        customer_id = self._loader(user_id, create)
+        if customer_id:
+            self._cache.set(user_id, customer_id)
+        return customer_id
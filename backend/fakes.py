@@ -0,0 +1,132 @@
+"""In-memory test doubles for the Stripe API and the Supabase client."""
+
+from __future__ import annotations
+
+import copy
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+import stripe
+
+
+class FakeStripeAPI:
+    """Stand-in for ``subscription_mirror.StripeAPI`` that records every call"""
+
+    def __init__(
+        self,
+        subscriptions: Optional[Dict[str, Dict[str, Any]]] = None,
+        customers: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> None:
+        self.subscriptions = dict(subscriptions or {})
+        self.customers = dict(customers or {})
+        self.calls: List[Tuple[str, str]] = []
+
+    def retrieve_subscription(self, subscription_id: str) -> Dict[str, Any]:
+        self.calls.append(('subscription', subscription_id))
+        if subscription_id not in self.subscriptions:
+            raise stripe.error.InvalidRequestError(
+                f"No such subscription: '{subscription_id}'", 'id'
+            )
+        return copy.deepcopy(self.subscriptions[subscription_id])
+
+    def retrieve_customer(self, customer_id: str) -> Dict[str, Any]:
+        self.calls.append(('customer', customer_id))
+        if customer_id not in self.customers:
+            raise stripe.error.InvalidRequestError(
+                f"No such customer: '{customer_id}'", 'id'
+            )
+        return copy.deepcopy(self.customers[customer_id])
+
+
+class _FakeQuery:
+    def __init__(self, table: "_FakeTable") -> None:
+        self._table = table
+        self._filters: List[Any] = []
+        self._update: Optional[Dict[str, Any]] = None
+        self._columns: Optional[List[str]] = None
+        self._range: Optional[Tuple[int, int]] = None
+        self._order: Optional[str] = None
+        self._insert: Optional[List[Dict[str, Any]]] = None
+        self._upsert: Optional[Tuple[List[Dict[str, Any]], str]] = None
+
+    def select(self, columns: str = '*') -> "_FakeQuery":
+        if columns.strip() != '*':
+            self._columns = [c.strip() for c in columns.split(',')]
+        return self
+
+    def update(self, data: Dict[str, Any]) -> "_FakeQuery":
+        self._update = dict(data)
+        return self
+
+    def insert(self, rows: Any) -> "_FakeQuery":
+        self._insert = [dict(r) for r in (rows if isinstance(rows, list) else [rows])]
+        return self
+
+    def upsert(self, rows: Any, on_conflict: str = '') -> "_FakeQuery":
+        self._upsert = ([dict(r) for r in (rows if isinstance(rows, list) else [rows])], on_conflict or 'id')
+        return self
+
+    def eq(self, column: str, value: Any) -> "_FakeQuery":
+        self._filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column: str, values: List[Any]) -> "_FakeQuery":
+        allowed = set(values)
+        self._filters.append(lambda row: row.get(column) in allowed)
+        return self
+
+    def order(self, column: str) -> "_FakeQuery":
+        self._order = column
+        return self
+
+    def range(self, start: int, end: int) -> "_FakeQuery":
+        self._range = (start, end)
+        return self
+
+    def execute(self) -> SimpleNamespace:
+        if self._insert is not None:
+            self._table.rows.extend(self._insert)
+            return SimpleNamespace(data=[dict(r) for r in self._insert])
+        if self._upsert is not None:
+            rows, key = self._upsert
+            self._table.upserts.append(copy.deepcopy(rows))
+            existing = {row.get(key): row for row in self._table.rows}
+            for row in rows:
+                if row[key] in existing:
+                    existing[row[key]].update(row)
+                else:
+                    self._table.rows.append(dict(row))
+            return SimpleNamespace(data=[dict(r) for r in rows])
+        matched = [row for row in self._table.rows if all(f(row) for f in self._filters)]
+        if self._order is not None:
+            matched.sort(key=lambda row: row.get(self._order))
+        if self._range is not None:
+            matched = matched[self._range[0] : self._range[1] + 1]
+        if self._update is not None:
+            self._table.updates.append(copy.deepcopy(self._update))
+            for row in matched:
+                row.update(self._update)
+        data = [
+            {c: row.get(c) for c in self._columns} if self._columns else dict(row)
+            for row in matched
+        ]
+        return SimpleNamespace(data=data)
+
+
+class _FakeTable:
+    def __init__(self) -> None:
+        self.rows: List[Dict[str, Any]] = []
+        self.updates: List[Dict[str, Any]] = []
+        self.upserts: List[List[Dict[str, Any]]] = []
+
+
+class FakeSupabase:
+    """Just enough of the supabase-py query builder for the backend services"""
+
+    def __init__(self, tables: Optional[Dict[str, List[Dict[str, Any]]]] = None) -> None:
+        self.tables: Dict[str, _FakeTable] = {}
+        for name, rows in (tables or {}).items():
+            self.tables.setdefault(name, _FakeTable()).rows.extend(dict(r) for r in rows)
+
+    def table(self, name: str) -> _FakeQuery:
+        return _FakeQuery(self.tables.setdefault(name, _FakeTable()))
@@ -5,21 +5,39 @@ import io
 import json
 import os
 import re
-from typing import Any, Dict, Iterable, List, Literal, Optional, Type, TypeVar
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Literal, Optional, Sequence, Tuple, Type, TypeVar
 
 from pydantic import BaseModel, Field
 
-try:
-    from PIL import Image as _PILImage
-    _PILLOW_AVAILABLE = True
-except ImportError:
-    _PILLOW_AVAILABLE = False
+from circuit_breaker import call_with_fallback, fallback_models, model_chain
+from json_stream import IncrementalJSONObjectParser
+from metrics import STAGE_SECONDS, stage_timer
+from usage import record_completion_usage, record_transcription_usage
+
+
+@lru_cache(maxsize=None)
+def _pil_image() -> Any:
+    """PIL.Image, imported on the first image request (None if Pillow is missing)"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
 
 IMAGE_MODEL_ENV = "OPENAI_FOOD_IMAGE_MODEL"
 TEXT_MODEL_ENV = "OPENAI_FOOD_TEXT_MODEL"
+# Comma-separated models tried in order when the primary's circuit breaker is open
+IMAGE_FALLBACK_MODELS_ENV = "OPENAI_FOOD_IMAGE_FALLBACK_MODELS"
+TEXT_FALLBACK_MODELS_ENV = "OPENAI_FOOD_TEXT_FALLBACK_MODELS"
 DEFAULT_IMAGE_MODEL = "gpt-5-mini"
 DEFAULT_TEXT_MODEL = "gpt-5-nano"
+TRANSCRIPTION_MODEL = "whisper-1"
 MAX_ITEMS = 6
+MAX_MEAL_IMAGES = 4
 _MAX_IMAGE_PX = 1024
 
 
@@ -28,17 +46,27 @@ def resize_for_api(image_b64: str, max_px: int = _MAX_IMAGE_PX) -> str:
     Returns a (possibly re-encoded) base64 JPEG string.
     Falls back to the original if Pillow is unavailable.
     """
-    if not _PILLOW_AVAILABLE:
+    pil_image = _pil_image()
+    if pil_image is None:
         return image_b64
     raw = base64.b64decode(image_b64)
-    img = _PILImage.open(io.BytesIO(raw))
+    img = pil_image.open(io.BytesIO(raw))
     if max(img.size) <= max_px:
         return image_b64
-    img.thumbnail((max_px, max_px), _PILImage.LANCZOS)
+    img.thumbnail((max_px, max_px), pil_image.LANCZOS)
     buf = io.BytesIO()
     img.save(buf, format="JPEG", quality=85)
     return base64.b64encode(buf.getvalue()).decode("utf-8")
 
+
+def resize_all_for_api(images: Sequence[str], max_px: int = _MAX_IMAGE_PX) -> List[str]:
+    """``resize_for_api`` over several images in parallel (Pillow releases the GIL while decoding and resampling)"""
+    if len(images) <= 1:
+        return [resize_for_api(image, max_px) for image in images]
+    with ThreadPoolExecutor(max_workers=len(images)) as pool:
+        return list(pool.map(lambda image: resize_for_api(image, max_px), images))
+
+
 ModelT = TypeVar("ModelT", bound=BaseModel)
 
 
@@ -67,6 +95,8 @@ class FoodAnalysisResponseV2(BaseModel):
     assumptions: List[str] = Field(default_factory=list)
     flags: List[str] = Field(default_factory=list)
     items: List[FoodAnalysisItem] = Field(default_factory=list)
+    # Set on needs_clarification responses; send it back with context_text to refine
+    session_id: Optional[str] = None
 
 
 class LegacyNutritionResponse(BaseModel):
@@ -98,6 +128,14 @@ class ImageNutritionSynthesisResponse(BaseModel):
     items: List[FoodAnalysisItem] = Field(default_factory=list)
 
 
+class ImageFusedAnalysisResponse(ImageNutritionSynthesisResponse):
+    visible_items: List[str] = Field(default_factory=list)
+    portion_cues: List[str] = Field(default_factory=list)
+    hidden_calorie_risks: List[str] = Field(default_factory=list)
+    needs_clarification: bool = False
+    clarifying_question: Optional[str] = None
+
+
 def _model_schema(model_type: Type[ModelT]) -> Dict[str, Any]:
     if hasattr(model_type, "model_json_schema"):
         return model_type.model_json_schema()
@@ -116,6 +154,13 @@ def _model_dump(model: BaseModel) -> Dict[str, Any]:
     return model.dict()
 
 
+def _model_construct(model_type: Type[ModelT], **values: Any) -> ModelT:
+    """Build a model from values that are already coerced to the field types, skipping validation"""
+    if hasattr(model_type, "model_construct"):
+        return model_type.model_construct(**values)
+    return model_type.construct(**values)
+
+
 def get_image_model() -> str:
     return os.getenv(IMAGE_MODEL_ENV, DEFAULT_IMAGE_MODEL)
 
@@ -124,6 +169,19 @@ def get_text_model() -> str:
     return os.getenv(TEXT_MODEL_ENV, DEFAULT_TEXT_MODEL)
 
 
+def image_model_chain(model: Optional[str] = None) -> List[str]:
+    """An explicitly requested model alone, else the configured image model and its fallbacks"""
+    if model:
+        return [model]
+    return model_chain(get_image_model(), fallback_models(IMAGE_FALLBACK_MODELS_ENV))
+
+
+def text_model_chain(model: Optional[str] = None) -> List[str]:
+    if model:
+        return [model]
+    return model_chain(get_text_model(), fallback_models(TEXT_FALLBACK_MODELS_ENV))
+
+
 def confidence_label_for(value: float) -> Literal["low", "medium", "high"]:
     if value < 0.45:
         return "low"
@@ -176,7 +234,8 @@ def _normalize_items(items: Any) -> List[FoodAnalysisItem]:
         if not isinstance(item, dict):
             continue
         normalized_items.append(
-            FoodAnalysisItem(
+            _model_construct(
+                FoodAnalysisItem,
                 name=str(item.get("name", "Unknown item")).strip() or "Unknown item",
                 portion_text=str(item.get("portion_text", "")).strip(),
                 calories=_coerce_int(item.get("calories", 0)),
@@ -266,7 +325,9 @@ def _make_schema_strict(schema: Dict[str, Any]) -> Dict[str, Any]:
     return schema
 
 
+@lru_cache(maxsize=None)
 def _build_response_format(model_type: Type[BaseModel], schema_name: str) -> Dict[str, Any]:
+    """Strict response_format for a model, built once per process and shared (do not mutate)"""
     return {
         "type": "json_schema",
         "json_schema": {
@@ -277,130 +338,166 @@ def _build_response_format(model_type: Type[BaseModel], schema_name: str) -> Dic
     }
 
 
+def _image_url_part(url: str) -> Dict[str, Any]:
+    return {
+        "type": "image_url",
+        "image_url": {
+            "url": url,
+        },
+    }
+
+
 def _image_content_part(image_data: Optional[str], image_url: Optional[str]) -> Dict[str, Any]:
     if image_data:
-        return {
-            "type": "image_url",
-            "image_url": {
-                "url": f"data:image/jpeg;base64,{image_data}",
-            },
-        }
+        return _image_url_part(f"data:image/jpeg;base64,{image_data}")
     if image_url:
-        return {
-            "type": "image_url",
-            "image_url": {
-                "url": image_url,
-            },
-        }
+        return _image_url_part(image_url)
     raise ValueError("Either image_data or image_url must be provided")
 
 
-def build_image_understanding_messages(
+# Prompt layout: everything that does not vary per request (system prompt with
+# the rules for every image stage) comes first and is byte-identical across
+# calls, so OpenAI's prefix prompt cache can serve it. The image follows, so a
+# stage 2 call can reuse the prefix stage 1 just sent for the same photo; the
+# short per-request text (task, user clarification, stage 1 findings) is last.
+IMAGE_SYSTEM_PROMPT = "\n".join(
+    [
+        "You are a nutrition-image analyst in a calorie estimation pipeline.",
+        "Each request names its task: stage 1 (image understanding), stage 2 (nutrition synthesis), or a single pass doing both.",
+        "",
+        "Stage 1 - image understanding:",
+        "- Identify visible food items, portion cues, and hidden-calorie risks.",
+        "- Decide if exactly one clarification question would materially improve the estimate.",
+        "- Ask one clarification question only if the answer could plausibly change total calories by more than 15% or any macro by more than 20%.",
+        "- Allowed question categories: cooking oil or butter, sauce or dressing amount, beverage type, rice/pasta/bread amount, ingredient identity with materially different macros.",
+        "- Do not ask multipart questions.",
+        "- Do not ask generic tell-me-more questions.",
+        "- If user clarification is already present, set needs_clarification to false and clarifying_question to null.",
+        "",
+        "Stage 2 - nutrition synthesis:",
+        "- Build on the stage 1 findings given with the request.",
+        "- Produce top-level meal totals, an itemized breakdown, assumptions, flags, and confidence.",
+        "- If user clarification is present, trust it for hidden ingredients, cooking method, and sauces.",
+        "- Trust the image more than user text for visible relative portion size.",
+        "- Record explicit assumptions instead of silent guesses.",
+        "- Treat beverages as separate items if visible.",
+        "- Do not fabricate brand-specific precision unless the image or user text makes it obvious.",
+        "- Estimate portions conservatively.",
+        "",
+        "Single pass: apply the stage 1 rules, then the stage 2 rules, and return the fields of both.",
+        "",
+        "Return valid JSON only.",
+    ]
+)
+
+TEXT_SYSTEM_PROMPT = (
+    "You are a nutrition expert. Analyze text descriptions of food and "
+    "ingredients to estimate calories and macronutrients. Estimate the total "
+    "nutritional content of the food description in the user message and give "
+    "it a descriptive meal name. Return only JSON."
+)
+
+_STAGE1_HANDOFF_FIELDS = ("meal_name", "visible_items", "portion_cues", "hidden_calorie_risks")
+
+
+def _clarification_state(context_text: Optional[str], pending: str) -> str:
+    if context_text and context_text.strip():
+        return f"User clarification for this same image: {context_text.strip()}"
+    return pending
+
+
+def _compact_stage1(stage1: ImageUnderstandingResponse) -> str:
+    """Stage 1 findings stage 2 needs, as minified JSON without empty fields"""
+    findings = _model_dump(stage1)
+    return json.dumps(
+        {key: findings[key] for key in _STAGE1_HANDOFF_FIELDS if findings.get(key)},
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+
+
+def _image_messages(
     image_data: Optional[str],
     image_url: Optional[str],
-    context_text: Optional[str] = None,
+    request_lines: List[str],
+    extra_image_urls: Sequence[str] = (),
 ) -> List[Dict[str, Any]]:
-    clarification_state = (
-        f"User clarification for this same image: {context_text.strip()}"
-        if context_text and context_text.strip()
-        else "No user clarification is available yet."
-    )
-    prompt = "\n".join(
-        [
-            "Analyze this food image in stage 1.",
-            clarification_state,
-            "Identify visible food items, portion cues, and hidden-calorie risks.",
-            "Decide if exactly one clarification question would materially improve the estimate.",
-            "Ask one clarification question only if the answer could plausibly change total calories by more than 15% or any macro by more than 20%.",
-            "Allowed question categories: cooking oil or butter, sauce or dressing amount, beverage type, rice/pasta/bread amount, ingredient identity with materially different macros.",
-            "Do not ask multipart questions.",
-            "Do not ask generic tell-me-more questions.",
-            "If user clarification is already present, set needs_clarification to false and clarifying_question to null.",
-            "Return valid JSON only.",
-        ]
-    )
-
+    if extra_image_urls:
+        views = (
+            f"The {1 + len(extra_image_urls)} photos show the same meal from different angles:"
+            " count each item once and use the other angles to judge portions."
+        )
+        request_lines = [request_lines[0], views, *request_lines[1:]]
     return [
-        {
-            "role": "system",
-            "content": (
-                "You are a nutrition-image analyst performing the image-understanding "
-                "stage of a calorie estimation pipeline."
-            ),
-        },
+        {"role": "system", "content": IMAGE_SYSTEM_PROMPT},
         {
             "role": "user",
             "content": [
-                {"type": "text", "text": prompt},
                 _image_content_part(image_data, image_url),
+                *(_image_url_part(url) for url in extra_image_urls),
+                {"type": "text", "text": "\n".join(request_lines)},
             ],
         },
     ]
 
 
+def build_image_understanding_messages(
+    image_data: Optional[str],
+    image_url: Optional[str],
+    context_text: Optional[str] = None,
+    extra_image_urls: Sequence[str] = (),
+) -> List[Dict[str, Any]]:
+    return _image_messages(
+        image_data,
+        image_url,
+        [
+            "Task: stage 1 image understanding.",
+            _clarification_state(context_text, "No user clarification is available yet."),
+        ],
+        extra_image_urls,
+    )
+
+
 def build_image_synthesis_messages(
     image_data: Optional[str],
     image_url: Optional[str],
     stage1: ImageUnderstandingResponse,
     context_text: Optional[str] = None,
+    extra_image_urls: Sequence[str] = (),
 ) -> List[Dict[str, Any]]:
-    stage1_json = json.dumps(_model_dump(stage1), ensure_ascii=True)
-    clarification_state = (
-        f"User clarification for this same image: {context_text.strip()}"
-        if context_text and context_text.strip()
-        else "No user clarification is available."
-    )
-    prompt = "\n".join(
+    return _image_messages(
+        image_data,
+        image_url,
         [
-            "Analyze this food image in stage 2 and synthesize nutrition totals.",
-            clarification_state,
-            f"Stage 1 findings: {stage1_json}",
-            "Produce top-level meal totals, an itemized breakdown, assumptions, flags, and confidence.",
-            "If user clarification is present, trust it for hidden ingredients, cooking method, and sauces.",
-            "Trust the image more than user text for visible relative portion size.",
-            "Record explicit assumptions instead of silent guesses.",
-            "Treat beverages as separate items if visible.",
-            "Do not fabricate brand-specific precision unless the image or user text makes it obvious.",
-            "Estimate portions conservatively.",
-            "Return valid JSON only.",
-        ]
+            "Task: stage 2 nutrition synthesis.",
+            _clarification_state(context_text, "No user clarification is available."),
+            f"Stage 1 findings: {_compact_stage1(stage1)}",
+        ],
+        extra_image_urls,
     )
 
-    return [
-        {
-            "role": "system",
-            "content": (
-                "You are a nutrition-image analyst performing the nutrition-synthesis "
-                "stage of a calorie estimation pipeline."
-            ),
-        },
-        {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": prompt},
-                _image_content_part(image_data, image_url),
-            ],
-        },
-    ]
+
+def build_image_fused_messages(
+    image_data: Optional[str],
+    image_url: Optional[str],
+    context_text: Optional[str] = None,
+    extra_image_urls: Sequence[str] = (),
+) -> List[Dict[str, Any]]:
+    return _image_messages(
+        image_data,
+        image_url,
+        [
+            "Task: single pass (stage 1 and stage 2).",
+            _clarification_state(context_text, "No user clarification is available yet."),
+        ],
+        extra_image_urls,
+    )
 
 
 def build_text_analysis_messages(text_description: str) -> List[Dict[str, str]]:
     return [
-        {
-            "role": "system",
-            "content": (
-                "You are a nutrition expert. Analyze text descriptions of food and "
-                "ingredients to estimate calories and macronutrients. Return only JSON."
-            ),
-        },
-        {
-            "role": "user",
-            "content": (
-                "Estimate the total nutritional content of this food description and "
-                "give it a descriptive meal name. "
-                f"Description: {text_description!r}"
-            ),
-        },
+        {"role": "system", "content": TEXT_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Description: {text_description!r}"},
     ]
 
 
@@ -412,14 +509,34 @@ def _run_structured_chat_completion(
     schema_model: Type[ModelT],
     schema_name: str,
 ) -> ModelT:
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        response_format=_build_response_format(schema_model, schema_name),
+    with stage_timer(schema_name, model):
+        response = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            response_format=_build_response_format(schema_model, schema_name),
+        )
+    record_completion_usage(model, schema_name, response, messages)
+    with stage_timer("json_extract", model):
+        raw_content = _extract_response_text(response)
+        payload = _extract_json_payload(raw_content)
+        return _model_validate(schema_model, payload)
+
+
+def _run_with_fallback(
+    client: Any,
+    *,
+    models: List[str],
+    messages: List[Dict[str, Any]],
+    schema_model: Type[ModelT],
+    schema_name: str,
+) -> ModelT:
+    """``_run_structured_chat_completion`` on the first model in ``models`` whose breaker admits it"""
+    return call_with_fallback(
+        models,
+        lambda model: _run_structured_chat_completion(
+            client, model=model, messages=messages, schema_model=schema_model, schema_name=schema_name
+        ),
     )
-    raw_content = _extract_response_text(response)
-    payload = _extract_json_payload(raw_content)
-    return _model_validate(schema_model, payload)
 
 
 def normalize_food_analysis(
@@ -477,7 +594,9 @@ def normalize_food_analysis(
         else "image_only"
     )
 
-    return FoodAnalysisResponseV2(
+    # Every field is coerced above, so skip a second validation pass
+    return _model_construct(
+        FoodAnalysisResponseV2,
         analysis_version="v2",
         status=status,
         meal_name=str(payload.get("meal_name", "Unknown Meal")).strip() or "Unknown Meal",
@@ -540,55 +659,281 @@ def parse_nutrition_json(raw_content: str) -> Dict[str, Any]:
     return _model_dump(normalize_legacy_nutrition(payload))
 
 
+class ImageRefinementState(BaseModel):
+    """What a clarification follow-up needs to go straight to stage 2"""
+
+    image_data: Optional[str] = None  # already resized for the API
+    image_url: Optional[str] = None
+    # Further views of the same meal (data: or https URLs), from analyze_meal_images_with_state
+    extra_image_urls: List[str] = Field(default_factory=list)
+    stage1: ImageUnderstandingResponse
+    model: str
+
+
 def analyze_image(
     client: Any,
     *,
     image_data: Optional[str] = None,
     image_url: Optional[str] = None,
     context_text: Optional[str] = None,
+    model: Optional[str] = None,
+    max_px: int = _MAX_IMAGE_PX,
+    fused: bool = False,
 ) -> Dict[str, Any]:
+    """
+    Estimate nutrition for a meal photo
+
+    By default this runs two calls (image understanding, then nutrition
+    synthesis); ``fused=True`` asks for both in a single call.
+    """
+    result, _ = analyze_image_with_state(
+        client,
+        image_data=image_data,
+        image_url=image_url,
+        context_text=context_text,
+        model=model,
+        max_px=max_px,
+        fused=fused,
+    )
+    return _model_dump(result)
+
+
+def analyze_image_with_state(
+    client: Any,
+    *,
+    image_data: Optional[str] = None,
+    image_url: Optional[str] = None,
+    context_text: Optional[str] = None,
+    model: Optional[str] = None,
+    max_px: int = _MAX_IMAGE_PX,
+    fused: bool = False,
+) -> Tuple[FoodAnalysisResponseV2, ImageRefinementState]:
+    """
+    ``analyze_image`` returning the normalized model (for callers that serialize it
+    themselves) plus the state ``refine_image`` needs for a clarification follow-up
+    """
     if not image_data and not image_url:
         raise ValueError("Either image_data or image_url must be provided")
 
     if image_data:
-        image_data = resize_for_api(image_data)
+        with stage_timer("resize"):
+            image_data = resize_for_api(image_data, max_px)
 
-    stage1 = _run_structured_chat_completion(
+    return _analyze_prepared_images(
         client,
-        model=get_image_model(),
-        messages=build_image_understanding_messages(image_data, image_url, context_text),
-        schema_model=ImageUnderstandingResponse,
-        schema_name="food_image_understanding",
+        image_data=image_data,
+        image_url=image_url,
+        extra_image_urls=[],
+        context_text=context_text,
+        models=image_model_chain(model),
+        fused=fused,
     )
-    stage2 = _run_structured_chat_completion(
+
+
+def analyze_meal_images_with_state(
+    client: Any,
+    *,
+    images: Sequence[str] = (),
+    image_urls: Sequence[str] = (),
+    context_text: Optional[str] = None,
+    model: Optional[str] = None,
+    max_px: int = _MAX_IMAGE_PX,
+    fused: bool = False,
+) -> Tuple[FoodAnalysisResponseV2, ImageRefinementState]:
+    """
+    One analysis for several photos of the same meal
+
+    Uploaded images are resized in parallel, then every photo goes to the
+    model as its own image part in a single stage 1 / stage 2 pass, so the
+    extra angles inform portion estimates instead of producing N answers.
+    """
+    if not images and not image_urls:
+        raise ValueError("At least one image or image_url must be provided")
+    if len(images) + len(image_urls) > MAX_MEAL_IMAGES:
+        raise ValueError(f"At most {MAX_MEAL_IMAGES} images can be analyzed together")
+
+    with stage_timer("resize"):
+        resized = resize_all_for_api(images, max_px)
+    urls = [f"data:image/jpeg;base64,{image}" for image in resized[1:]] + list(image_urls)
+
+    return _analyze_prepared_images(
+        client,
+        image_data=resized[0] if resized else None,
+        image_url=None if resized else urls.pop(0),
+        extra_image_urls=urls,
+        context_text=context_text,
+        models=image_model_chain(model),
+        fused=fused,
+    )
+
+
+def _analyze_prepared_images(
+    client: Any,
+    *,
+    image_data: Optional[str],
+    image_url: Optional[str],
+    extra_image_urls: List[str],
+    context_text: Optional[str],
+    models: List[str],
+    fused: bool,
+) -> Tuple[FoodAnalysisResponseV2, ImageRefinementState]:
+    if fused:
+        fused_result = _run_with_fallback(
+            client,
+            models=models,
+            messages=build_image_fused_messages(image_data, image_url, context_text, extra_image_urls),
+            schema_model=ImageFusedAnalysisResponse,
+            schema_name="food_image_fused",
+        )
+        payload = _model_dump(fused_result)
+        stage1 = ImageUnderstandingResponse(
+            **{name: payload[name] for name in ImageUnderstandingResponse.model_fields}
+        )
+    else:
+        stage1 = _run_with_fallback(
+            client,
+            models=models,
+            messages=build_image_understanding_messages(image_data, image_url, context_text, extra_image_urls),
+            schema_model=ImageUnderstandingResponse,
+            schema_name="food_image_understanding",
+        )
+        stage2 = _run_with_fallback(
+            client,
+            models=models,
+            messages=build_image_synthesis_messages(image_data, image_url, stage1, context_text, extra_image_urls),
+            schema_model=ImageNutritionSynthesisResponse,
+            schema_name="food_image_nutrition",
+        )
+        payload = _model_dump(stage2)
+
+    state = ImageRefinementState(
+        image_data=image_data,
+        image_url=image_url,
+        extra_image_urls=extra_image_urls,
+        stage1=stage1,
+        model=models[0],
+    )
+    return _finish_image_analysis(payload, stage1, context_text), state
+
+
+def refine_image(client: Any, state: ImageRefinementState, context_text: str) -> FoodAnalysisResponseV2:
+    """Stage 2 only, for a clarification reply to an image whose stage 1 already ran"""
+    stage2 = _run_with_fallback(
         client,
-        model=get_image_model(),
-        messages=build_image_synthesis_messages(image_data, image_url, stage1, context_text),
+        models=model_chain(state.model, fallback_models(IMAGE_FALLBACK_MODELS_ENV)),
+        messages=build_image_synthesis_messages(
+            state.image_data, state.image_url, state.stage1, context_text, state.extra_image_urls
+        ),
         schema_model=ImageNutritionSynthesisResponse,
         schema_name="food_image_nutrition",
     )
+    return _finish_image_analysis(_model_dump(stage2), state.stage1, context_text)
 
-    payload = _model_dump(stage2)
-    # Pass stage1 clarification fields through; normalize_food_analysis handles
+
+def _finish_image_analysis(
+    payload: Dict[str, Any], stage1: ImageUnderstandingResponse, context_text: Optional[str]
+) -> FoodAnalysisResponseV2:
+    if not payload.get("meal_name") and stage1.meal_name:
+        payload["meal_name"] = stage1.meal_name
+
+    # Pass clarification fields through; normalize_food_analysis handles
     # the context_text override (sets status=complete, clears question if present).
     payload["status"] = "needs_clarification" if stage1.needs_clarification else "complete"
     payload["clarifying_question"] = stage1.clarifying_question
-    if not payload.get("meal_name") and stage1.meal_name:
-        payload["meal_name"] = stage1.meal_name
 
-    normalized = normalize_food_analysis(payload, context_text=context_text)
-    return _model_dump(normalized)
+    with stage_timer("normalize"):
+        return normalize_food_analysis(payload, context_text=context_text)
 
 
-def analyze_text(client: Any, text_description: str) -> Dict[str, Any]:
-    payload = _run_structured_chat_completion(
+def analyze_text(client: Any, text_description: str, model: Optional[str] = None) -> Dict[str, Any]:
+    payload = _run_with_fallback(
         client,
-        model=get_text_model(),
+        models=text_model_chain(model),
         messages=build_text_analysis_messages(text_description),
         schema_model=LegacyNutritionResponse,
         schema_name="text_food_analysis",
     )
-    return _model_dump(normalize_legacy_nutrition(_model_dump(payload)))
+    with stage_timer("normalize"):
+        return _model_dump(normalize_legacy_nutrition(_model_dump(payload)))
+
+
+STREAMED_TEXT_FIELDS = ("meal_name", "calories", "protein", "carbs", "fats")
+
+
+def analyze_text_stream(client: Any, text_description: str, model: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    ``analyze_text`` as a stream of events, for showing a result before the model finishes
+
+    Yields ``{"type": "field", "name", "value"}`` for ``meal_name`` and each
+    macro as soon as its value is complete in the token stream (coerced the
+    way ``normalize_legacy_nutrition`` does), then
+    ``{"type": "result", "data": ...}`` with the normalized response parsed
+    from the full text. Fields the stream could not follow still arrive in
+    the result.
+    """
+    schema_name = "text_food_analysis"
+    messages = build_text_analysis_messages(text_description)
+    parser = IncrementalJSONObjectParser()
+    parts: List[str] = []
+    usage_chunk = None
+    start = time.perf_counter()
+    first_field = True
+
+    def _open_stream(candidate: str) -> Tuple[str, Any]:
+        # Failover covers opening the stream; a failure mid-stream ends this request
+        return candidate, client.chat.completions.create(
+            model=candidate,
+            messages=messages,
+            response_format=_build_response_format(LegacyNutritionResponse, schema_name),
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+    model, stream = call_with_fallback(text_model_chain(model), _open_stream)
+    with stage_timer(schema_name, model):
+        for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage_chunk = chunk
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            parts.append(delta)
+            for name, value in parser.feed(delta):
+                if name not in STREAMED_TEXT_FIELDS:
+                    continue
+                if first_field:
+                    STAGE_SECONDS.observe(time.perf_counter() - start, stage="text_first_field", model=model)
+                    first_field = False
+                # Coerce through the same path as the final result so the values agree
+                coerced = _model_dump(normalize_legacy_nutrition({name: value}))[name]
+                yield {"type": "field", "name": name, "value": coerced}
+    record_completion_usage(model, schema_name, usage_chunk, messages)
+
+    with stage_timer("json_extract", model):
+        payload = _model_validate(LegacyNutritionResponse, _extract_json_payload("".join(parts)))
+    with stage_timer("normalize"):
+        result = _model_dump(normalize_legacy_nutrition(_model_dump(payload)))
+    yield {"type": "result", "data": result}
+
+
+def transcribe_audio(client: Any, audio_data: str, audio_format: str = "mp3") -> str:
+    audio_file = io.BytesIO(base64.b64decode(audio_data))
+    audio_file.name = f"audio.{audio_format}"
+
+    with stage_timer("transcription", TRANSCRIPTION_MODEL):
+        # No fallback: only whisper-1 returns the verbose_json duration we are billed for
+        transcription = call_with_fallback(
+            [TRANSCRIPTION_MODEL],
+            lambda model: client.audio.transcriptions.create(
+                model=model,
+                file=audio_file,
+                response_format="verbose_json",
+            ),
+        )
+    record_transcription_usage(TRANSCRIPTION_MODEL, getattr(transcription, "duration", 0.0) or 0.0)
+    return transcription.text
 
 
 def encode_image_file_to_base64(image_path: str) -> str:
@@ -0,0 +1,159 @@
+"""Incremental parsing of a JSON object arriving in text chunks.
+
+``IncrementalJSONObjectParser`` reports each top-level field of the first
+JSON object in the stream as soon as its value is complete, so a streamed
+model response can be shown before the object closes. It accepts the same
+wrappers ``food_analysis._extract_json_payload`` tolerates: prose before the
+object, a fenced ```json block, pretty-printing, or the object inside a
+top-level array. Anything after the object closes is ignored.
+
+    parser = IncrementalJSONObjectParser()
+    for chunk in chunks:
+        for key, value in parser.feed(chunk):
+            ...
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, List, Optional, Tuple
+
+_SCALAR_END = frozenset(",}] \t\r\n")
+_NEED_MORE = object()
+
+
+class IncrementalJSONObjectParser:
+    """Yield ``(key, value)`` for each completed top-level field of the first JSON object"""
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._pos = 0
+        self._state = "seek"  # seek, key, colon, value, after_value, done
+        self._key: Optional[str] = None
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self._buffer += chunk
+        fields: List[Tuple[str, Any]] = []
+        while not self.done:
+            field = self._step()
+            if field is _NEED_MORE:
+                break
+            if field is not None:
+                fields.append(field)
+        # Drop consumed text so long streams do not rescan it
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+        return fields
+
+    def _skip_whitespace(self) -> bool:
+        while self._pos < len(self._buffer) and self._buffer[self._pos] in " \t\r\n":
+            self._pos += 1
+        return self._pos < len(self._buffer)
+
+    def _step(self) -> Any:
+        if self._state == "seek":
+            start = self._buffer.find("{", self._pos)
+            if start == -1:
+                self._pos = len(self._buffer)
+                return _NEED_MORE
+            self._pos = start + 1
+            self._state = "key"
+            return None
+
+        if not self._skip_whitespace():
+            return _NEED_MORE
+        char = self._buffer[self._pos]
+
+        if self._state == "key":
+            if char == "}":
+                return self._finish()
+            if char == ",":
+                self._pos += 1
+                return None
+            if char != '"':
+                # Not JSON we can follow (e.g. an unquoted key); leave it to the final parse
+                return self._finish()
+            end = _string_end(self._buffer, self._pos)
+            if end is None:
+                return _NEED_MORE
+            self._key = json.loads(self._buffer[self._pos:end])
+            self._pos = end
+            self._state = "colon"
+            return None
+
+        if self._state == "colon":
+            self._pos += 1  # ':'
+            self._state = "value"
+            return None
+
+        if self._state == "value":
+            end = _value_end(self._buffer, self._pos)
+            if end is None:
+                return _NEED_MORE
+            raw = self._buffer[self._pos:end]
+            self._pos = end
+            self._state = "after_value"
+            try:
+                return (self._key, json.loads(raw))
+            except json.JSONDecodeError:
+                # Not valid JSON (e.g. a bare word); the final full parse decides
+                return None
+
+        # after_value
+        if char == "}":
+            return self._finish()
+        self._pos += 1  # ','
+        self._state = "key"
+        return None
+
+    def _finish(self) -> None:
+        self._pos += 1
+        self._state = "done"
+        self.done = True
+        return None
+
+
+def _string_end(text: str, start: int) -> Optional[int]:
+    """Index just past the string opening at ``start``, or None if it has not closed yet"""
+    pos = start + 1
+    while pos < len(text):
+        char = text[pos]
+        if char == "\\":
+            pos += 2
+            continue
+        if char == '"':
+            return pos + 1
+        pos += 1
+    return None
+
+
+def _value_end(text: str, start: int) -> Optional[int]:
+    """Index just past the JSON value at ``start``, or None if more input is needed"""
+    char = text[start]
+    if char == '"':
+        return _string_end(text, start)
+    if char in "{[":
+        depth = 0
+        pos = start
+        while pos < len(text):
+            char = text[pos]
+            if char == '"':
+                end = _string_end(text, pos)
+                if end is None:
+                    return None
+                pos = end
+                continue
+            if char in "{[":
+                depth += 1
+            elif char in "}]":
+                depth -= 1
+                if depth == 0:
+                    return pos + 1
+            pos += 1
+        return None
+    # number, true, false, null: complete once a delimiter follows
+    pos = start
+    while pos < len(text) and text[pos] not in _SCALAR_END:
+        pos += 1
+    return pos if pos < len(text) else None
@@ -0,0 +1,71 @@
+"""Deferred imports for heavy third-party SDKs.
+
+``lazy_module("stripe")`` returns a stand-in that imports the real module on
+first attribute access, so importing the app does not pay for SDKs a
+request may never touch. Proxies are shared per module name; ``on_load``
+hooks (e.g. setting ``stripe.api_key``) run once, when the module is first
+imported, or immediately if it already was.
+"""
+
+from __future__ import annotations
+
+import importlib
+import threading
+from types import ModuleType
+from typing import Callable, Dict, List, Optional
+
+_lock = threading.RLock()
+_proxies: Dict[str, "LazyModule"] = {}
+
+
+class LazyModule:
+    """Module stand-in that imports ``name`` on first attribute access"""
+
+    def __init__(self, name: str) -> None:
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_module", None)
+        object.__setattr__(self, "_hooks", [])
+
+    def _load(self) -> ModuleType:
+        module = self._module
+        if module is not None:
+            return module
+        with _lock:
+            if self._module is None:
+                module = importlib.import_module(self._name)
+                hooks: List[Callable[[ModuleType], None]] = self._hooks
+                for hook in hooks:
+                    hook(module)
+                object.__setattr__(self, "_module", module)
+            return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr: str, value) -> None:
+        setattr(self._load(), attr, value)
+
+    def __delattr__(self, attr: str) -> None:
+        delattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_module(name: str, on_load: Optional[Callable[[ModuleType], None]] = None) -> LazyModule:
+    """Shared lazy proxy for ``name``; ``on_load`` runs once the module is imported"""
+    with _lock:
+        proxy = _proxies.get(name)
+        if proxy is None:
+            proxy = _proxies[name] = LazyModule(name)
+        if on_load is not None:
+            if proxy.loaded:
+                on_load(proxy._module)
+            else:
+                proxy._hooks.append(on_load)
+        return proxy
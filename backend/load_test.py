@@ -0,0 +1,566 @@
+"""Ramp concurrent analysis traffic against a worker backed by a fake OpenAI server.
+
+A local OpenAI-compatible server answers chat completions (with a payload
+synthesized from the request's JSON schema) and transcriptions after a
+configurable latency, failing a configurable share of calls with 500s or
+429s. The app runs as a real uvicorn process with ``OPENAI_BASE_URL`` pointed
+at that server, and is driven through increasing concurrency stages with the
+``test_cases/`` images.
+
+Each stage reports throughput and latency percentiles; event-loop lag (from
+the app's ``/metrics``) and worker RSS are sampled over time. Results are
+written as JSON and can be compared against an earlier run with
+``--baseline``.
+
+    python load_test.py --concurrency 1,4,8,16,32 --stage-seconds 20 \\
+        --chat-latency lognormal:0.5:0.4 --rate-limit-rate 0.02
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import glob
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from bench_asgi import DEFAULT_TEXTS, percentile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TEST_CASES = os.path.join(BACKEND_DIR, "..", "test_cases")
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png", "*.JPG", "*.JPEG", "*.PNG")
+LOAD_USER_PREFIX = "load-user"
+
+
+# --- Fake OpenAI server -------------------------------------------------------
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Build a latency sampler (seconds) from a spec string
+
+    ``fixed:S``, ``uniform:LO:HI``, ``normal:MEAN:STDDEV``,
+    ``lognormal:MEDIAN:SIGMA`` or ``exp:MEAN``.
+    """
+    kind, *raw = spec.split(":")
+    params = [float(value) for value in raw]
+    if kind == "fixed" and len(params) == 1:
+        return lambda rng: params[0]
+    if kind == "uniform" and len(params) == 2:
+        return lambda rng: rng.uniform(params[0], params[1])
+    if kind == "normal" and len(params) == 2:
+        return lambda rng: max(0.0, rng.gauss(params[0], params[1]))
+    if kind == "lognormal" and len(params) == 2:
+        mu = math.log(params[0])
+        return lambda rng: rng.lognormvariate(mu, params[1])
+    if kind == "exp" and len(params) == 1:
+        return lambda rng: rng.expovariate(1 / params[0])
+    raise ValueError(f"Invalid latency spec: {spec}")
+
+
+def example_from_schema(schema: Dict[str, Any], root: Optional[Dict[str, Any]] = None) -> Any:
+    """A minimal instance satisfying a (strict) JSON schema, good enough to pass validation"""
+    root = root if root is not None else schema
+    if "$ref" in schema:
+        name = schema["$ref"].rsplit("/", 1)[-1]
+        return example_from_schema(root.get("$defs", {}).get(name, {}), root)
+    for union in ("anyOf", "oneOf"):
+        if union in schema:
+            options = [option for option in schema[union] if option.get("type") != "null"]
+            return example_from_schema(options[0] if options else {"type": "null"}, root)
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "const" in schema:
+        return schema["const"]
+
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        schema_type = next((t for t in schema_type if t != "null"), "null")
+    if schema_type == "object":
+        return {name: example_from_schema(prop, root) for name, prop in schema.get("properties", {}).items()}
+    if schema_type == "array":
+        return [example_from_schema(schema.get("items", {}), root)]
+    if schema_type == "integer":
+        return 120
+    if schema_type == "number":
+        return 0.8
+    if schema_type == "boolean":
+        return False
+    if schema_type == "string":
+        return "grilled chicken"
+    return None
+
+
+class FakeOpenAIConfig:
+    def __init__(
+        self,
+        chat_latency: str = "lognormal:0.8:0.3",
+        transcription_latency: str = "uniform:0.3:0.8",
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.chat_latency = parse_latency(chat_latency)
+        self.transcription_latency = parse_latency(transcription_latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts: Dict[str, int] = {"ok": 0, "error": 0, "rate_limited": 0}
+
+    def draw(self, sampler: Callable[[random.Random], float]) -> Tuple[float, float]:
+        with self.lock:
+            return sampler(self.rng), self.rng.random()
+
+
+def _make_handler(config: FakeOpenAIConfig) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self) -> None:
+            raw = self.rfile.read(int(self.headers.get("Content-Length", 0) or 0))
+            is_chat = self.path.endswith("/chat/completions")
+            if not is_chat and not self.path.endswith("/audio/transcriptions"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+
+            latency, roll = config.draw(config.chat_latency if is_chat else config.transcription_latency)
+            time.sleep(latency)
+
+            if roll < config.rate_limit_rate:
+                with config.lock:
+                    config.counts["rate_limited"] += 1
+                self._send_json(
+                    429,
+                    {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                    {"Retry-After": "1"},
+                )
+                return
+            if roll < config.rate_limit_rate + config.error_rate:
+                with config.lock:
+                    config.counts["error"] += 1
+                self._send_json(500, {"error": {"message": "Fake upstream error", "type": "server_error"}})
+                return
+
+            with config.lock:
+                config.counts["ok"] += 1
+            if is_chat:
+                request = json.loads(raw or b"{}")
+                json_schema = (request.get("response_format") or {}).get("json_schema") or {}
+                content = example_from_schema(json_schema.get("schema", {"type": "object"}))
+                self._send_json(
+                    200,
+                    {
+                        "id": "chatcmpl-fake",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": request.get("model", "fake"),
+                        "choices": [
+                            {
+                                "index": 0,
+                                "finish_reason": "stop",
+                                "message": {"role": "assistant", "content": json.dumps(content)},
+                            }
+                        ],
+                        "usage": {
+                            "prompt_tokens": max(1, len(raw) // 4),
+                            "completion_tokens": 120,
+                            "total_tokens": max(1, len(raw) // 4) + 120,
+                        },
+                    },
+                )
+            else:
+                self._send_json(200, {"text": DEFAULT_TEXTS[0], "duration": 4.0, "language": "english"})
+
+    return Handler
+
+
+class FakeOpenAIServer:
+    """OpenAI-compatible HTTP server on a background thread"""
+
+    def __init__(self, config: FakeOpenAIConfig, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.config = config
+        self._server = ThreadingHTTPServer((host, port), _make_handler(config))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-openai", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# --- App process and sampling ---------------------------------------------------
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(openai_base_url: str, port: int, lag_interval_s: float) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "OPENAI_BASE_URL": openai_base_url,
+        "OPENAI_API_KEY": "load-test",
+        "RATE_LIMIT_ENABLED": "0",
+        "EVENT_LOOP_LAG_INTERVAL_SECONDS": str(lag_interval_s),
+        "USAGE_FLUSH_INTERVAL_SECONDS": "0",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+
+
+def read_rss_mb(pid: int) -> Optional[float]:
+    """Resident set size from /proc (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="ascii") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+_LAG_BUCKET = re.compile(r'^event_loop_lag_seconds_bucket\{le="([^"]+)"\} (\S+)$')
+_LAG_SUM = re.compile(r"^event_loop_lag_seconds_sum (\S+)$")
+
+
+def parse_lag_histogram(text: str) -> Tuple[List[Tuple[float, float]], float]:
+    """Cumulative (upper bound, count) buckets and the sum of the lag histogram"""
+    buckets: List[Tuple[float, float]] = []
+    total = 0.0
+    for line in text.splitlines():
+        match = _LAG_BUCKET.match(line)
+        if match:
+            bound = float("inf") if match.group(1) == "+Inf" else float(match.group(1))
+            buckets.append((bound, float(match.group(2))))
+            continue
+        match = _LAG_SUM.match(line)
+        if match:
+            total = float(match.group(1))
+    return buckets, total
+
+
+def lag_window(
+    before: Tuple[List[Tuple[float, float]], float], after: Tuple[List[Tuple[float, float]], float]
+) -> Dict[str, Optional[float]]:
+    """Mean and bucketed p99/max lag (ms) observed between two scrapes"""
+    prev = dict(before[0])
+    deltas = [(bound, count - prev.get(bound, 0.0)) for bound, count in after[0]]
+    observations = deltas[-1][1] if deltas else 0.0
+    if observations <= 0:
+        return {"samples": 0, "mean_ms": None, "p99_ms": None, "max_ms": None}
+
+    def _bound(rank: float) -> float:
+        for bound, cumulative in deltas:
+            if cumulative >= rank:
+                return bound
+        return deltas[-1][0]
+
+    def _ms(value: float) -> Optional[float]:
+        return None if value == float("inf") else round(value * 1000, 2)
+
+    return {
+        "samples": int(observations),
+        "mean_ms": round((after[1] - before[1]) / observations * 1000, 3),
+        "p99_ms": _ms(_bound(observations * 0.99)),
+        "max_ms": _ms(_bound(observations)),
+    }
+
+
+# --- Load generation ------------------------------------------------------------
+
+
+def load_payloads(test_cases_dir: str, audio_path: Optional[str]) -> Dict[str, List[Dict[str, Any]]]:
+    images: List[str] = []
+    for pattern in IMAGE_PATTERNS:
+        images.extend(glob.glob(os.path.join(test_cases_dir, "**", pattern), recursive=True))
+    if not images:
+        raise SystemExit(f"No images found under {test_cases_dir}")
+
+    def _b64(path: str) -> str:
+        with open(path, "rb") as payload_file:
+            return base64.b64encode(payload_file.read()).decode("ascii")
+
+    # The fake transcription endpoint ignores the audio, so any bytes will do
+    audio = _b64(audio_path) if audio_path else base64.b64encode(os.urandom(32_000)).decode("ascii")
+    return {
+        "image": [{"image": _b64(path)} for path in sorted(set(images))],
+        "text": [{"text": text} for text in DEFAULT_TEXTS],
+        "audio": [{"audio": audio, "format": "mp3"}],
+    }
+
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in spec.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in ("image", "text", "audio"):
+            raise ValueError(f"Unknown request kind in mix: {kind}")
+        mix.append((kind, float(weight or 1)))
+    return mix
+
+
+async def run_stage(
+    base_url: str,
+    app_pid: int,
+    payloads: Dict[str, List[Dict[str, Any]]],
+    mix: List[Tuple[str, float]],
+    concurrency: int,
+    duration_s: float,
+    sample_interval_s: float,
+    timeout_s: float,
+    rng: random.Random,
+) -> Dict[str, Any]:
+    import httpx
+
+    results: List[Tuple[str, float, int]] = []
+    samples: List[Dict[str, Any]] = []
+    kinds = [kind for kind, _ in mix]
+    weights = [weight for _, weight in mix]
+    stage_start = time.perf_counter()
+    deadline = stage_start + duration_s
+
+    limits = httpx.Limits(max_connections=concurrency + 2, max_keepalive_connections=concurrency + 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout_s, limits=limits) as http:
+
+        async def worker(index: int) -> None:
+            headers = {"X-User-ID": f"{LOAD_USER_PREFIX}-{index}"}
+            while time.perf_counter() < deadline:
+                kind = rng.choices(kinds, weights)[0]
+                body = rng.choice(payloads[kind])
+                start = time.perf_counter()
+                try:
+                    response = await http.post(f"/analyze_food/{kind}", json=body, headers=headers)
+                    status = response.status_code
+                except httpx.HTTPError:
+                    status = 0
+                results.append((kind, time.perf_counter() - start, status))
+
+        async def sampler() -> None:
+            previous = parse_lag_histogram((await http.get("/metrics")).text)
+            while time.perf_counter() < deadline:
+                await asyncio.sleep(sample_interval_s)
+                current = parse_lag_histogram((await http.get("/metrics")).text)
+                samples.append(
+                    {
+                        "t_s": round(time.perf_counter() - stage_start, 2),
+                        "rss_mb": read_rss_mb(app_pid),
+                        "completed": len(results),
+                        "event_loop_lag": lag_window(previous, current),
+                    }
+                )
+                previous = current
+
+        await asyncio.gather(sampler(), *(worker(i) for i in range(concurrency)))
+
+    wall_s = time.perf_counter() - stage_start
+    return summarize_stage(concurrency, wall_s, results, samples)
+
+
+def _latency_summary(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p90_ms": round(percentile(latencies, 90) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1) if latencies else 0.0,
+    }
+
+
+def summarize_stage(
+    concurrency: int, wall_s: float, results: List[Tuple[str, float, int]], samples: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    ok = [latency for _, latency, status in results if status == 200]
+    statuses: Dict[str, int] = {}
+    for _, _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    by_kind = {}
+    for kind in sorted({kind for kind, _, _ in results}):
+        kind_ok = [latency for k, latency, status in results if k == kind and status == 200]
+        by_kind[kind] = {"requests": sum(1 for k, _, _ in results if k == kind), **_latency_summary(kind_ok)}
+
+    lag_p99 = [s["event_loop_lag"]["p99_ms"] for s in samples if s["event_loop_lag"]["p99_ms"] is not None]
+    rss = [s["rss_mb"] for s in samples if s["rss_mb"] is not None]
+    return {
+        "concurrency": concurrency,
+        "wall_s": round(wall_s, 2),
+        "requests": len(results),
+        "throughput_rps": round(len(ok) / wall_s, 2) if wall_s else 0.0,
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else 0.0,
+        "statuses": statuses,
+        "latency": _latency_summary(ok),
+        "by_kind": by_kind,
+        "event_loop_lag_p99_ms_max": max(lag_p99) if lag_p99 else None,
+        "rss_mb_max": round(max(rss), 1) if rss else None,
+        "samples": samples,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """One line per concurrency level present in both runs"""
+    previous = {stage["concurrency"]: stage for stage in baseline.get("stages", [])}
+    lines = []
+    for stage in current["stages"]:
+        old = previous.get(stage["concurrency"])
+        if old is None:
+            continue
+        lines.append(
+            f"c={stage['concurrency']:<4} rps {old['throughput_rps']:>7} -> {stage['throughput_rps']:<7} "
+            f"p95 {old['latency']['p95_ms']:>8}ms -> {stage['latency']['p95_ms']:<8}ms "
+            f"errors {old['error_rate']:.2%} -> {stage['error_rate']:.2%}"
+        )
+    return lines
+
+
+async def _wait_ready(base_url: str, proc: subprocess.Popen, timeout_s: float = 30.0) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout_s
+    async with httpx.AsyncClient(base_url=base_url) as http:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise SystemExit(f"App exited during startup with code {proc.returncode}")
+            try:
+                if (await http.get("/metrics")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit("App did not become ready in time")
+
+
+async def run_load_test(args: argparse.Namespace) -> Dict[str, Any]:
+    fake = FakeOpenAIServer(
+        FakeOpenAIConfig(
+            chat_latency=args.chat_latency,
+            transcription_latency=args.transcription_latency,
+            error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate,
+            seed=args.seed,
+        )
+    ).start()
+    port = _free_port()
+    proc = start_app(fake.base_url, port, args.lag_interval)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        await _wait_ready(base_url, proc)
+        payloads = load_payloads(args.test_cases, args.audio)
+        rng = random.Random(args.seed)
+        stages = []
+        for concurrency in args.concurrency:
+            stage = await run_stage(
+                base_url,
+                proc.pid,
+                payloads,
+                parse_mix(args.mix),
+                concurrency,
+                args.stage_seconds,
+                args.sample_interval,
+                args.timeout,
+                rng,
+            )
+            stages.append(stage)
+            print(
+                f"c={concurrency:<4} {stage['throughput_rps']:>7} rps  "
+                f"p50 {stage['latency']['p50_ms']}ms  p95 {stage['latency']['p95_ms']}ms  "
+                f"p99 {stage['latency']['p99_ms']}ms  errors {stage['error_rate']:.2%}  "
+                f"lag p99 {stage['event_loop_lag_p99_ms_max']}ms  rss {stage['rss_mb_max']}MB"
+            )
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        fake.stop()
+
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("output", "baseline")
+        },
+        "upstream_calls": dict(fake.config.counts),
+        "stages": stages,
+    }
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Ramp /analyze_food/* load against a fake OpenAI backend")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 2, 4, 8, 16], help="Comma-separated stages")
+    parser.add_argument("--stage-seconds", type=float, default=15.0)
+    parser.add_argument("--mix", default="image=2,text=2,audio=1", help="Weighted request mix")
+    parser.add_argument("--chat-latency", default="lognormal:0.8:0.3", help="Fake completion latency spec")
+    parser.add_argument("--transcription-latency", default="uniform:0.3:0.8", help="Fake transcription latency spec")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of upstream calls failing with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of upstream calls failing with 429")
+    parser.add_argument("--test-cases", default=DEFAULT_TEST_CASES, help="Directory of meal images")
+    parser.add_argument("--audio", help="Audio file to send (random bytes by default)")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="Seconds between lag/RSS samples")
+    parser.add_argument("--lag-interval", type=float, default=0.05, help="App event loop probe interval")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request client timeout")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="JSON results path (default results/load_test_<timestamp>.json)")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(run_load_test(args))
+
+    output = args.output or os.path.join(
+        BACKEND_DIR, "results", f"load_test_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            for line in compare(report, json.load(baseline_file)):
+                print(line)
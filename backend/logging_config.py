@@ -0,0 +1,181 @@
+"""Structured JSON logging through a background queue.
+
+``setup_logging()`` installs a single ``QueueHandler`` on the root logger.
+Callers only pay for building the record and capturing request/user ids;
+formatting and the write to stdout happen on a ``QueueListener`` thread.
+When the queue is full, records are dropped and counted rather than
+blocking the request.
+
+Environment:
+    LOG_LEVEL               root level (default INFO)
+    LOG_LEVELS              per-module levels, e.g. "stripe_service=DEBUG,httpx=WARNING"
+    LOG_FORMAT              "json" (default) or "text" for local development
+    LOG_DEBUG_SAMPLE_RATE   share of DEBUG records kept (default 1.0)
+    LOG_QUEUE_SIZE          max queued records before dropping (default 10000)
+
+Structured fields go in ``extra``; a record may carry ``sample_rate`` in
+``extra`` to sample an individual chatty line.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from request_context import get_request_id, get_user_id
+
+# color_message is uvicorn's ANSI-colored duplicate of msg
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {
+    "message", "asctime", "request_id", "user_id", "sample_rate", "color_message",
+}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["DroppingQueueHandler"] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with correlation ids and ``extra`` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        if getattr(record, "user_id", None):
+            entry["user_id"] = record.user_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self) -> None:
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, "request_id"):
+            record.request_id = None
+        return super().format(record)
+
+
+class ContextFilter(logging.Filter):
+    """Copies the request/user ids from contextvars onto the record (caller side)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = get_request_id()
+        if not hasattr(record, "user_id"):
+            record.user_id = get_user_id()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a share of DEBUG records, or of any record carrying ``sample_rate``"""
+
+    def __init__(self, debug_rate: float = 1.0) -> None:
+        super().__init__()
+        self.debug_rate = debug_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, "sample_rate", None)
+        if rate is None:
+            rate = self.debug_rate if record.levelno <= logging.DEBUG else 1.0
+        return rate >= 1.0 or random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when full"""
+
+    def __init__(self, log_queue: "queue.Queue[Any]") -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Freeze the message now (args may be mutated later) but leave
+        # formatting, including tracebacks, to the listener thread.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _parse_levels(spec: str) -> Dict[str, int]:
+    levels = {}
+    for part in spec.split(","):
+        name, _, level = part.strip().partition("=")
+        if name and level:
+            levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return levels
+
+
+def setup_logging(stream: Any = None, force: bool = False) -> None:
+    """Install the queue handler on the root logger (idempotent unless ``force``)"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        if not force:
+            return
+        shutdown_logging()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(TextFormatter() if os.getenv("LOG_FORMAT", "json") == "text" else JsonFormatter())
+
+    log_queue: "queue.Queue[Any]" = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))))
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        if isinstance(existing, DroppingQueueHandler):
+            root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    for name, level in _parse_levels(os.getenv("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level)
+
+    _queue_handler = handler
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the listener thread"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+
+
+def dropped_records() -> int:
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+atexit.register(shutdown_logging)
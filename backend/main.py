@@ -1,69 +1,125 @@
-import functions_framework
+"""Cloud Functions entry point for the food analysis endpoints.
+
+Routes to the same pipeline as the FastAPI app (``food_analysis``) and
+returns ``FoodAnalysisResponseV2``. The OpenAI client and the strict
+response schemas are built once per instance and reused by every
+invocation a warm instance serves.
+"""
+
 import json
-from app import predict_nutrition, predict_nutrition_from_text, predict_nutrition_from_audio
+import logging
+import os
+import uuid
+from functools import lru_cache
+from typing import Any, Dict, Optional, Union
+
+import functions_framework
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+import food_analysis as fa
+from circuit_breaker import CircuitOpenError
+from logging_config import setup_logging
+from request_context import REQUEST_ID_HEADER, USER_ID_HEADER, request_id_var, usage_var, user_id_var
+
+load_dotenv()
+setup_logging()
+
+logger = logging.getLogger(__name__)
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, X-User-ID, X-Request-ID',
+}
+IMAGE_PATHS = ('/analyze_food', '/analyze_food/image')
+
+# Compile the strict response schemas at cold start so invocations only look them up
+for _schema_model, _schema_name in (
+    (fa.ImageUnderstandingResponse, "food_image_understanding"),
+    (fa.ImageNutritionSynthesisResponse, "food_image_nutrition"),
+    (fa.LegacyNutritionResponse, "text_food_analysis"),
+):
+    fa._build_response_format(_schema_model, _schema_name)
+
+
+@lru_cache(maxsize=None)
+def get_client() -> Any:
+    """OpenAI client shared by all invocations on this instance"""
+    from openai import OpenAI
+
+    return OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+
+
+def _json_response(body: Union[Dict[str, Any], BaseModel], status: int, request_id: str):
+    headers = {**CORS_HEADERS, 'Content-Type': 'application/json', 'X-Request-ID': request_id}
+    content = body.model_dump_json() if isinstance(body, BaseModel) else json.dumps(body)
+    return (content, status, headers)
+
+
+def analyze(path: str, body: Dict[str, Any]) -> Optional[fa.FoodAnalysisResponseV2]:
+    """Run the analysis for ``path``; None for paths that are not analysis endpoints"""
+    if path in IMAGE_PATHS:
+        image = body.get('image')
+        if not image and not body.get('image_url'):
+            raise ValueError("Either image or image_url must be provided")
+        result, _ = fa.analyze_image_with_state(
+            get_client(),
+            image_data=image or None,
+            image_url=None if image else body.get('image_url'),
+            context_text=body.get('context_text') or None,
+        )
+        return result
+
+    if path == '/analyze_food/text':
+        text = body.get('text')
+        if not text or not str(text).strip():
+            raise ValueError("No text description provided")
+        return fa.FoodAnalysisResponseV2(**fa.analyze_text(get_client(), text))
+
+    if path == '/analyze_food/audio':
+        if not body.get('audio'):
+            raise ValueError("No audio provided")
+        transcribed_text = fa.transcribe_audio(get_client(), body['audio'], body.get('format') or 'mp3')
+        return fa.FoodAnalysisResponseV2(**fa.analyze_text(get_client(), transcribed_text))
+
+    return None
+
 
 @functions_framework.http
 def japer_api(request):
     """HTTP Cloud Function entry point"""
-    # Set CORS headers
-    headers = {
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type',
-    }
-
     # Handle preflight requests
     if request.method == 'OPTIONS':
-        return ('', 204, headers)
-
-    if request.method == 'POST':
-        try:
-            # Get JSON data from request
-            request_json = request.get_json(silent=True)
-            if not request_json:
-                return (json.dumps({'error': 'No JSON data provided'}), 400, headers)
-
-            nutrition = None
-
-            # Route based on path
-            if request.path in ['/analyze_food', '/analyze_food/image']:
-                # Image-based analysis
-                if 'image' not in request_json:
-                    return (json.dumps({'error': 'No image provided'}), 400, headers)
-                nutrition = predict_nutrition(request_json['image'])
-
-            elif request.path == '/analyze_food/text':
-                # Text-based analysis
-                if 'text' not in request_json:
-                    return (json.dumps({'error': 'No text description provided'}), 400, headers)
-                nutrition = predict_nutrition_from_text(request_json['text'])
-
-            elif request.path == '/analyze_food/audio':
-                # Audio-based analysis
-                if 'audio' not in request_json:
-                    return (json.dumps({'error': 'No audio provided'}), 400, headers)
-                audio_format = request_json.get('format', 'mp3')
-                nutrition = predict_nutrition_from_audio(request_json['audio'], audio_format)
-
-            else:
-                return (json.dumps({'message': 'Japer API is running'}), 200, headers)
-
-            # Return nutrition data if analysis was performed
-            if nutrition:
-                response_data = {
-                    'meal_name': nutrition['meal_name'],
-                    'calories': nutrition['calories'],
-                    'protein': nutrition['protein'],
-                    'carbs': nutrition['carbs'],
-                    'fats': nutrition['fats']
-                }
-                headers['Content-Type'] = 'application/json'
-                return (json.dumps(response_data), 200, headers)
-
-        except Exception as e:
-            error_response = {'error': str(e)}
-            headers['Content-Type'] = 'application/json'
-            return (json.dumps(error_response), 500, headers)
-
-    # Default response for other endpoints
-    return (json.dumps({'message': 'Japer API is running'}), 200, headers)
\ No newline at end of file
+        return ('', 204, CORS_HEADERS)
+
+    request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    if request.method != 'POST':
+        return _json_response({'message': 'Japer API is running'}, 200, request_id)
+
+    tokens = (
+        request_id_var.set(request_id),
+        user_id_var.set(request.headers.get(USER_ID_HEADER)),
+        usage_var.set([]),
+    )
+    try:
+        request_json = request.get_json(silent=True)
+        if not request_json:
+            return _json_response({'error': 'No JSON data provided'}, 400, request_id)
+
+        result = analyze(request.path, request_json)
+        if result is None:
+            return _json_response({'message': 'Japer API is running'}, 200, request_id)
+        return _json_response(result, 200, request_id)
+
+    except ValueError as e:
+        return _json_response({'error': str(e)}, 400, request_id)
+    except CircuitOpenError:
+        return _json_response({'error': 'Analysis temporarily unavailable'}, 503, request_id)
+    except Exception:
+        logger.exception("Analysis failed", extra={'path': request.path})
+        return _json_response({'error': 'Analysis failed'}, 500, request_id)
+    finally:
+        usage_var.reset(tokens[2])
+        user_id_var.reset(tokens[1])
+        request_id_var.reset(tokens[0])
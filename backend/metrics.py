@@ -0,0 +1,317 @@
+"""Lightweight Prometheus-format metrics for the analysis pipeline.
+
+Only the three metric types we need are implemented, with the text
+exposition format rendered on demand by ``/metrics``. Recording an
+observation is a dict lookup plus a lock, so metrics can stay on in
+production.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from request_context import attach_stage_timing
+
+LabelValues = Tuple[str, ...]
+
+# Analysis calls run from ~50 ms (normalization) to well over 30 s (gpt-5 stages)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 20, 30, 45, 60, 90)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], *extra: str) -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    parts.extend(label for label in extra if label)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self, const: str = "") -> List[str]:
+        """Exposition lines; ``const`` is a preformatted label added to every sample"""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        lines.extend(self._samples(const))
+        return lines
+
+    def _samples(self, const: str) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self, const: str) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key, const)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    metric_type = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., +Inf count], sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = ([0] * (len(self.buckets) + 1), [0.0])
+                self._values[key] = entry
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def count(self, **labels: Any) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def _samples(self, const: str) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+        lines: List[str] = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, const, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key, const)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key, const)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, const_labels: Optional[Dict[str, str]] = None) -> str:
+        const = ",".join(f'{name}="{_escape(value)}"' for name, value in (const_labels or {}).items())
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render(const))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(
+    Histogram(
+        "food_analysis_stage_seconds",
+        "Duration of each analysis pipeline stage",
+        ("stage", "model"),
+    )
+)
+STAGE_ERRORS = REGISTRY.register(
+    Counter(
+        "food_analysis_stage_errors_total",
+        "Analysis stage failures by exception type",
+        ("stage", "model", "exception"),
+    )
+)
+REQUEST_SECONDS = REGISTRY.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "HTTP request duration by endpoint",
+        ("endpoint", "method", "status"),
+    )
+)
+REQUESTS_IN_FLIGHT = REGISTRY.register(
+    Gauge(
+        "http_requests_in_flight",
+        "Requests currently being processed by endpoint",
+        ("endpoint",),
+    )
+)
+REQUEST_ERRORS = REGISTRY.register(
+    Counter(
+        "http_request_errors_total",
+        "Unhandled request exceptions by endpoint and exception type",
+        ("endpoint", "exception"),
+    )
+)
+
+PROMPT_TOKENS = REGISTRY.register(
+    Counter(
+        "openai_prompt_tokens_total",
+        "Prompt tokens sent upstream, split by whether the prompt cache served them",
+        ("model", "operation", "cache"),
+    )
+)
+
+CIRCUIT_STATE = REGISTRY.register(
+    Gauge(
+        "openai_circuit_state",
+        "Circuit breaker state per model (0 closed, 1 half-open, 2 open)",
+        ("model",),
+    )
+)
+CIRCUIT_REJECTIONS = REGISTRY.register(
+    Counter(
+        "openai_circuit_rejections_total",
+        "Calls skipped because the model's circuit breaker was open",
+        ("model",),
+    )
+)
+
+EVENT_LOOP_LAG = REGISTRY.register(
+    Histogram(
+        "event_loop_lag_seconds",
+        "Delay between a scheduled event loop wakeup and when it actually ran",
+        buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    )
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@contextmanager
+def stage_timer(stage: str, model: str = "") -> Iterator[None]:
+    """Time a pipeline stage; failures are counted by exception type and re-raised"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as exc:
+        STAGE_ERRORS.inc(stage=stage, model=model, exception=type(exc).__name__)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage, model=model)
+        attach_stage_timing(stage, elapsed)
+
+
+async def monitor_event_loop_lag(interval_s: float) -> None:
+    """Sleep ``interval_s`` in a loop and record how late each wakeup was.
+
+    Blocking work on the event loop (sync OpenAI calls, image resizing) shows
+    up here long before it shows up in request latency percentiles.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval_s)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - start - interval_s))
+
+
+def render_metrics() -> str:
+    # Metrics are per process: under several serve.py workers each scrape
+    # reaches one of them, so its series carry a worker (pid) label
+    if os.getenv("METRICS_WORKER_LABEL"):
+        return REGISTRY.render({"worker": str(os.getpid())})
+    return REGISTRY.render()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-endpoint latency, in-flight requests and errors"""
+
+    def __init__(self, app: Any, endpoints: Optional[Sequence[str]] = None) -> None:
+        self.app = app
+        self._endpoints = set(endpoints) if endpoints is not None else None
+
+    def _endpoint(self, scope: Dict[str, Any]) -> str:
+        path = scope.get("path", "")
+        if self._endpoints is None:
+            # Label by registered route paths only, to keep label cardinality bounded
+            routes = getattr(scope.get("app"), "routes", [])
+            self._endpoints = {getattr(route, "path", "") for route in routes}
+        return path if path in self._endpoints else "other"
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = self._endpoint(scope)
+        status = {"code": 500}
+
+        async def _send(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc(endpoint=endpoint)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, _send)
+        except Exception as exc:
+            REQUEST_ERRORS.inc(endpoint=endpoint, exception=type(exc).__name__)
+            raise
+        finally:
+            REQUESTS_IN_FLIGHT.dec(endpoint=endpoint)
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                endpoint=endpoint,
+                method=scope.get("method", ""),
+                status=str(status["code"]),
+            )
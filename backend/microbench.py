@@ -0,0 +1,321 @@
+"""Microbenchmarks for the per-request hot path in ``food_analysis``.
+
+Each benchmark runs one function over a realistic generated payload (messy
+fenced model output, six-item meals, a 4000x3000 JPEG) and reports the best
+per-call time. Every repeat also times a fixed pure-Python calibration
+workload right before the benchmark; the median of the per-repeat ratios is
+what gets compared, so results recorded on one machine can be checked on
+another and a moment of CPU throttling scales both sides of a ratio.
+
+    python microbench.py                    # compare against microbench_baseline.json
+    python microbench.py --update-baseline  # record a new baseline
+
+Exits non-zero when any benchmark is slower than its baseline by more than
+``--threshold`` (default 30%), or by more than ``SUB_MS_THRESHOLD`` for
+benchmarks under a millisecond per call, whose timings jitter more.
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import food_analysis as fa
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "microbench_baseline.json")
+DEFAULT_THRESHOLD = 0.30
+# Sub-millisecond calls are dominated by allocator and cache effects
+SUB_MS_THRESHOLD = 0.50
+# Calibration calls timed before each repeat (~25 ms)
+CALIBRATION_NUMBER = 200
+
+ITEM_NAMES = [
+    ("grilled chicken breast", "150 g"),
+    ("steamed jasmine rice", "1 cup"),
+    ("black beans", "1/2 cup"),
+    ("avocado slices", "1/3 avocado"),
+    ("pico de gallo", "2 tbsp"),
+    ("sour cream", "1 tbsp"),
+]
+
+
+def generate_meal_payload(rng: random.Random, items: int = 6) -> Dict[str, Any]:
+    """Stage-2 style payload with the loose typing models actually return"""
+    payload_items = []
+    for name, portion in ITEM_NAMES[:items]:
+        protein, carbs, fats = rng.randint(1, 45), rng.randint(0, 60), rng.randint(0, 25)
+        payload_items.append(
+            {
+                "name": name,
+                "portion_text": portion,
+                "calories": f"{4 * protein + 4 * carbs + 9 * fats + rng.randint(-20, 20)} kcal",
+                "protein": protein,
+                "carbs": f"{carbs}g",
+                "fats": float(fats),
+                "confidence": rng.choice([0.4, "0.7", 0.85]),
+            }
+        )
+    return {
+        "meal_name": "Chicken burrito bowl",
+        "calories": "about 900",
+        "protein": 0,
+        "carbs": 0,
+        "fats": 0,
+        "confidence": "0.72",
+        "status": "complete",
+        "clarifying_question": None,
+        "assumptions": ["Rice cooked without oil", "Chicken grilled", "Rice cooked without oil"],
+        "flags": ["portion_estimated"],
+        "items": payload_items,
+    }
+
+
+def generate_fenced_output(rng: random.Random) -> str:
+    """Model output with prose around a fenced, pretty-printed JSON block"""
+    return (
+        "Sure! Here's my estimate for this meal based on the visible portions.\n\n"
+        "```json\n"
+        + json.dumps(generate_meal_payload(rng), indent=2)
+        + "\n```\n\nLet me know if the rice was cooked with butter, as that would change the totals."
+    )
+
+
+def generate_jpeg_b64(width: int = 4000, height: int = 3000, quality: int = 90) -> Optional[str]:
+    """A noisy photo-sized JPEG (noise keeps the encoded size realistic); None without Pillow"""
+    pil_image = fa._pil_image()
+    if pil_image is None:
+        return None
+    noise = pil_image.effect_noise((width // 4, height // 4), 48).resize((width, height))
+    image = pil_image.merge("RGB", (noise, noise.rotate(180), noise.transpose(0)))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+@dataclass
+class Microbenchmark:
+    name: str
+    setup: Callable[[], Optional[Callable[[], Any]]]  # returns None when unavailable
+    number: int
+    repeat: int = 11
+
+
+def _cycle(values: List[Any]) -> Callable[[], Any]:
+    state = {"i": 0}
+
+    def _next() -> Any:
+        state["i"] = (state["i"] + 1) % len(values)
+        return values[state["i"]]
+
+    return _next
+
+
+def _setup_coerce_int() -> Callable[[], Any]:
+    next_value = _cycle(["350", "~ 420 kcal", 12.6, "about 30g", None, 87, "-5"])
+    return lambda: fa._coerce_int(next_value())
+
+
+def _setup_extract_fenced() -> Callable[[], Any]:
+    raw = generate_fenced_output(random.Random(1))
+    return lambda: fa._extract_json_payload(raw)
+
+
+def _setup_extract_plain() -> Callable[[], Any]:
+    raw = json.dumps(generate_meal_payload(random.Random(2)))
+    return lambda: fa._extract_json_payload(raw)
+
+
+def _setup_parse_nutrition() -> Callable[[], Any]:
+    raw = generate_fenced_output(random.Random(3))
+    return lambda: fa.parse_nutrition_json(raw)
+
+
+def _setup_normalize() -> Callable[[], Any]:
+    payload = generate_meal_payload(random.Random(4))
+    return lambda: fa.normalize_food_analysis(payload)
+
+
+def _setup_response_revalidated() -> Callable[[], Any]:
+    """The route's old path: dump, rebuild, re-validate as response_model, encode, stdlib json"""
+    from fastapi.encoders import jsonable_encoder
+
+    payload = generate_meal_payload(random.Random(5))
+
+    def _respond() -> bytes:
+        result = fa._model_dump(fa.normalize_food_analysis(payload))
+        model = fa.FoodAnalysisResponseV2(**result)
+        validated = fa._model_validate(fa.FoodAnalysisResponseV2, fa._model_dump(model))
+        content = jsonable_encoder(validated)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    return _respond
+
+
+def _setup_response_single_pass() -> Callable[[], Any]:
+    """What the route does now: build the normalized model once, serialize it once"""
+    payload = generate_meal_payload(random.Random(5))
+    return lambda: fa.normalize_food_analysis(payload).model_dump_json().encode("utf-8")
+
+
+def _setup_schema_strict() -> Callable[[], Any]:
+    return lambda: fa._make_schema_strict(fa._model_schema(fa.ImageFusedAnalysisResponse))
+
+
+def _setup_resize() -> Optional[Callable[[], Any]]:
+    image_b64 = generate_jpeg_b64()
+    if image_b64 is None:
+        return None
+    return lambda: fa.resize_for_api(image_b64)
+
+
+BENCHMARKS = [
+    Microbenchmark("coerce_int/mixed", _setup_coerce_int, number=10_000),
+    Microbenchmark("extract_json_payload/fenced", _setup_extract_fenced, number=1_000),
+    Microbenchmark("extract_json_payload/plain", _setup_extract_plain, number=2_500),
+    Microbenchmark("parse_nutrition_json/fenced", _setup_parse_nutrition, number=1_000),
+    Microbenchmark("normalize_food_analysis/6_items", _setup_normalize, number=1_000),
+    Microbenchmark("image_response/revalidated", _setup_response_revalidated, number=500),
+    Microbenchmark("image_response/single_pass", _setup_response_single_pass, number=1_000),
+    Microbenchmark("make_schema_strict/fused_schema", _setup_schema_strict, number=100),
+    Microbenchmark("resize_for_api/4000x3000", _setup_resize, number=1, repeat=5),
+]
+
+
+def _per_call(fn: Callable[[], Any], number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return (time.perf_counter() - start) / number
+
+
+def _best_per_call(fn: Callable[[], Any], number: int, repeat: int) -> float:
+    fn()  # warm caches and lazy imports
+    return min(_per_call(fn, number) for _ in range(repeat))
+
+
+def measure(fn: Callable[[], Any], number: int, repeat: int) -> Tuple[float, float]:
+    """Best per-call seconds, and the median per-repeat ratio to the calibration workload"""
+    fn()  # warm caches and lazy imports
+    _calibration_workload()
+    best = float("inf")
+    ratios = []
+    for _ in range(repeat):
+        calibration = _per_call(_calibration_workload, CALIBRATION_NUMBER)
+        per_call = _per_call(fn, number)
+        best = min(best, per_call)
+        ratios.append(per_call / calibration)
+    return best, statistics.median(ratios)
+
+
+def _calibration_workload() -> None:
+    data = {"items": [{"name": f"item {i}", "calories": i * 13, "protein": i} for i in range(20)]}
+    json.loads(json.dumps(data))
+    sorted((str(i * 7919 % 104729) for i in range(200)))
+
+
+def calibrate() -> float:
+    """Per-call seconds of a fixed pure-Python workload on this machine"""
+    return _best_per_call(_calibration_workload, 500, 7)
+
+
+def run_suite(names: Optional[List[str]] = None, scale: float = 1.0) -> Dict[str, Any]:
+    calibration = calibrate()
+    results: Dict[str, Dict[str, float]] = {}
+    skipped: List[str] = []
+    for bench in BENCHMARKS:
+        if names and not any(bench.name.startswith(name) for name in names):
+            continue
+        fn = bench.setup()
+        if fn is None:
+            skipped.append(bench.name)
+            continue
+        per_call, normalized = measure(fn, max(1, int(bench.number * scale)), bench.repeat)
+        results[bench.name] = {
+            "us_per_call": round(per_call * 1e6, 3),
+            "normalized": round(normalized, 4),
+        }
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "pillow": fa._pil_image() is not None,
+        "calibration_us": round(calibration * 1e6, 3),
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """Per-benchmark ratios of normalized time against the baseline"""
+    rows = []
+    for name, result in current["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        ratio = result["normalized"] / previous["normalized"] if previous["normalized"] else 1.0
+        allowed = max(threshold, SUB_MS_THRESHOLD) if previous["us_per_call"] < 1000 else threshold
+        rows.append(
+            {
+                "name": name,
+                "baseline_us": previous["us_per_call"],
+                "current_us": result["us_per_call"],
+                "ratio": round(ratio, 3),
+                "regressed": ratio > 1 + allowed,
+            }
+        )
+    return rows
+
+
+def load_baseline(path: str = BASELINE_PATH) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as baseline_file:
+        return json.load(baseline_file)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Microbenchmark the food_analysis hot path")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline JSON path")
+    parser.add_argument("--update-baseline", action="store_true", help="Write results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown (0.3 = 30%%)")
+    parser.add_argument("--only", nargs="+", help="Benchmark name prefixes to run")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply iteration counts (e.g. 0.1 for a quick run)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run_suite(args.only, args.scale)
+    for name, result in report["results"].items():
+        print(f"{name:<36} {result['us_per_call']:>12.2f} us/call  ({result['normalized']:.3f} x calibration)")
+    for name in report["skipped"]:
+        print(f"{name:<36} skipped (Pillow not installed)")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump(report, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+        sys.exit(0)
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to create one")
+        sys.exit(0)
+
+    rows = compare(report, baseline, args.threshold)
+    print(f"\nAgainst baseline (threshold +{args.threshold:.0%}, +{max(args.threshold, SUB_MS_THRESHOLD):.0%} under 1 ms):")
+    for row in rows:
+        marker = "REGRESSED" if row["regressed"] else ("faster" if row["ratio"] < 1 else "ok")
+        print(f"  {row['name']:<36} {row['baseline_us']:>10.2f} -> {row['current_us']:<10.2f} us  x{row['ratio']:.2f}  {marker}")
+    if any(row["regressed"] for row in rows):
+        sys.exit(1)
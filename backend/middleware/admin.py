@@ -0,0 +1,27 @@
+import hmac
+import os
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+
+def is_admin_key(admin_key: Optional[str]) -> bool:
+    """True if the key matches ADMIN_API_KEY (always False when none is configured)"""
+    expected = os.getenv('ADMIN_API_KEY')
+    if not expected or not admin_key:
+        return False
+    return hmac.compare_digest(admin_key.encode(), expected.encode())
+
+
+async def require_admin(admin_key: Optional[str] = Header(None, alias="X-Admin-Key")) -> None:
+    """
+    Dependency restricting an endpoint to operators holding ADMIN_API_KEY
+
+    Usage:
+        @app.get("/admin/usage", dependencies=[Depends(require_admin)])
+
+    Raises:
+        HTTPException: 403 if the X-Admin-Key header is missing or wrong
+    """
+    if not is_admin_key(admin_key):
+        raise HTTPException(status_code=403, detail="Admin access required")
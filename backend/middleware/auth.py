@@ -1,9 +1,21 @@
 from fastapi import HTTPException, Header
-from typing import Optional
+from typing import Any, Dict, Optional
+import hashlib
 import jwt
+import logging
 import os
+import time
 from functools import lru_cache
 
+from cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+JWT_CLAIMS_CACHE_TTL_SECONDS = int(os.getenv('JWT_CLAIMS_CACHE_TTL_SECONDS', '300'))
+
+# sha256(token) -> verified claims; entries never outlive the token's own exp
+_claims_cache = shared_cache('jwt_claims', maxsize=100_000, ttl=JWT_CLAIMS_CACHE_TTL_SECONDS)
+
 
 @lru_cache()
 def get_supabase_jwt_secret():
@@ -48,7 +60,27 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> str:
         )
 
     token = parts[1]
+    cache_key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    payload = _claims_cache.get(cache_key)
+    if payload is None:
+        payload = _verify_token(token)
+        ttl = min(JWT_CLAIMS_CACHE_TTL_SECONDS, payload.get('exp', float('inf')) - time.time())
+        if ttl > 0:
+            _claims_cache.set(cache_key, payload, ttl=ttl)
+
+    # Extract user ID from token
+    user_id = payload.get('sub')
+    if not user_id:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid token: missing user ID"
+        )
+
+    return user_id
+
 
+def _verify_token(token: str) -> Dict[str, Any]:
+    """Verify a Supabase JWT and return its claims, raising 401 when invalid"""
     try:
         # Decode and verify JWT token
         secret = get_supabase_jwt_secret()
@@ -63,22 +95,14 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> str:
             )
         except jwt.InvalidAudienceError:
             # Fallback: decode without audience requirement
-            print("Warning: JWT token missing 'authenticated' audience, decoding without audience check")
+            logger.warning("JWT token missing 'authenticated' audience, decoding without audience check")
             payload = jwt.decode(
                 token,
                 secret,
                 algorithms=["HS256"]
             )
 
-        # Extract user ID from token
-        user_id = payload.get('sub')
-        if not user_id:
-            raise HTTPException(
-                status_code=401,
-                detail="Invalid token: missing user ID"
-            )
-
-        return user_id
+        return payload
 
     except jwt.ExpiredSignatureError:
         raise HTTPException(
@@ -86,7 +110,7 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> str:
             detail="Token has expired"
         )
     except jwt.InvalidTokenError as e:
-        print(f"JWT validation error: {type(e).__name__}: {str(e)}")
+        logger.info("JWT validation error: %s: %s", type(e).__name__, e)
         raise HTTPException(
             status_code=401,
             detail=f"Invalid token: {str(e)}"
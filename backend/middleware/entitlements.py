@@ -0,0 +1,116 @@
+import math
+import os
+import time
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+import jwt
+
+from cache import shared_cache
+from middleware.auth import get_supabase_jwt_secret
+
+ENTITLEMENT_AUDIENCE = "entitlement"
+ENTITLEMENT_ISSUER = "japer-backend"
+ENTITLEMENT_TTL_SECONDS = int(os.getenv('ENTITLEMENT_TTL_SECONDS', '300'))
+ENTITLEMENT_HEADER = "X-Entitlement-Token"
+
+# Shared across workers so a webhook handled by one worker revokes tokens on all of them
+# user_id -> epoch time (sub-second) at or before which issued tokens are no longer accepted
+_revoked_before = shared_cache('entitlement_revoked_before', maxsize=100_000, ttl=ENTITLEMENT_TTL_SECONDS + 60)
+# user_id -> token reissued after the latest webhook-driven state change
+_reissued_tokens = shared_cache('entitlement_reissued', maxsize=100_000, ttl=ENTITLEMENT_TTL_SECONDS)
+
+
+@lru_cache()
+def get_entitlement_secret() -> str:
+    """Signing secret for entitlement tokens, defaulting to the Supabase JWT secret"""
+    return os.getenv('ENTITLEMENT_TOKEN_SECRET') or get_supabase_jwt_secret()
+
+
+def issue_entitlement_token(
+    user_id: str, subscription_status: Dict[str, Any], issued_at: Optional[float] = None
+) -> str:
+    """
+    Sign a short-lived entitlement token for a user
+
+    Args:
+        user_id: Supabase user ID
+        subscription_status: Result of StripeService.get_subscription_status
+        issued_at: iat to sign with, defaulting to now
+
+    Returns:
+        HS256-signed JWT carrying has_access, tier, status and trial_ends_at
+    """
+    # Sub-second iat, so a token from earlier in the second a webhook revoked is rejected
+    now = time.time() if issued_at is None else issued_at
+    payload = {
+        'sub': user_id,
+        'aud': ENTITLEMENT_AUDIENCE,
+        'iss': ENTITLEMENT_ISSUER,
+        'iat': now,
+        'exp': int(now) + ENTITLEMENT_TTL_SECONDS,
+        'has_access': bool(subscription_status.get('has_access')),
+        'status': subscription_status.get('status'),
+        'tier': subscription_status.get('tier'),
+        'trial_ends_at': subscription_status.get('trial_ends_at'),
+    }
+    return jwt.encode(payload, get_entitlement_secret(), algorithm="HS256")
+
+
+def verify_entitlement_token(token: str, user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Verify an entitlement token locally, without any I/O
+
+    Args:
+        token: Token from the X-Entitlement-Token header
+        user_id: User the request is made for
+
+    Returns:
+        Token claims, or None if the token is invalid, expired, revoked or
+        was issued for another user
+    """
+    try:
+        secret = get_entitlement_secret()
+    except Exception:
+        return None
+
+    try:
+        claims = jwt.decode(
+            token,
+            secret,
+            algorithms=["HS256"],
+            audience=ENTITLEMENT_AUDIENCE,
+            issuer=ENTITLEMENT_ISSUER,
+        )
+    except jwt.InvalidTokenError:
+        return None
+
+    if claims.get('sub') != user_id:
+        return None
+
+    revoked_before = _revoked_before.get(user_id)
+    if revoked_before is not None and claims.get('iat', 0) <= revoked_before:
+        return None
+
+    return claims
+
+
+def reissue_entitlement_token(user_id: str, subscription_status: Dict[str, Any]) -> str:
+    """
+    Revoke previously issued tokens for a user and issue a fresh one
+
+    Called whenever a webhook changes the user's subscription state. The new
+    token is handed back on the user's next request.
+    """
+    revoked_at = time.time()
+    _revoked_before.set(user_id, revoked_at)
+    # Strictly after the revocation even when the clock has not ticked since
+    issued_at = max(time.time(), math.nextafter(revoked_at, math.inf))
+    token = issue_entitlement_token(user_id, subscription_status, issued_at=issued_at)
+    _reissued_tokens.set(user_id, token)
+    return token
+
+
+def get_reissued_token(user_id: str) -> Optional[str]:
+    """Token reissued by the latest webhook for this user, if any"""
+    return _reissued_tokens.get(user_id)
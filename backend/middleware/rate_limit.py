@@ -0,0 +1,314 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import Depends, Header, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from cache import SQLiteFile, shared_cache, shared_cache_path
+from middleware.auth import get_optional_user
+from middleware.entitlements import ENTITLEMENT_HEADER, verify_entitlement_token
+from stripe_service import StripeService
+
+try:
+    import redis as _redis
+    _REDIS_AVAILABLE = True
+except ImportError:
+    _REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class BucketPolicy:
+    """Token-bucket budget: ``capacity`` units of burst, refilled at ``refill_per_second``"""
+
+    capacity: float
+    refill_per_second: float
+
+
+# Relative cost of one request, roughly proportional to upstream spend:
+# image = two gpt-5-mini vision calls, audio = Whisper + one text call,
+# meal_image = per unit of /analyze_food/images (one for the shared calls
+# plus one per photo, so a single photo costs the same as 'image').
+REQUEST_COSTS: Dict[str, float] = {
+    'image': 4.0,
+    'meal_image': 2.0,
+    'audio': 2.0,
+    'text': 1.0,
+}
+
+# Budgets per subscription tier; users without access fall back to 'free'.
+DEFAULT_TIER_POLICIES: Dict[str, BucketPolicy] = {
+    'free': BucketPolicy(capacity=12, refill_per_second=6 / 60),
+    'monthly': BucketPolicy(capacity=40, refill_per_second=30 / 60),
+    'yearly': BucketPolicy(capacity=40, refill_per_second=30 / 60),
+}
+
+TIER_CACHE_TTL_SECONDS = 60
+MAX_TRACKED_USERS = 100_000
+
+
+def load_tier_policies() -> Dict[str, BucketPolicy]:
+    """
+    Tier budgets, optionally overridden by RATE_LIMIT_POLICIES
+
+    RATE_LIMIT_POLICIES is JSON, e.g. {"free": {"capacity": 8, "per_minute": 4}}
+    """
+    policies = dict(DEFAULT_TIER_POLICIES)
+    raw = os.getenv('RATE_LIMIT_POLICIES')
+    if raw:
+        for tier, spec in json.loads(raw).items():
+            policies[tier] = BucketPolicy(
+                capacity=float(spec['capacity']),
+                refill_per_second=float(spec['per_minute']) / 60,
+            )
+    return policies
+
+
+class InMemoryBucketStore:
+    """
+    Per-process token buckets
+
+    Each user costs one fixed-size entry; the least recently active users are
+    dropped once MAX_TRACKED_USERS is reached (a dropped user simply starts
+    again with a full bucket).
+    """
+
+    def __init__(self, max_users: int = MAX_TRACKED_USERS) -> None:
+        self.max_users = max_users
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, cost: float, policy: BucketPolicy) -> Tuple[bool, float]:
+        """Consume ``cost`` units; returns (allowed, seconds until enough units are available)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (policy.capacity, now))
+            tokens = min(policy.capacity, tokens + (now - updated_at) * policy.refill_per_second)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+
+        if allowed:
+            return True, 0.0
+        return False, (cost - tokens) / policy.refill_per_second
+
+
+# Atomic refill-and-take; state is a two-field hash that expires once full again.
+_REDIS_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBucketStore:
+    """Token buckets shared by every worker and instance through Redis"""
+
+    def __init__(self, url: str, prefix: str = 'ratelimit:') -> None:
+        if not _REDIS_AVAILABLE:
+            raise RuntimeError("redis package is required for RATE_LIMIT_REDIS_URL")
+        self._client = _redis.Redis.from_url(url)
+        self._take = self._client.register_script(_REDIS_TAKE_SCRIPT)
+        self._prefix = prefix
+
+    def take(self, key: str, cost: float, policy: BucketPolicy) -> Tuple[bool, float]:
+        allowed, tokens = self._take(
+            keys=[self._prefix + key],
+            args=[policy.capacity, policy.refill_per_second, cost, time.time()],
+        )
+        if allowed:
+            return True, 0.0
+        return False, (cost - float(tokens)) / policy.refill_per_second
+
+
+class SQLiteBucketStore:
+    """
+    Token buckets shared by the worker processes on one host through a SQLite file
+
+    Every ``_PRUNE_EVERY`` takes, rows idle long enough to have refilled a
+    full bucket under any policy seen so far are deleted; a missing row reads
+    as a full bucket, so the table only holds recently active users.
+    """
+
+    _PRUNE_EVERY = 256
+
+    def __init__(self, path: str) -> None:
+        self._db = SQLiteFile(path)
+        self._db.connection().execute(
+            "CREATE TABLE IF NOT EXISTS ratelimit_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, ts REAL NOT NULL)"
+        )
+        self._takes = 0
+        self._refill_horizon = 0.0
+
+    def take(self, key: str, cost: float, policy: BucketPolicy) -> Tuple[bool, float]:
+        conn = self._db.connection()
+        now = time.time()
+        # IMMEDIATE takes the write lock up front so the refill-and-take is atomic across workers
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, ts FROM ratelimit_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated_at = row if row else (policy.capacity, now)
+            tokens = min(policy.capacity, tokens + max(0.0, now - updated_at) * policy.refill_per_second)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute("INSERT OR REPLACE INTO ratelimit_buckets (key, tokens, ts) VALUES (?, ?, ?)", (key, tokens, now))
+            self._takes += 1
+            self._refill_horizon = max(self._refill_horizon, policy.capacity / policy.refill_per_second)
+            if self._takes % self._PRUNE_EVERY == 0:
+                self._prune(conn, now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        if allowed:
+            return True, 0.0
+        return False, (cost - tokens) / policy.refill_per_second
+
+    def _prune(self, conn: Any, now: float) -> None:
+        conn.execute("DELETE FROM ratelimit_buckets WHERE ts <= ?", (now - self._refill_horizon,))
+
+
+def _build_store() -> Any:
+    url = os.getenv('RATE_LIMIT_REDIS_URL')
+    if url:
+        return RedisBucketStore(url)
+    # Fall back to the shared cache backend so multi-worker deployments share budgets
+    shared_url = os.getenv('SHARED_CACHE_URL', '')
+    if shared_url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBucketStore(shared_url)
+    shared_path = shared_cache_path(shared_url)
+    if shared_path:
+        return SQLiteBucketStore(shared_path)
+    return InMemoryBucketStore()
+
+
+_store: Optional[Any] = None
+_policies: Optional[Dict[str, BucketPolicy]] = None
+_tier_cache = shared_cache('subscription_status', maxsize=MAX_TRACKED_USERS, ttl=TIER_CACHE_TTL_SECONDS)
+
+
+def get_bucket_store() -> Any:
+    global _store
+    if _store is None:
+        _store = _build_store()
+    return _store
+
+
+def get_tier_policies() -> Dict[str, BucketPolicy]:
+    global _policies
+    if _policies is None:
+        _policies = load_tier_policies()
+    return _policies
+
+
+def rate_limiting_enabled() -> bool:
+    return os.getenv('RATE_LIMIT_ENABLED', '1').lower() not in ('0', 'false', 'no')
+
+
+def resolve_tier(user_id: str, entitlement_token: Optional[str] = None) -> str:
+    """
+    Budget tier for a user: entitlement claims first (no I/O), then a cached status lookup
+
+    Returns:
+        'free' unless the user currently has access on a known tier
+    """
+    status = verify_entitlement_token(entitlement_token, user_id) if entitlement_token else None
+    if status is None:
+        status = _tier_cache.get(user_id)
+        if status is None:
+            try:
+                status = StripeService.get_subscription_status(user_id, raise_errors=True)
+            except Exception as e:
+                # Budget as free without caching it, so the next request retries the lookup
+                logger.warning("Subscription lookup failed, using free tier", extra={"uid": user_id, "error": str(e)})
+                return 'free'
+            _tier_cache.set(user_id, status)
+
+    tier = status.get('tier')
+    if status.get('has_access') and tier in get_tier_policies():
+        return tier
+    return 'free'
+
+
+def _take(user_id: str, entitlement_token: Optional[str], cost: float) -> Tuple[bool, float, str]:
+    """Resolve the tier and take ``cost`` from the user's bucket (blocking I/O)"""
+    tier = resolve_tier(user_id, entitlement_token)
+    allowed, retry_after = get_bucket_store().take(user_id, cost, get_tier_policies()[tier])
+    return allowed, retry_after, tier
+
+
+def _one_unit() -> float:
+    return 1.0
+
+
+def rate_limit(kind: str, units: Callable[..., float] = _one_unit):
+    """
+    Dependency factory enforcing the per-user budget for one request kind
+
+    ``units`` is itself a dependency (it may take the request body) and
+    scales the kind's cost for requests whose upstream spend varies.
+
+    Usage:
+        @app.post("/analyze_food/image", dependencies=[Depends(rate_limit('image'))])
+
+    Raises:
+        HTTPException: 429 with Retry-After once the user's bucket is empty
+    """
+    unit_cost = REQUEST_COSTS[kind]
+
+    async def _check(
+        user_id: Optional[str] = Header(None, alias="X-User-ID"),
+        authorization: Optional[str] = Header(None),
+        entitlement_token: Optional[str] = Header(None, alias=ENTITLEMENT_HEADER),
+        count: float = Depends(units),
+    ) -> None:
+        if not rate_limiting_enabled():
+            return
+
+        # The verified JWT subject wins: X-User-ID is client-supplied and only
+        # identifies requests that carry no valid token
+        key = (await get_optional_user(authorization) if authorization else None) or user_id
+        if not key:
+            return
+
+        # The tier lookup and the SQLite/Redis bucket stores block; keep them off the event loop
+        allowed, retry_after, tier = await run_in_threadpool(_take, key, entitlement_token, unit_cost * count)
+        if not allowed:
+            raise HTTPException(
+                status_code=429,
+                detail={
+                    "error": "rate_limited",
+                    "message": "Too many analysis requests, please retry later",
+                    "tier": tier,
+                },
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+
+    return _check
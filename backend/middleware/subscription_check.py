@@ -1,12 +1,47 @@
-from fastapi import HTTPException, Header
-from typing import Optional
+import logging
+from datetime import datetime, timezone
+from fastapi import HTTPException, Header, Response
+from typing import Any, Dict, Optional
 from stripe_service import StripeService
+from middleware.entitlements import (
+    ENTITLEMENT_HEADER,
+    get_reissued_token,
+    issue_entitlement_token,
+    verify_entitlement_token,
+)
 
+logger = logging.getLogger(__name__)
 
-async def require_subscription(user_id: Optional[str] = Header(None, alias="X-User-ID")):
+
+def _status_from_claims(claims: Dict[str, Any]) -> Dict[str, Any]:
+    """Rebuild the access decision from entitlement claims, enforcing trial expiry locally"""
+    has_access = bool(claims.get('has_access'))
+    trial_ends_at = claims.get('trial_ends_at')
+    if has_access and trial_ends_at and claims.get('status') not in ('active', 'trialing'):
+        trial_end_date = datetime.fromisoformat(trial_ends_at.replace('Z', '+00:00'))
+        if trial_end_date.tzinfo is None:
+            trial_end_date = trial_end_date.replace(tzinfo=timezone.utc)
+        has_access = datetime.now(timezone.utc) < trial_end_date
+    return {
+        'status': claims.get('status'),
+        'tier': claims.get('tier'),
+        'trial_ends_at': trial_ends_at,
+        'has_access': has_access,
+    }
+
+
+async def require_subscription(
+    response: Response,
+    user_id: Optional[str] = Header(None, alias="X-User-ID"),
+    entitlement_token: Optional[str] = Header(None, alias=ENTITLEMENT_HEADER),
+):
     """
     Dependency to check if user has an active subscription
 
+    A valid X-Entitlement-Token is checked locally with no I/O. Without one,
+    the subscription status is looked up and a fresh token is returned in the
+    X-Entitlement-Token response header for the client to send next time.
+
     Usage:
         @app.post("/premium-endpoint", dependencies=[Depends(require_subscription)])
         async def premium_endpoint(user_id: str = Header(..., alias="X-User-ID")):
@@ -14,6 +49,7 @@ async def require_subscription(user_id: Optional[str] = Header(None, alias="X-Us
 
     Args:
         user_id: User ID passed in X-User-ID header
+        entitlement_token: Entitlement token previously issued by the backend
 
     Raises:
         HTTPException: If user doesn't have active subscription
@@ -24,8 +60,19 @@ async def require_subscription(user_id: Optional[str] = Header(None, alias="X-Us
             detail="User ID header (X-User-ID) is required"
         )
 
-    # Get subscription status
-    status = StripeService.get_subscription_status(user_id)
+    claims = verify_entitlement_token(entitlement_token, user_id) if entitlement_token else None
+    if claims is not None:
+        status = _status_from_claims(claims)
+        reissued = get_reissued_token(user_id)
+        if reissued and reissued != entitlement_token:
+            response.headers[ENTITLEMENT_HEADER] = reissued
+    else:
+        # Get subscription status
+        status = StripeService.get_subscription_status(user_id)
+        try:
+            response.headers[ENTITLEMENT_HEADER] = issue_entitlement_token(user_id, status)
+        except Exception as e:
+            logger.warning("Could not issue entitlement token: %s", e)
 
     # Check if user has access
     if not status['has_access']:
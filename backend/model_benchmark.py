@@ -3,18 +3,28 @@
 from __future__ import annotations
 
 import argparse
+import base64
 import csv
+import json
 import os
+import random
 import re
 import statistics
+import threading
 import time
-from dataclasses import dataclass
-from typing import Dict, Iterable, List, Optional, Tuple
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
 
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, RateLimitError
 
+import food_analysis as fa
+from bench_asgi import percentile
+from circuit_breaker import CircuitOpenError
 from food_analysis import parse_nutrition_json as _parse_nutrition_json
+from request_context import get_stage_timings, get_usage_records, stage_timings_var, usage_var
 
 
 WORD_TO_NUMBER = {
@@ -260,6 +270,122 @@ def run_single_prompt(client: OpenAI, model: str, description: str) -> RunResult
     )
 
 
+T = TypeVar("T")
+J = TypeVar("J")
+
+
+def _retry_after_seconds(exc: RateLimitError) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class TrialScheduler:
+    """
+    Runs benchmark calls with a global and a per-model concurrency limit
+
+    A 429 from a model pauses every worker calling that model for the
+    server-provided Retry-After (or an exponential backoff with jitter)
+    before the call is retried. A ``CircuitOpenError`` from the production
+    pipeline does the same for the breaker's ``retry_after``.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 1,
+        per_model_concurrency: Optional[int] = None,
+        max_retries: int = 6,
+        base_backoff_s: float = 2.0,
+        max_backoff_s: float = 60.0,
+    ) -> None:
+        self.concurrency = max(1, concurrency)
+        self.per_model_concurrency = max(1, per_model_concurrency or self.concurrency)
+        self.max_retries = max_retries
+        self.base_backoff_s = base_backoff_s
+        self.max_backoff_s = max_backoff_s
+        self._lock = threading.Lock()
+        self._cooldown_until: Dict[str, float] = {}
+        self.rate_limited = 0
+        self.circuit_open = 0
+
+    def _wait_for_cooldown(self, model: str) -> None:
+        while True:
+            with self._lock:
+                remaining = self._cooldown_until.get(model, 0.0) - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def call(self, model: str, fn: Callable[[], T]) -> T:
+        attempt = 0
+        while True:
+            self._wait_for_cooldown(model)
+            try:
+                return fn()
+            except (RateLimitError, CircuitOpenError) as exc:
+                if attempt >= self.max_retries:
+                    raise
+                if isinstance(exc, CircuitOpenError):
+                    delay = exc.retry_after
+                    reason = "circuit open"
+                else:
+                    delay = _retry_after_seconds(exc)
+                    if delay is None:
+                        delay = min(self.max_backoff_s, self.base_backoff_s * 2**attempt) * random.uniform(0.5, 1.0)
+                    reason = "rate limited"
+                with self._lock:
+                    if isinstance(exc, CircuitOpenError):
+                        self.circuit_open += 1
+                    else:
+                        self.rate_limited += 1
+                    until = time.monotonic() + delay
+                    self._cooldown_until[model] = max(self._cooldown_until.get(model, 0.0), until)
+                print(f"  {model}: {reason}, backing off {delay:.1f}s")
+                attempt += 1
+
+    def map(self, jobs: List[Tuple[str, J]], fn: Callable[[str, J], T]) -> Iterator[Tuple[int, str, J, Any]]:
+        """
+        Run ``fn(model, job)`` for every job, yielding ``(index, model, job, result)``
+        as calls finish; ``result`` is the raised exception for failed calls.
+        Jobs run inline, in order, when the global concurrency is 1.
+        """
+        if self.concurrency == 1:
+            for index, (model, job) in enumerate(jobs):
+                try:
+                    result: Any = self.call(model, lambda: fn(model, job))
+                except Exception as exc:  # noqa: BLE001
+                    result = exc
+                yield index, model, job, result
+            return
+
+        pending = list(enumerate(jobs))
+        in_flight: Dict[str, int] = {}
+        futures: Dict[Future, Tuple[int, str, J]] = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while pending or futures:
+                # Fill free global slots with the earliest jobs whose model has capacity
+                for item in list(pending):
+                    if len(futures) >= self.concurrency:
+                        break
+                    index, (model, job) = item
+                    if in_flight.get(model, 0) >= self.per_model_concurrency:
+                        continue
+                    pending.remove(item)
+                    in_flight[model] = in_flight.get(model, 0) + 1
+                    future = executor.submit(self.call, model, lambda m=model, j=job: fn(m, j))
+                    futures[future] = (index, model, job)
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, model, job = futures.pop(future)
+                    in_flight[model] -= 1
+                    exc = future.exception()
+                    yield index, model, job, exc if exc is not None else future.result()
+
+
 def summarize_runs(runs: List[RunResult], truth: Dict[str, int]) -> Dict[str, Dict[str, float]]:
     if not runs:
         return {}
@@ -360,29 +486,50 @@ def write_csv_report(
 
 
 def run_benchmark(
-    models: List[str], runs: int, description: str, truth: Dict[str, int]
+    models: List[str],
+    runs: int,
+    description: str,
+    truth: Dict[str, int],
+    concurrency: int = 1,
+    per_model_concurrency: Optional[int] = None,
 ) -> Tuple[Dict[str, Dict[str, Dict[str, float]]], Dict[str, List[RunResult]]]:
     client = build_client()
+    scheduler = TrialScheduler(concurrency, per_model_concurrency)
     summaries: Dict[str, Dict[str, Dict[str, float]]] = {}
-    detailed_runs: Dict[str, List[RunResult]] = {model: [] for model in models}
+    trial_results: Dict[str, List[Optional[RunResult]]] = {model: [None] * runs for model in models}
 
-    for model in models:
-        print(f"\nRunning {runs} trial(s) for {model}...")
-        for i in range(runs):
-            try:
-                result = run_single_prompt(client, model, description)
-                detailed_runs[model].append(result)
-                print(
-                    f"  Trial {i + 1}: {result.calories} kcal, P{result.protein}/C{result.carbs}/F{result.fats} g "
-                    f"({result.meal_name}) in {result.duration_s:.2f}s"
-                )
-            except Exception as exc:  # noqa: BLE001
-                print(f"  Trial {i + 1} failed: {exc}")
+    jobs = [(model, trial) for model in models for trial in range(runs)]
+    if scheduler.concurrency > 1:
+        print(
+            f"\nRunning {runs} trial(s) for {len(models)} model(s), "
+            f"{scheduler.concurrency} at a time ({scheduler.per_model_concurrency} per model)..."
+        )
+    for _, model, trial, result in scheduler.map(jobs, lambda m, _: run_single_prompt(client, m, description)):
+        if scheduler.concurrency == 1 and trial == 0:
+            print(f"\nRunning {runs} trial(s) for {model}...")
+        label = f"  Trial {trial + 1}" if scheduler.concurrency == 1 else f"  {model} trial {trial + 1}"
+        if isinstance(result, Exception):
+            print(f"{label} failed: {result}")
+            continue
+        trial_results[model][trial] = result
+        print(
+            f"{label}: {result.calories} kcal, P{result.protein}/C{result.carbs}/F{result.fats} g "
+            f"({result.meal_name}) in {result.duration_s:.2f}s"
+        )
 
+    # Keep trial order so summaries and CSVs match the sequential mode
+    detailed_runs: Dict[str, List[RunResult]] = {
+        model: [run for run in trial_results[model] if run is not None] for model in models
+    }
+    for model in models:
         if detailed_runs[model]:
             summaries[model] = summarize_runs(detailed_runs[model], truth)
         else:
             print(f"  Skipping summary for {model}; no successful runs.")
+    if scheduler.rate_limited:
+        print(f"\nBacked off {scheduler.rate_limited} time(s) after 429 responses.")
+    if scheduler.circuit_open:
+        print(f"\nBacked off {scheduler.circuit_open} time(s) for open circuit breakers.")
 
     print("\nBenchmark summary (closer to zero is better):")
     if summaries:
@@ -403,6 +550,376 @@ def run_benchmark(
     return summaries, detailed_runs
 
 
+NUTRIENTS = ("calories", "protein", "carbs", "fats")
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+CASE_FIELDNAMES = [
+    "model",
+    "case_id",
+    "kind",
+    "trial",
+    "status",
+    "meal_name",
+    "calories",
+    "protein",
+    "carbs",
+    "fats",
+    "abs_err_calories",
+    "abs_err_protein",
+    "abs_err_carbs",
+    "abs_err_fats",
+    "duration_s",
+    "prompt_tokens",
+    "cached_tokens",
+    "completion_tokens",
+    "cost_usd",
+    "resize_s",
+    "payload_kb",
+    "stage_latency_s",
+    "error",
+]
+
+
+@dataclass
+class BenchmarkCase:
+    case_id: str
+    kind: str  # "text" or "image"
+    truth: Dict[str, int]
+    description: Optional[str] = None
+    image_path: Optional[str] = None
+    context_text: Optional[str] = None
+
+
+@dataclass
+class CaseResult:
+    model: str
+    case_id: str
+    kind: str
+    trial: int
+    duration_s: float
+    nutrition: Optional[Dict[str, Any]] = None
+    abs_errors: Optional[Dict[str, int]] = None
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+    stage_s: Dict[str, float] = field(default_factory=dict)
+    payload_kb: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def needs_clarification(self) -> bool:
+        return bool(self.nutrition) and self.nutrition.get("status") == "needs_clarification"
+
+    def to_row(self) -> Dict[str, Any]:
+        nutrition = self.nutrition or {}
+        errors = self.abs_errors or {}
+        return {
+            "model": self.model,
+            "case_id": self.case_id,
+            "kind": self.kind,
+            "trial": self.trial + 1,
+            "status": "error" if self.error else nutrition.get("status", "complete"),
+            "meal_name": nutrition.get("meal_name", ""),
+            **{nutrient: nutrition.get(nutrient, "") for nutrient in NUTRIENTS},
+            **{f"abs_err_{nutrient}": errors.get(nutrient, "") for nutrient in NUTRIENTS},
+            "duration_s": f"{self.duration_s:.3f}",
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": f"{self.cost_usd:.6f}",
+            "resize_s": f"{self.stage_s['resize']:.3f}" if "resize" in self.stage_s else "",
+            "payload_kb": f"{self.payload_kb:.1f}" if self.payload_kb is not None else "",
+            "stage_latency_s": ";".join(f"{stage}={seconds:.3f}" for stage, seconds in self.stage_s.items()),
+            "error": self.error or "",
+        }
+
+
+def _resolve_case_path(path: str, dataset_dir: str) -> str:
+    for candidate in (path, os.path.join(dataset_dir, path), os.path.join(REPO_ROOT, path)):
+        if os.path.exists(candidate):
+            return candidate
+    raise FileNotFoundError(f"Image not found: {path}")
+
+
+def load_dataset(path: str) -> List[BenchmarkCase]:
+    """
+    Read benchmark cases from JSONL
+
+    Each line has either ``description`` or ``image`` (a path, e.g. under
+    ``test_cases/``), optional ``id`` and ``context_text``, and ground-truth
+    macros either under ``truth`` or at the top level. Missing nutrients are
+    left out of the error metrics.
+    """
+    dataset_dir = os.path.dirname(os.path.abspath(path))
+    cases: List[BenchmarkCase] = []
+    with open(path, "r", encoding="utf-8") as dataset_file:
+        for line_number, line in enumerate(dataset_file, start=1):
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            entry = json.loads(line)
+            truth_source = entry.get("truth", entry)
+            truth = {n: _coerce_int(truth_source[n]) for n in NUTRIENTS if truth_source.get(n) is not None}
+            if entry.get("image"):
+                image_path = _resolve_case_path(entry["image"], dataset_dir)
+                case_id = entry.get("id") or os.path.relpath(image_path, REPO_ROOT)
+                cases.append(
+                    BenchmarkCase(case_id, "image", truth, image_path=image_path, context_text=entry.get("context_text"))
+                )
+            elif entry.get("description"):
+                cases.append(BenchmarkCase(entry.get("id") or f"case-{line_number}", "text", truth, entry["description"]))
+            else:
+                raise ValueError(f"{path}:{line_number}: case needs a description or an image")
+    return cases
+
+
+class _PayloadMeter:
+    """Client wrapper measuring the inline image bytes actually sent to the API"""
+
+    def __init__(self, client: Any) -> None:
+        self._client = client
+        self.image_bytes = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs: Any) -> Any:
+        for message in kwargs.get("messages", []):
+            content = message.get("content")
+            if isinstance(content, list):
+                for part in content:
+                    if isinstance(part, dict) and part.get("type") == "image_url":
+                        self.image_bytes += len(part["image_url"].get("url", ""))
+        return self._client.chat.completions.create(**kwargs)
+
+
+def run_case(
+    client: OpenAI,
+    model: str,
+    case: BenchmarkCase,
+    trial: int,
+    max_image_px: int = fa._MAX_IMAGE_PX,
+    fused: bool = False,
+) -> CaseResult:
+    """Run one case through the production analysis path, collecting its usage and stage timings"""
+    image_data = None
+    if case.kind == "image":
+        with open(case.image_path, "rb") as image_file:
+            image_data = base64.b64encode(image_file.read()).decode("utf-8")
+
+    metered = _PayloadMeter(client)
+    tokens = (usage_var.set([]), stage_timings_var.set([]))
+    start = time.perf_counter()
+    try:
+        if case.kind == "image":
+            nutrition = fa.analyze_image(
+                metered,
+                image_data=image_data,
+                context_text=case.context_text,
+                model=model,
+                max_px=max_image_px,
+                fused=fused,
+            )
+        else:
+            nutrition = fa.analyze_text(metered, case.description, model=model)
+        duration = time.perf_counter() - start
+        records = get_usage_records()
+        stage_s: Dict[str, float] = {}
+        for stage, seconds in get_stage_timings():
+            stage_s[stage] = stage_s.get(stage, 0.0) + seconds
+    finally:
+        stage_timings_var.reset(tokens[1])
+        usage_var.reset(tokens[0])
+
+    return CaseResult(
+        model=model,
+        case_id=case.case_id,
+        kind=case.kind,
+        trial=trial,
+        duration_s=duration,
+        nutrition=nutrition,
+        abs_errors={n: abs(_coerce_int(nutrition.get(n, 0)) - truth) for n, truth in case.truth.items()},
+        prompt_tokens=sum(r.prompt_tokens for r in records),
+        cached_tokens=sum(r.cached_tokens for r in records),
+        completion_tokens=sum(r.completion_tokens for r in records),
+        cost_usd=sum(r.cost_usd for r in records),
+        stage_s=stage_s,
+        payload_kb=metered.image_bytes / 1024 if case.kind == "image" else None,
+    )
+
+
+def summarize_case_results(results: List[CaseResult]) -> Dict[str, Any]:
+    """MAE per nutrient, latency percentiles, tokens and time per case"""
+    ok = [r for r in results if r.error is None]
+    durations = [r.duration_s for r in ok]
+    summary: Dict[str, Any] = {"runs": len(results), "errors": len(results) - len(ok)}
+    for nutrient in NUTRIENTS:
+        errors = [r.abs_errors[nutrient] for r in ok if r.abs_errors and nutrient in r.abs_errors]
+        summary[f"mae_{nutrient}"] = statistics.mean(errors) if errors else None
+    summary["latency_s"] = {
+        "mean": statistics.mean(durations) if durations else 0.0,
+        "p50": percentile(durations, 50),
+        "p90": percentile(durations, 90),
+        "p99": percentile(durations, 99),
+    }
+    summary["tokens_per_case"] = (
+        statistics.mean(r.prompt_tokens + r.completion_tokens for r in ok) if ok else 0.0
+    )
+    summary["cost_per_case_usd"] = statistics.mean(r.cost_usd for r in ok) if ok else 0.0
+    prompt_tokens = sum(r.prompt_tokens for r in ok)
+    summary["cached_token_ratio"] = sum(r.cached_tokens for r in ok) / prompt_tokens if prompt_tokens else 0.0
+    summary["clarification_rate"] = sum(r.needs_clarification for r in ok) / len(ok) if ok else 0.0
+    stages = sorted({stage for r in ok for stage in r.stage_s})
+    summary["stage_latency_s"] = {
+        stage: statistics.mean(r.stage_s[stage] for r in ok if stage in r.stage_s) for stage in stages
+    }
+    payloads = [r.payload_kb for r in ok if r.payload_kb is not None]
+    summary["payload_kb"] = statistics.mean(payloads) if payloads else None
+    return summary
+
+
+def _fmt_mae(value: Optional[float]) -> str:
+    return f"{value:7.1f}" if value is not None else "      -"
+
+
+def format_dataset_table(rows: Dict[str, Dict[str, Any]], label: str) -> str:
+    width = max([len(label)] + [len(name) for name in rows])
+    header = (
+        label.ljust(width)
+        + " | Runs | Err | MAE cal | MAE pro | MAE carb | MAE fat |  p50 s |  p90 s |  p99 s | Tokens/case | Cached %"
+    )
+    lines = [header, "-" * len(header)]
+    for name, summary in rows.items():
+        latency = summary["latency_s"]
+        lines.append(
+            name.ljust(width)
+            + f" | {summary['runs']:4d} | {summary['errors']:3d}"
+            + f" | {_fmt_mae(summary['mae_calories'])} | {_fmt_mae(summary['mae_protein'])}"
+            + f" | {_fmt_mae(summary['mae_carbs'])}  | {_fmt_mae(summary['mae_fats'])}"
+            + f" | {latency['p50']:6.2f} | {latency['p90']:6.2f} | {latency['p99']:6.2f}"
+            + f" | {summary['tokens_per_case']:11.0f}"
+            + f" | {summary['cached_token_ratio'] * 100:8.1f}"
+        )
+    return "\n".join(lines)
+
+
+def format_image_table(rows: Dict[str, Dict[str, Any]]) -> str:
+    stages = sorted({stage for summary in rows.values() for stage in summary["stage_latency_s"]} - {"resize"})
+    header = "Model".ljust(20) + " | Payload KB | Resize s | " + " | ".join(s[:24].rjust(10) for s in stages)
+    header += " | Clarify %"
+    lines = [header, "-" * len(header)]
+    for name, summary in rows.items():
+        stage_latency = summary["stage_latency_s"]
+        payload = summary["payload_kb"]
+        lines.append(
+            name[:20].ljust(20)
+            + (f" | {payload:10.1f}" if payload is not None else " |          -")
+            + f" | {stage_latency.get('resize', 0.0):8.3f} | "
+            + " | ".join(f"{stage_latency.get(stage, 0.0):{max(10, len(stage[:24]))}.2f}" for stage in stages)
+            + f" | {summary['clarification_rate'] * 100:9.1f}"
+        )
+    return "\n".join(lines)
+
+
+def load_image_dir_cases(directories: List[str]) -> List[BenchmarkCase]:
+    """
+    Image cases for ``test_cases/`` folders (names or paths)
+
+    Ground truth comes from ``datasets/test_cases_<folder>.jsonl`` when one
+    exists; other images are timed but not scored.
+    """
+    datasets_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "datasets")
+    cases: List[BenchmarkCase] = []
+    for directory in directories:
+        path = directory if os.path.isdir(directory) else os.path.join(REPO_ROOT, "test_cases", directory)
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"Test case folder not found: {directory}")
+        truth_file = os.path.join(datasets_dir, f"test_cases_{os.path.basename(os.path.normpath(path))}.jsonl")
+        known = {
+            os.path.abspath(case.image_path): case
+            for case in (load_dataset(truth_file) if os.path.exists(truth_file) else [])
+        }
+        for name in sorted(os.listdir(path)):
+            if os.path.splitext(name)[1].lower() not in (".jpg", ".jpeg", ".png"):
+                continue
+            image_path = os.path.join(path, name)
+            case = known.get(os.path.abspath(image_path))
+            cases.append(
+                case
+                or BenchmarkCase(os.path.relpath(image_path, REPO_ROOT), "image", {}, image_path=image_path)
+            )
+    return cases
+
+
+def run_dataset_benchmark(
+    models: List[str],
+    runs: int,
+    cases: List[BenchmarkCase],
+    csv_output: Optional[str] = None,
+    concurrency: int = 1,
+    per_model_concurrency: Optional[int] = None,
+    client: Optional[OpenAI] = None,
+    max_image_px: int = fa._MAX_IMAGE_PX,
+    fused: bool = False,
+) -> Tuple[Dict[str, Dict[str, Any]], List[CaseResult]]:
+    """Run every case for every model, streaming one CSV row per finished run"""
+    client = client or build_client()
+    scheduler = TrialScheduler(concurrency, per_model_concurrency)
+    jobs = [(model, (case, trial)) for model in models for case in cases for trial in range(runs)]
+    results: List[CaseResult] = []
+
+    csv_file = None
+    writer = None
+    if csv_output:
+        directory = os.path.dirname(csv_output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        csv_file = open(csv_output, "w", newline="", encoding="utf-8")
+        writer = csv.DictWriter(csv_file, fieldnames=CASE_FIELDNAMES)
+        writer.writeheader()
+
+    print(f"\nRunning {len(cases)} case(s) x {runs} trial(s) for {len(models)} model(s)...")
+    try:
+        for _, model, (case, trial), outcome in scheduler.map(
+            jobs, lambda m, job: run_case(client, m, job[0], job[1], max_image_px, fused)
+        ):
+            if isinstance(outcome, Exception):
+                outcome = CaseResult(model, case.case_id, case.kind, trial, 0.0, error=str(outcome))
+                print(f"  {model} {case.case_id} trial {trial + 1} failed: {outcome.error}")
+            else:
+                nutrition = outcome.nutrition
+                print(
+                    f"  {model} {case.case_id} trial {trial + 1}: {nutrition['calories']} kcal, "
+                    f"P{nutrition['protein']}/C{nutrition['carbs']}/F{nutrition['fats']} g "
+                    f"in {outcome.duration_s:.2f}s"
+                )
+            results.append(outcome)
+            if writer is not None:
+                writer.writerow(outcome.to_row())
+                csv_file.flush()
+    finally:
+        if csv_file is not None:
+            csv_file.close()
+
+    per_case = {
+        f"{model} {case.case_id}": summarize_case_results(
+            [r for r in results if r.model == model and r.case_id == case.case_id]
+        )
+        for model in models
+        for case in cases
+    }
+    summaries = {model: summarize_case_results([r for r in results if r.model == model]) for model in models}
+
+    print("\nPer-case results:")
+    print(format_dataset_table(per_case, "Model / case"))
+    print("\nAggregate (closer to zero is better):")
+    print(format_dataset_table(summaries, "Model"))
+    if any(case.kind == "image" for case in cases):
+        pipeline = "fused" if fused else "sequential"
+        print(f"\nImage pipeline ({pipeline}, max {max_image_px}px), mean seconds per stage:")
+        print(format_image_table(summaries))
+    if csv_output:
+        print(f"\nStreamed per-run rows to {csv_output}")
+    return summaries, results
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Benchmark OpenAI nutrition prompts across models")
     parser.add_argument(
@@ -427,22 +944,83 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--truth-protein", type=int, help="Override ground-truth protein (g)")
     parser.add_argument("--truth-carbs", type=int, help="Override ground-truth carbs (g)")
     parser.add_argument("--truth-fats", type=int, help="Override ground-truth fats (g)")
-    parser.add_argument("--csv-output", type=str, help="Optional path to write summary CSV")
+    parser.add_argument(
+        "--dataset",
+        type=str,
+        help="JSONL of descriptions or image paths with ground-truth macros (runs the production pipeline)",
+    )
+    parser.add_argument(
+        "--image-dirs",
+        nargs="+",
+        help="test_cases/ folders to run through the image pipeline (e.g. rice-breast-beans fs)",
+    )
+    parser.add_argument(
+        "--max-image-px",
+        type=int,
+        default=fa._MAX_IMAGE_PX,
+        help="Longest image side sent to the API",
+    )
+    parser.add_argument(
+        "--image-pipeline",
+        choices=["sequential", "fused"],
+        default="sequential",
+        help="Two-stage image analysis or a single fused call",
+    )
+    parser.add_argument(
+        "--csv-output",
+        type=str,
+        help="Optional path to write summary CSV (per-run rows, streamed, with --dataset)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Maximum calls in flight across all models (1 = sequential)",
+    )
+    parser.add_argument(
+        "--per-model-concurrency",
+        type=int,
+        help="Maximum calls in flight per model (defaults to --concurrency)",
+    )
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
-    truth = DEFAULT_GROUND_TRUTH.copy()
-    if args.truth_calories is not None:
-        truth["calories"] = args.truth_calories
-    if args.truth_protein is not None:
-        truth["protein"] = args.truth_protein
-    if args.truth_carbs is not None:
-        truth["carbs"] = args.truth_carbs
-    if args.truth_fats is not None:
-        truth["fats"] = args.truth_fats
-
-    summaries, detailed_runs = run_benchmark(args.models, args.runs, args.description, truth)
-    if args.csv_output and summaries:
-        write_csv_report(args.csv_output, summaries, detailed_runs)
+    if args.dataset or args.image_dirs:
+        cases = load_dataset(args.dataset) if args.dataset else []
+        if args.image_dirs:
+            cases.extend(load_image_dir_cases(args.image_dirs))
+            if fa._pil_image() is None:
+                print("WARNING: Pillow is not installed - images are sent unresized and --max-image-px has no effect")
+        run_dataset_benchmark(
+            args.models,
+            args.runs,
+            cases,
+            csv_output=args.csv_output,
+            concurrency=args.concurrency,
+            per_model_concurrency=args.per_model_concurrency,
+            max_image_px=args.max_image_px,
+            fused=args.image_pipeline == "fused",
+        )
+    else:
+        truth = DEFAULT_GROUND_TRUTH.copy()
+        if args.truth_calories is not None:
+            truth["calories"] = args.truth_calories
+        if args.truth_protein is not None:
+            truth["protein"] = args.truth_protein
+        if args.truth_carbs is not None:
+            truth["carbs"] = args.truth_carbs
+        if args.truth_fats is not None:
+            truth["fats"] = args.truth_fats
+
+        summaries, detailed_runs = run_benchmark(
+            args.models,
+            args.runs,
+            args.description,
+            truth,
+            concurrency=args.concurrency,
+            per_model_concurrency=args.per_model_concurrency,
+        )
+        if args.csv_output and summaries:
+            write_csv_report(args.csv_output, summaries, detailed_runs)
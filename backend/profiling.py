@@ -0,0 +1,281 @@
+"""Opt-in per-request profiling.
+
+A request is profiled when an operator sends ``X-Profile: 1`` together with a
+valid ``X-Admin-Key``, or when it is picked by 1-in-N sampling
+(``PROFILE_SAMPLE_RATE``). While it runs, a background thread samples the
+stacks of the threads serving that request: the event loop thread it started
+on, plus any threadpool worker that registers itself with
+``profile_current_thread`` (the plain ``def`` analysis handlers do). Other
+requests' threads are left out. tracemalloc records allocations meanwhile.
+The result is written to ``PROFILE_OUTPUT_DIR`` as:
+
+- ``<profile_id>.collapsed``: folded stacks (``frame;frame;frame count``),
+  ready for flamegraph.pl, speedscope or inferno
+- ``<profile_id>.json``: summary with time per component (image resize,
+  OpenAI client, JSON parsing, Pydantic validation), top allocation sites
+  and the request id
+
+tracemalloc is process-wide: the allocation sites and traced memory in the
+summary include whatever concurrent requests allocated, and those requests
+pay the tracing overhead until the profile finishes.
+
+The profile id is generated server-side (the client-supplied request id never
+reaches a file path) and returned in the ``X-Profile-ID`` response header.
+
+Only one request is profiled at a time. When profiling is off the
+middleware costs a header scan and a counter increment per request.
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from middleware.admin import is_admin_key
+from request_context import get_request_id
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile"
+ADMIN_KEY_HEADER = "x-admin-key"
+PROFILE_ID_HEADER = b"x-profile-id"
+SAMPLED_PATH_PREFIX = "/analyze_food"
+DEFAULT_INTERVAL_S = 0.005
+TRACEMALLOC_FRAMES = 16
+
+# Stack substrings attributing samples to the parts of the pipeline we care about
+COMPONENT_MARKERS = {
+    "image_resize": ("food_analysis.py:resize_for_api",),
+    "openai_client": ("openai/", "httpx/", "httpcore/"),
+    "json_parsing": ("json/decoder.py", "json/__init__.py", "food_analysis.py:_extract_json_payload"),
+    "pydantic_validation": ("pydantic/", "pydantic_core/"),
+}
+
+
+def _sample_rate() -> int:
+    try:
+        return int(os.getenv("PROFILE_SAMPLE_RATE", "0") or 0)
+    except ValueError:
+        return 0
+
+
+def _output_dir() -> str:
+    return os.getenv("PROFILE_OUTPUT_DIR", "/tmp/profiles")
+
+
+def _frame_label(frame: Any) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    # Keep the package directory for library frames so markers like "openai/" match
+    parent = os.path.basename(os.path.dirname(filename))
+    short = os.path.basename(filename)
+    if "site-packages" in filename or "lib/python" in filename:
+        short = f"{parent}/{short}"
+    return f"{short}:{code.co_name}"
+
+
+class StackSampler:
+    """Samples the stacks of the tracked threads into folded-stack counts"""
+
+    def __init__(self, interval_s: float = DEFAULT_INTERVAL_S) -> None:
+        self.interval_s = interval_s
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        # ident -> thread name; written from request threads, read by the sampler
+        self._threads: Dict[int, str] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def track_current_thread(self) -> None:
+        self._threads[threading.get_ident()] = threading.current_thread().name
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            frames = sys._current_frames()
+            for thread_id, name in list(self._threads.items()):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                # Idle threads parked in a wait are noise in a request profile
+                if labels and labels[0].endswith((":wait", ":select", ":_worker", ":poll")):
+                    continue
+                labels.append(f"thread:{name}")
+                self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=1)
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def components(self) -> Dict[str, float]:
+        """Share of non-idle samples whose stack passes through each component"""
+        total = sum(self.stacks.values())
+        shares = {}
+        for component, markers in COMPONENT_MARKERS.items():
+            hits = sum(count for stack, count in self.stacks.items() if any(m in stack for m in markers))
+            shares[component] = round(hits / total, 4) if total else 0.0
+        return shares
+
+
+class RequestProfile:
+    """Stack sampling of one request's threads plus (process-wide) tracemalloc"""
+
+    _lock = threading.Lock()
+
+    def __init__(
+        self, profile_id: str, request_id: Optional[str] = None, interval_s: float = DEFAULT_INTERVAL_S
+    ) -> None:
+        self.profile_id = profile_id
+        self.request_id = request_id
+        self.sampler = StackSampler(interval_s)
+        self._started_tracemalloc = False
+        self._start = 0.0
+
+    @classmethod
+    def try_start(cls, profile_id: str, request_id: Optional[str] = None) -> Optional["RequestProfile"]:
+        """Start profiling the calling thread unless another request is already being profiled"""
+        if not cls._lock.acquire(blocking=False):
+            return None
+        profile = cls(profile_id, request_id)
+        profile.sampler.track_current_thread()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            profile._started_tracemalloc = True
+        profile._start = time.perf_counter()
+        profile.sampler.start()
+        return profile
+
+    def finish(self, path: str, status: int, top_allocations: int = 25) -> Dict[str, Any]:
+        try:
+            duration = time.perf_counter() - self._start
+            self.sampler.stop()
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+        finally:
+            RequestProfile._lock.release()
+
+        snapshot = snapshot.filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+        )
+        allocations = [
+            {
+                "size_kb": round(stat.size / 1024, 1),
+                "count": stat.count,
+                "trace": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback[-4:]],
+            }
+            for stat in itertools.islice(snapshot.statistics("traceback"), top_allocations)
+        ]
+        summary = {
+            "profile_id": self.profile_id,
+            "request_id": self.request_id,
+            "path": path,
+            "status": status,
+            "duration_s": round(duration, 4),
+            "samples": self.sampler.samples,
+            "interval_s": self.sampler.interval_s,
+            "components": self.sampler.components(),
+            "traced_memory_kb": {"current": round(current / 1024, 1), "peak": round(peak / 1024, 1)},
+            "top_allocations": allocations,
+        }
+
+        directory = _output_dir()
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{self.profile_id}.collapsed"), "w", encoding="utf-8") as stacks_file:
+            stacks_file.write(self.sampler.collapsed())
+        with open(os.path.join(directory, f"{self.profile_id}.json"), "w", encoding="utf-8") as summary_file:
+            json.dump(summary, summary_file, indent=2)
+        return summary
+
+
+_active_profile: ContextVar[Optional[RequestProfile]] = ContextVar("active_profile", default=None)
+
+
+def profile_current_thread() -> None:
+    """Add the calling thread to the current request's profile, if it is being profiled
+
+    Threadpool workers inherit the request's contextvars but not its thread, so
+    sync handlers call this to have their stacks sampled. A no-op otherwise.
+    """
+    profile = _active_profile.get()
+    if profile is not None:
+        profile.sampler.track_current_thread()
+
+
+def _headers(scope: Dict[str, Any]) -> Dict[str, str]:
+    return {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope.get("headers", [])}
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling admin-requested or sampled requests"""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+        self._counter = itertools.count(1)
+
+    def _wants_profile(self, scope: Dict[str, Any]) -> bool:
+        headers = _headers(scope)
+        if headers.get(PROFILE_HEADER) in ("1", "true") and is_admin_key(headers.get(ADMIN_KEY_HEADER)):
+            return True
+        rate = _sample_rate()
+        return (
+            rate > 0
+            and scope.get("path", "").startswith(SAMPLED_PATH_PREFIX)
+            and next(self._counter) % rate == 0
+        )
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or not self._wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        profile = RequestProfile.try_start(profile_id, get_request_id())
+        if profile is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def _send(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((PROFILE_ID_HEADER, profile_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _active_profile.set(profile)
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _active_profile.reset(token)
+            try:
+                # Snapshotting tracemalloc and writing files would otherwise block the event loop
+                await run_in_threadpool(profile.finish, scope.get("path", ""), status["code"])
+            except Exception:
+                logger.exception("Failed to write profile %s", profile_id)
@@ -0,0 +1,313 @@
+"""Reconcile user_profiles subscription fields against Stripe.
+
+Webhooks that were dropped or failed leave ``user_profiles`` out of date until
+the next event for that customer. This job pages through every Stripe
+subscription, maps each customer's current subscription with the same rules
+as the ``customer.subscription.updated`` handler, diffs the result against
+``user_profiles`` using bulk reads, and writes only the rows that changed.
+
+Usage:
+    python reconcile_subscriptions.py --dry-run --report reconcile.json
+    python reconcile_subscriptions.py --concurrency 8 --batch-size 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from stripe_service import StripeService, get_supabase, stripe  # noqa: E402
+
+# NOT NULL user_profiles columns without a default. An upsert's insert half
+# must carry them even though ON CONFLICT (uid) turns every row into an update.
+UPSERT_REQUIRED_COLUMNS = ('gender', 'height_cm', 'current_weight_kg')
+PROFILE_COLUMNS = (
+    'uid, stripe_customer_id, stripe_subscription_id, subscription_status, subscription_tier, '
+    'subscription_end_date, trial_ends_at, cancel_at_period_end, ' + ', '.join(UPSERT_REQUIRED_COLUMNS)
+)
+TIMESTAMP_FIELDS = ('subscription_start_date', 'subscription_end_date', 'trial_ends_at')
+ACCESS_STATUSES = ('active', 'trialing', 'past_due')
+# Stripe statuses that end the subscription, like customer.subscription.deleted
+ENDED_STATUSES = ('canceled', 'unpaid')
+
+# When a customer has several subscriptions, the one that grants the most
+# access wins; ties go to the most recently created.
+_STATUS_PRIORITY = {'active': 4, 'trialing': 3, 'past_due': 2, 'canceled': 1}
+
+# Same fields _handle_subscription_deleted writes
+DELETED_SUBSCRIPTION_UPDATE = {
+    'subscription_status': 'canceled',
+    'subscription_tier': None,
+    'stripe_subscription_id': None,
+    'cancel_at_period_end': False,
+}
+
+
+@dataclass
+class ReconcileReport:
+    subscriptions_seen: int = 0
+    customers_seen: int = 0
+    profiles_matched: int = 0
+    unmatched_customers: List[str] = field(default_factory=list)
+    changes: List[Dict[str, Any]] = field(default_factory=list)
+    rows_updated: int = 0
+    duration_s: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'subscriptions_seen': self.subscriptions_seen,
+            'customers_seen': self.customers_seen,
+            'profiles_matched': self.profiles_matched,
+            'unmatched_customers': self.unmatched_customers,
+            'changed_rows': len(self.changes),
+            'rows_updated': self.rows_updated,
+            'duration_s': round(self.duration_s, 2),
+            'changes': self.changes,
+        }
+
+
+def iter_stripe_subscriptions(page_size: int = 100) -> Iterator[Dict[str, Any]]:
+    """Yield every subscription in the account, following Stripe pagination"""
+    listing = stripe.Subscription.list(status='all', limit=page_size)
+    yield from listing.auto_paging_iter()
+
+
+def desired_profile_fields(subscription: Dict[str, Any]) -> Dict[str, Any]:
+    """user_profiles fields a subscription implies, using the webhook mapping"""
+    if subscription.get('status') in ENDED_STATUSES:
+        return dict(DELETED_SUBSCRIPTION_UPDATE)
+    desired = StripeService.build_subscription_update(subscription)
+    desired['stripe_subscription_id'] = subscription['id']
+    items = (subscription.get('items') or {}).get('data') or []
+    if items:
+        tier = StripeService._get_tier_from_price_id(items[0]['price']['id'])
+        if tier in ('monthly', 'yearly'):
+            desired['subscription_tier'] = tier
+    return desired
+
+
+def select_current_subscriptions(
+    subscriptions: Iterable[Dict[str, Any]], report: ReconcileReport
+) -> Dict[str, Tuple[Optional[str], Dict[str, Any]]]:
+    """Pick one subscription per customer, returning (metadata user_id, fields)"""
+    best: Dict[str, Tuple[Tuple[int, int], Optional[str], Dict[str, Any]]] = {}
+    for subscription in subscriptions:
+        report.subscriptions_seen += 1
+        customer_id = subscription.get('customer')
+        if not customer_id:
+            continue
+        rank = (_STATUS_PRIORITY.get(subscription.get('status'), 0), subscription.get('created') or 0)
+        current = best.get(customer_id)
+        if current is None or rank > current[0]:
+            user_id = (subscription.get('metadata') or {}).get('user_id')
+            # Keep only the derived fields, not the full Stripe object
+            best[customer_id] = (rank, user_id, desired_profile_fields(subscription))
+    report.customers_seen = len(best)
+    return {customer_id: (user_id, desired) for customer_id, (_, user_id, desired) in best.items()}
+
+
+def _chunks(values: List[Any], size: int) -> Iterator[List[Any]]:
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
+
+
+def fetch_profiles(
+    client: Any, column: str, values: List[str], batch_size: int, concurrency: int
+) -> List[Dict[str, Any]]:
+    """Bulk-read user_profiles rows where ``column`` is in ``values``"""
+
+    def _fetch(batch: List[str]) -> List[Dict[str, Any]]:
+        return client.table('user_profiles').select(PROFILE_COLUMNS).in_(column, batch).execute().data or []
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return [row for rows in pool.map(_fetch, _chunks(values, batch_size)) for row in rows]
+
+
+def fetch_rows_with_access(client: Any, page_size: int) -> Iterator[Dict[str, Any]]:
+    """Page through profiles that currently grant access through a Stripe subscription"""
+    start = 0
+    while True:
+        rows = (
+            client.table('user_profiles')
+            .select(PROFILE_COLUMNS)
+            .in_('subscription_status', list(ACCESS_STATUSES))
+            # A stable order, or pages can skip or repeat rows between queries
+            .order('uid')
+            .range(start, start + page_size - 1)
+            .execute()
+            .data
+            or []
+        )
+        for row in rows:
+            if row.get('stripe_subscription_id'):
+                yield row
+        if len(rows) < page_size:
+            return
+        start += page_size
+
+
+def _normalize_timestamp(value: Any) -> Optional[int]:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def diff_profile(row: Dict[str, Any], desired: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the subset of ``desired`` that differs from the stored row"""
+    changes: Dict[str, Any] = {}
+    for column, value in desired.items():
+        current = row.get(column)
+        if column in TIMESTAMP_FIELDS:
+            if _normalize_timestamp(current) == _normalize_timestamp(value):
+                continue
+        elif column == 'cancel_at_period_end':
+            if bool(current) == bool(value):
+                continue
+        elif current == value:
+            continue
+        changes[column] = value
+    return changes
+
+
+def apply_changes(
+    client: Any,
+    changes: List[Dict[str, Any]],
+    profiles: Dict[str, Dict[str, Any]],
+    batch_size: int,
+    concurrency: int,
+) -> int:
+    """
+    Bulk-write changed rows as upserts on uid, ``batch_size`` rows per request
+
+    PostgREST writes a key missing from one object of a bulk payload as
+    NULL, so rows are grouped by which columns they change. Each payload also
+    carries UPSERT_REQUIRED_COLUMNS, rewritten with the values just read.
+    """
+    groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    for change in changes:
+        row = profiles[change['uid']]
+        payload = {'uid': change['uid'], **{column: row.get(column) for column in UPSERT_REQUIRED_COLUMNS}}
+        payload.update(change['set'])
+        groups.setdefault(tuple(sorted(change['set'])), []).append(payload)
+
+    jobs = [batch for rows in groups.values() for batch in _chunks(rows, batch_size)]
+
+    def _apply(rows: List[Dict[str, Any]]) -> int:
+        result = client.table('user_profiles').upsert(rows, on_conflict='uid').execute()
+        return len(result.data or [])
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return sum(pool.map(_apply, jobs))
+
+
+def reconcile(
+    client: Any,
+    subscriptions: Iterable[Dict[str, Any]],
+    *,
+    dry_run: bool = True,
+    batch_size: int = 200,
+    concurrency: int = 8,
+) -> ReconcileReport:
+    started = time.perf_counter()
+    report = ReconcileReport()
+    by_customer = select_current_subscriptions(subscriptions, report)
+
+    profiles_by_customer: Dict[str, Dict[str, Any]] = {
+        row['stripe_customer_id']: row
+        for row in fetch_profiles(client, 'stripe_customer_id', list(by_customer), batch_size, concurrency)
+    }
+
+    # Customers whose id was never stored: fall back to the metadata user_id
+    fallback_uids = {
+        user_id: customer_id
+        for customer_id, (user_id, _) in by_customer.items()
+        if customer_id not in profiles_by_customer and user_id
+    }
+    for row in fetch_profiles(client, 'uid', list(fallback_uids), batch_size, concurrency):
+        customer_id = fallback_uids[row['uid']]
+        profiles_by_customer[customer_id] = row
+
+    profiles_by_uid = {row['uid']: row for row in profiles_by_customer.values()}
+    seen_subscription_ids = set()
+    for customer_id, (_, desired) in by_customer.items():
+        row = profiles_by_customer.get(customer_id)
+        if row is None:
+            report.unmatched_customers.append(customer_id)
+            continue
+        report.profiles_matched += 1
+        seen_subscription_ids.add(desired['stripe_subscription_id'])
+        if not row.get('stripe_customer_id'):
+            desired = {**desired, 'stripe_customer_id': customer_id}
+        changes = diff_profile(row, desired)
+        if changes:
+            report.changes.append({'uid': row['uid'], 'set': changes})
+
+    # Profiles still granting access through a subscription Stripe no longer has
+    changed_uids = {change['uid'] for change in report.changes}
+    for row in fetch_rows_with_access(client, page_size=batch_size * 5):
+        if row['uid'] in changed_uids or row['stripe_subscription_id'] in seen_subscription_ids:
+            continue
+        if row.get('stripe_customer_id') in by_customer:
+            continue
+        report.changes.append({'uid': row['uid'], 'set': dict(DELETED_SUBSCRIPTION_UPDATE)})
+        profiles_by_uid[row['uid']] = row
+
+    if not dry_run and report.changes:
+        report.rows_updated = apply_changes(client, report.changes, profiles_by_uid, batch_size, concurrency)
+
+    report.duration_s = time.perf_counter() - started
+    return report
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Reconcile user_profiles with Stripe subscriptions")
+    parser.add_argument("--dry-run", action="store_true", help="Report changes without writing them")
+    parser.add_argument("--batch-size", type=int, default=200, help="Rows per bulk read/update")
+    parser.add_argument("--concurrency", type=int, default=8, help="Max concurrent Supabase requests")
+    parser.add_argument("--report", type=str, help="Optional path to write the JSON report")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    supabase = get_supabase()
+    if supabase is None:
+        raise SystemExit("Supabase is not configured")
+
+    result = reconcile(
+        supabase,
+        iter_stripe_subscriptions(),
+        dry_run=args.dry_run,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+    )
+
+    mode = "DRY RUN" if args.dry_run else "APPLIED"
+    print(
+        f"[{mode}] {result.subscriptions_seen} subscriptions, {result.customers_seen} customers, "
+        f"{result.profiles_matched} matched profiles, {len(result.changes)} changed rows, "
+        f"{result.rows_updated} updated in {result.duration_s:.1f}s"
+    )
+    if result.unmatched_customers:
+        print(f"{len(result.unmatched_customers)} Stripe customers have no user_profiles row")
+    for change in result.changes[:20]:
+        print(f"  {change['uid']}: {change['set']}")
+    if len(result.changes) > 20:
+        print(f"  ... {len(result.changes) - 20} more")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as report_file:
+            json.dump(result.to_dict(), report_file, indent=2, default=str)
+        print(f"Wrote report to {args.report}")
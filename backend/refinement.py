@@ -0,0 +1,69 @@
+"""Server-side state for clarification follow-ups on image analyses.
+
+A ``needs_clarification`` image response carries a ``session_id``. The
+session holds the already-resized image and the stage 1 understanding, so
+the reply (``session_id`` + ``context_text``) goes straight to stage 2
+without another upload, resize, or image-understanding call.
+
+Sessions are single-use, bound to the user who created them, and expire
+after ``REFINEMENT_SESSION_TTL_SECONDS``. They live in a ``shared_cache``,
+so any worker can serve the follow-up when ``SHARED_CACHE_URL`` is set.
+Sessions are a convenience: when the cache backend fails (e.g. a full
+``/dev/shm``) the analysis is still returned, just without a ``session_id``,
+and the client refines by re-sending the image.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import secrets
+from typing import Optional
+
+import food_analysis as fa
+from cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+REFINEMENT_SESSION_TTL_SECONDS = int(os.getenv('REFINEMENT_SESSION_TTL_SECONDS', '900'))
+# Each entry holds a resized image (~100-300 KB of base64), so keep this modest
+REFINEMENT_SESSION_MAX_ENTRIES = int(os.getenv('REFINEMENT_SESSION_MAX_ENTRIES', '256'))
+
+
+class RefinementSessions:
+    """Single-use refinement sessions keyed by an unguessable id"""
+
+    def __init__(
+        self,
+        ttl: float = REFINEMENT_SESSION_TTL_SECONDS,
+        maxsize: int = REFINEMENT_SESSION_MAX_ENTRIES,
+    ) -> None:
+        self._cache = shared_cache('refinement_session', maxsize=maxsize, ttl=ttl)
+
+    def create(self, state: fa.ImageRefinementState, user_id: str) -> Optional[str]:
+        """A new session id, or None when the cache backend could not store it"""
+        session_id = secrets.token_urlsafe(16)
+        try:
+            self._cache.set(session_id, {'user_id': user_id, 'state': fa._model_dump(state)})
+        except Exception as e:
+            logger.warning("Could not store refinement session", extra={"error": str(e)})
+            return None
+        return session_id
+
+    def get(self, session_id: str, user_id: str) -> Optional[fa.ImageRefinementState]:
+        """The session's state, or None when it expired, was used, or belongs to another user"""
+        try:
+            entry = self._cache.get(session_id)
+        except Exception as e:
+            logger.warning("Could not read refinement session", extra={"error": str(e)})
+            return None
+        if not entry or entry.get('user_id') != user_id:
+            return None
+        return fa.ImageRefinementState(**entry['state'])
+
+    def discard(self, session_id: str) -> None:
+        try:
+            self._cache.delete(session_id)
+        except Exception as e:
+            # Single use is best effort; the session still expires with its TTL
+            logger.warning("Could not discard refinement session", extra={"error": str(e)})
@@ -0,0 +1,89 @@
+"""Per-request context (request id, user id, usage records, stage timings) held in contextvars."""
+
+from __future__ import annotations
+
+import uuid
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+REQUEST_ID_HEADER = "x-request-id"
+USER_ID_HEADER = "x-user-id"
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+user_id_var: ContextVar[Optional[str]] = ContextVar("user_id", default=None)
+usage_var: ContextVar[Optional[List[Any]]] = ContextVar("usage", default=None)
+stage_timings_var: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("stage_timings", default=None)
+
+
+def get_request_id() -> Optional[str]:
+    return request_id_var.get()
+
+
+def get_user_id() -> Optional[str]:
+    return user_id_var.get()
+
+
+def get_usage_records() -> List[Any]:
+    """Usage records attached to the current request (empty outside a request)"""
+    return usage_var.get() or []
+
+
+def attach_usage(record: Any) -> None:
+    records = usage_var.get()
+    if records is not None:
+        records.append(record)
+
+
+def get_stage_timings() -> List[Tuple[str, float]]:
+    """(stage, seconds) pairs recorded in the current context, if collection is enabled"""
+    return stage_timings_var.get() or []
+
+
+def attach_stage_timing(stage: str, seconds: float) -> None:
+    timings = stage_timings_var.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+def _header(scope: Dict[str, Any], name: str) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key.decode("latin-1").lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+class RequestContextMiddleware:
+    """ASGI middleware binding request/user ids for the duration of a request.
+
+    The request id is taken from X-Request-ID when the client sends one and
+    echoed back in the response headers.
+    """
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = _header(scope, REQUEST_ID_HEADER) or uuid.uuid4().hex
+        tokens = (
+            request_id_var.set(request_id),
+            user_id_var.set(_header(scope, USER_ID_HEADER)),
+            usage_var.set([]),
+        )
+
+        async def _send(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            usage_var.reset(tokens[2])
+            user_id_var.reset(tokens[1])
+            request_id_var.reset(tokens[0])
@@ -0,0 +1,124 @@
+"""Production launcher: uvicorn with one worker per CPU the container may use.
+
+The worker count comes from ``WEB_CONCURRENCY`` when set, otherwise from the
+cgroup CPU quota (v2 ``cpu.max`` or v1 ``cpu.cfs_quota_us``), capped by the
+CPUs the process may run on. With more than one worker, caches created via
+``cache.shared_cache`` need a cross-process backend; unless
+``SHARED_CACHE_URL`` is already set, a SQLite file in ``/dev/shm`` is used,
+or in ``/tmp`` when ``/dev/shm`` is too small for it (Docker's default is
+64 MB; refinement sessions alone can reach a few hundred MB, so run the
+container with ``--shm-size=512m`` to keep the cache in memory).
+
+Everything else stays per worker: ``/metrics`` (each series gets a
+``worker`` label with the pid, and a scrape reaches one worker), the
+``/admin/usage`` totals (which report their ``worker``), the in-memory
+rate-limit buckets when no shared store is configured, and the circuit
+breakers, which each worker trips on its own.
+
+    python serve.py              # PORT (default 8080), workers from the quota
+    WEB_CONCURRENCY=4 python serve.py
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+from typing import Optional
+
+DEFAULT_SHARED_CACHE_URL = "sqlite:///dev/shm/japer-cache.db"
+FALLBACK_SHARED_CACHE_URL = "sqlite:///tmp/japer-cache.db"
+# Refinement sessions: 256 entries x up to 4 resized images (~300 KB base64 each)
+MIN_SHM_BYTES = 512 * 1024 * 1024
+CGROUP_V2_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CGROUP_V1_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+CGROUP_V1_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+
+logger = logging.getLogger(__name__)
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="ascii") as cgroup_file:
+            return cgroup_file.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit(root: str = "") -> Optional[float]:
+    """CPUs allowed by the cgroup quota, or None when unlimited or unknown"""
+    cpu_max = _read(root + CGROUP_V2_CPU_MAX)
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+
+    quota = _read(root + CGROUP_V1_QUOTA)
+    period = _read(root + CGROUP_V1_PERIOD)
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def default_shared_cache_url(shm_dir: str = "/dev/shm") -> str:
+    """The /dev/shm SQLite file when the mount can hold it, else a file in /tmp"""
+    try:
+        stats = os.statvfs(shm_dir)
+    except OSError:
+        return FALLBACK_SHARED_CACHE_URL
+    if stats.f_frsize * stats.f_blocks < MIN_SHM_BYTES:
+        logger.warning(
+            "/dev/shm is too small for the shared cache, using /tmp",
+            extra={"shm_bytes": stats.f_frsize * stats.f_blocks, "min_bytes": MIN_SHM_BYTES},
+        )
+        return FALLBACK_SHARED_CACHE_URL
+    return DEFAULT_SHARED_CACHE_URL
+
+
+def worker_count(root: str = "") -> int:
+    configured = os.getenv("WEB_CONCURRENCY")
+    if configured:
+        return max(1, int(configured))
+    cpus = available_cpus()
+    limit = cgroup_cpu_limit(root)
+    if limit is not None:
+        cpus = min(cpus, math.ceil(limit))
+    return max(1, cpus)
+
+
+def main() -> None:
+    import uvicorn
+
+    from logging_config import setup_logging
+
+    setup_logging()
+    workers = worker_count()
+    if workers > 1:
+        # Workers inherit the environment, so they all resolve the same backend
+        if not os.getenv("SHARED_CACHE_URL"):
+            os.environ["SHARED_CACHE_URL"] = default_shared_cache_url()
+        os.environ["METRICS_WORKER_LABEL"] = "1"
+    logger.info(
+        "Starting uvicorn",
+        extra={"workers": workers, "shared_cache": os.getenv("SHARED_CACHE_URL") or "in-process"},
+    )
+    uvicorn.run(
+        "app:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8080")),
+        workers=workers,
+        # Our JSON logging is installed by app.py in each worker
+        log_config=None,
+    )
+
+
+if __name__ == "__main__":
+    main()
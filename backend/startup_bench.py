@@ -0,0 +1,198 @@
+"""Measure backend cold start: import cost and time to first response.
+
+Two measurements per run, each in a fresh interpreter:
+
+- ``python -X importtime -c "import app"``: total import time, the slowest
+  top-level packages (self time summed per package), and which heavy SDKs
+  were imported eagerly
+- ``python -m uvicorn app:app``: wall time from spawn until the first HTTP
+  response on each ``--path`` (any status counts; a 401 from
+  ``/subscription/status`` still means the worker is serving)
+
+Results are the median over ``--runs``, written as JSON and comparable with
+an earlier run via ``--baseline``.
+
+    python startup_bench.py --runs 5 --path /metrics --path /subscription/status
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+from load_test import BACKEND_DIR, _free_port
+
+DEFAULT_PATHS = ["/metrics", "/subscription/status"]
+# SDKs that should only be imported when a request needs them
+DEFERRED_MODULES = ("openai", "stripe", "supabase", "PIL")
+DEFAULT_THRESHOLD = 0.25
+
+_IMPORTTIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def _bench_env() -> Dict[str, str]:
+    return {
+        **os.environ,
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY") or "startup-bench",
+        "RATE_LIMIT_ENABLED": "0",
+        "USAGE_FLUSH_INTERVAL_SECONDS": "0",
+        "EVENT_LOOP_LAG_INTERVAL_SECONDS": "0",
+        "LOG_LEVEL": "WARNING",
+    }
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """(module, self_us, cumulative_us, depth) for each ``-X importtime`` line"""
+    entries = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            entries.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return entries
+
+
+def summarize_imports(entries: List[Tuple[str, int, int, int]], top: int = 10) -> Dict[str, Any]:
+    by_package: Dict[str, int] = defaultdict(int)
+    for module, self_us, _, _ in entries:
+        by_package[module.split(".")[0]] += self_us
+    imported = {module.split(".")[0] for module, _, _, _ in entries}
+    return {
+        "total_ms": round(sum(cum for _, _, cum, depth in entries if depth == 0) / 1000, 1),
+        "modules": len(entries),
+        "top_packages_ms": {
+            package: round(us / 1000, 1)
+            for package, us in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+        },
+        "eager_deferred_modules": sorted(name for name in DEFERRED_MODULES if name in imported),
+    }
+
+
+def measure_imports(top: int = 10) -> Dict[str, Any]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=BACKEND_DIR,
+        env=_bench_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return summarize_imports(parse_importtime(result.stderr), top)
+
+
+def _first_response(url: str, proc: subprocess.Popen, timeout_s: float) -> None:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"app exited with code {proc.returncode} before serving")
+        try:
+            with urllib.request.urlopen(url, timeout=timeout_s):
+                return
+        except urllib.error.HTTPError:
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.005)
+    raise RuntimeError(f"no response from {url} within {timeout_s}s")
+
+
+def measure_first_responses(paths: List[str], timeout_s: float = 60.0) -> Dict[str, float]:
+    """Seconds from process spawn until each path first answers, in order"""
+    port = _free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=_bench_env(),
+    )
+    try:
+        timings = {}
+        for path in paths:
+            _first_response(f"http://127.0.0.1:{port}{path}", proc, timeout_s)
+            timings[path] = round(time.perf_counter() - start, 3)
+        return timings
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def run_startup_bench(runs: int, paths: List[str], top: int = 10) -> Dict[str, Any]:
+    imports = [measure_imports(top) for _ in range(runs)]
+    responses = [measure_first_responses(paths) for _ in range(runs)]
+    median_run = sorted(imports, key=lambda run: run["total_ms"])[len(imports) // 2]
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "runs": runs,
+        "import_ms": statistics.median(run["total_ms"] for run in imports),
+        "imports": median_run,
+        "first_response_s": {path: statistics.median(run[path] for run in responses) for path in paths},
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """Lines describing changes against a baseline, marking slowdowns past ``threshold``"""
+    rows = [("import_ms", current["import_ms"], baseline.get("import_ms"))]
+    for path, seconds in current["first_response_s"].items():
+        rows.append((f"first_response {path}", seconds, baseline.get("first_response_s", {}).get(path)))
+    lines = []
+    for name, now, before in rows:
+        if not before:
+            continue
+        change = now / before - 1
+        flag = "  REGRESSION" if change > threshold else ""
+        lines.append(f"{name:<36} {before:>9} -> {now:<9} ({change:+.0%}){flag}")
+    return lines
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure backend import time and time to first response")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--path", action="append", dest="paths", help="Path to time (repeatable, in order)")
+    parser.add_argument("--top", type=int, default=10, help="Slowest packages to report")
+    parser.add_argument("--output", help="JSON results path (default results/startup_<timestamp>.json)")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown vs baseline")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run_startup_bench(max(1, args.runs), args.paths or DEFAULT_PATHS, args.top)
+
+    print(f"import app: {report['import_ms']} ms")
+    for package, ms in report["imports"]["top_packages_ms"].items():
+        print(f"  {package:<24} {ms:>8} ms")
+    if report["imports"]["eager_deferred_modules"]:
+        print(f"imported eagerly: {', '.join(report['imports']['eager_deferred_modules'])}")
+    for path, seconds in report["first_response_s"].items():
+        print(f"first response {path}: {seconds:.3f}s")
+
+    output = args.output or os.path.join(
+        BACKEND_DIR, "results", f"startup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results written to {output}")
+
+    regressed = False
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            for line in compare(report, json.load(baseline_file), args.threshold):
+                regressed = regressed or line.endswith("REGRESSION")
+                print(line)
+    sys.exit(1 if regressed else 0)
@@ -1,29 +1,68 @@
+import logging
 import os
-import stripe
-from datetime import datetime
-from typing import Optional, Dict, Any
-from supabase import create_client, Client
-
-# Initialize Stripe with secret key
-stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
-
-# Initialize Supabase client lazily
-_supabase_url = os.getenv('SUPABASE_URL')
-# Use SERVICE_ROLE_KEY for backend operations to bypass RLS
-_supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY') or os.getenv('SUPABASE_ANON_KEY')
-
-# Only create Supabase client if credentials are provided
-supabase: Optional[Client] = None
-if _supabase_url and _supabase_key and len(_supabase_url) > 0 and len(_supabase_key) > 0:
-    try:
-        supabase = create_client(_supabase_url, _supabase_key)
-        key_type = "SERVICE_ROLE" if os.getenv('SUPABASE_SERVICE_ROLE_KEY') else "ANON"
-        print(f"✓ Supabase client initialized with {key_type} key")
-    except Exception as e:
-        print(f"⚠️  Failed to initialize Supabase: {e}")
-        supabase = None
-else:
-    print("⚠️  Supabase credentials not found - some features will be limited")
+import threading
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Optional, Dict, Any, List
+
+from customer_resolver import CustomerResolver
+from lazy_imports import lazy_module
+from middleware.entitlements import reissue_entitlement_token
+from subscription_mirror import SubscriptionMirror
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+logger = logging.getLogger(__name__)
+
+# Stripe SDK is imported on first use; the secret key is read at that point
+stripe = lazy_module('stripe', on_load=lambda module: setattr(module, 'api_key', os.getenv('STRIPE_SECRET_KEY')))
+
+# Supabase client is created on first use by get_supabase(); tests may assign it directly
+supabase: Optional["Client"] = None
+_supabase_initialized = False
+_supabase_lock = threading.Lock()
+
+
+def get_supabase() -> Optional["Client"]:
+    """Shared Supabase client, or None when credentials are missing or invalid"""
+    global supabase, _supabase_initialized
+    if supabase is not None or _supabase_initialized:
+        return supabase
+    with _supabase_lock:
+        if supabase is not None or _supabase_initialized:
+            return supabase
+        url = os.getenv('SUPABASE_URL')
+        # Use SERVICE_ROLE_KEY for backend operations to bypass RLS
+        key = os.getenv('SUPABASE_SERVICE_ROLE_KEY') or os.getenv('SUPABASE_ANON_KEY')
+        if url and key:
+            try:
+                from supabase import create_client
+
+                supabase = create_client(url, key)
+                key_type = "SERVICE_ROLE" if os.getenv('SUPABASE_SERVICE_ROLE_KEY') else "ANON"
+                logger.info("Supabase client initialized with %s key", key_type)
+            except Exception as e:
+                logger.warning("Failed to initialize Supabase: %s", e)
+                supabase = None
+        else:
+            logger.warning("Supabase credentials not found - some features will be limited")
+        _supabase_initialized = True
+        return supabase
+
+# Stripe subscription status -> user_profiles.subscription_status
+SUBSCRIPTION_STATUS_MAP = {
+    'active': 'active',
+    'trialing': 'trialing',
+    'past_due': 'past_due',
+    'canceled': 'canceled',
+    'unpaid': 'canceled'
+}
+
+# Local copy of subscriptions and customer -> user mapping, fed by webhooks
+subscription_mirror = SubscriptionMirror()
+
+# Cached, single-flight user -> Stripe customer lookup
+customer_resolver = CustomerResolver(lambda user_id, create: StripeService._load_customer(user_id, create))
 
 class StripeService:
     """Service for handling all Stripe-related operations"""
@@ -81,7 +120,7 @@ class StripeService:
             }
 
         except stripe.error.StripeError as e:
-            print(f"Stripe error creating checkout session: {e}")
+            logger.error("Stripe error creating checkout session: %s", e)
             raise Exception(f"Failed to create checkout session: {str(e)}")
 
     @staticmethod
@@ -96,14 +135,11 @@ class StripeService:
             Dict with portal_url
         """
         try:
-            # Get Stripe customer ID from database
-            response = supabase.table('user_profiles').select('stripe_customer_id').eq('uid', user_id).execute()
-
-            if not response.data or len(response.data) == 0 or not response.data[0].get('stripe_customer_id'):
+            # Cached user -> customer lookup; never creates a customer here
+            stripe_customer_id = customer_resolver.resolve(user_id)
+            if not stripe_customer_id:
                 raise Exception("No Stripe customer found for this user")
 
-            stripe_customer_id = response.data[0]['stripe_customer_id']
-
             # Create portal session
             session = stripe.billing_portal.Session.create(
                 customer=stripe_customer_id,
@@ -113,7 +149,7 @@ class StripeService:
             return {'portal_url': session.url}
 
         except stripe.error.StripeError as e:
-            print(f"Stripe error creating portal session: {e}")
+            logger.error("Stripe error creating portal session: %s", e)
             raise Exception(f"Failed to create portal session: {str(e)}")
 
     @staticmethod
@@ -121,38 +157,63 @@ class StripeService:
         """
         Get existing Stripe customer ID or create a new customer
 
+        Concurrent calls for the same user share one lookup/creation, so a
+        double-tapped "subscribe" cannot create two Stripe customers.
+
         Args:
             user_id: Supabase user ID
 
         Returns:
             Stripe customer ID
         """
-        if supabase is None:
+        return customer_resolver.resolve(user_id, create=True)
+
+    @staticmethod
+    def _load_customer(user_id: str, create: bool) -> Optional[str]:
+        """
+        Read the user's Stripe customer ID from user_profiles, optionally creating one
+
+        Args:
+            user_id: Supabase user ID
+            create: Create and store a Stripe customer if none exists
+
+        Returns:
+            Stripe customer ID, or None if missing and create is False
+        """
+        if get_supabase() is None:
             raise Exception("Supabase not initialized - cannot create customer")
 
         # Check if user already has a Stripe customer ID
-        response = supabase.table('user_profiles').select('stripe_customer_id, email, full_name').eq('uid', user_id).execute()
+        response = get_supabase().table('user_profiles').select('stripe_customer_id, email, full_name').eq('uid', user_id).execute()
 
         # Check if profile exists
         if not response.data or len(response.data) == 0:
+            if not create:
+                return None
             raise Exception(f"User profile not found for {user_id}. User must complete signup before subscribing.")
 
         user_data = response.data[0]
         if user_data.get('stripe_customer_id'):
+            subscription_mirror.remember_customer_user(user_data['stripe_customer_id'], user_id)
             return user_data['stripe_customer_id']
 
-        # Create new Stripe customer
+        if not create:
+            return None
+
+        # Create new Stripe customer; the idempotency key also dedupes across instances
         customer = stripe.Customer.create(
             email=user_data.get('email'),
             name=user_data.get('full_name'),
-            metadata={'user_id': user_id}
+            metadata={'user_id': user_id},
+            idempotency_key=f"customer-create-{user_id}",
         )
 
         # Store customer ID in database
-        supabase.table('user_profiles').update({
+        get_supabase().table('user_profiles').update({
             'stripe_customer_id': customer.id
         }).eq('uid', user_id).execute()
 
+        subscription_mirror.remember_customer_user(customer.id, user_id)
         return customer.id
 
     @staticmethod
@@ -166,7 +227,11 @@ class StripeService:
         event_type = event['type']
         data = event['data']['object']
 
-        print(f"Processing webhook event: {event_type}")
+        logger.info("Processing webhook event", extra={"event_type": event_type, "event_id": event.get('id')})
+
+        subscription_mirror.observe_event(event)
+        if event_type == 'customer.deleted' and (data.get('metadata') or {}).get('user_id'):
+            customer_resolver.forget(data['metadata']['user_id'])
 
         if event_type == 'checkout.session.completed':
             StripeService._handle_checkout_completed(data)
@@ -187,7 +252,7 @@ class StripeService:
             StripeService._handle_payment_failed(data)
 
         else:
-            print(f"Unhandled webhook event type: {event_type}")
+            logger.debug("Unhandled webhook event type", extra={"event_type": event_type})
 
     @staticmethod
     def _handle_checkout_completed(session: Dict[str, Any]) -> None:
@@ -196,28 +261,24 @@ class StripeService:
         # We can use this to immediately update user status
 
         if session.get('mode') != 'subscription':
-            print(f"Skipping non-subscription checkout: {session['id']}")
+            logger.debug("Skipping non-subscription checkout", extra={"checkout_session_id": session['id']})
             return
 
         # Get subscription ID from checkout session
         subscription_id = session.get('subscription')
         if not subscription_id:
-            print(f"No subscription ID in checkout session: {session['id']}")
+            logger.warning("No subscription ID in checkout session", extra={"checkout_session_id": session['id']})
             return
 
-        # Retrieve full subscription object to get all details
+        # Full subscription object comes from the mirror; Stripe is only hit on a miss
         try:
-            subscription = stripe.Subscription.retrieve(subscription_id)
+            subscription = subscription_mirror.get_subscription(subscription_id)
 
-            # Get user_id from subscription metadata
-            user_id = subscription.metadata.get('user_id')
-            if not user_id:
-                # Fallback: get from customer
-                customer = stripe.Customer.retrieve(subscription.customer)
-                user_id = customer.metadata.get('user_id')
+            # Get user_id from subscription metadata, falling back to the customer
+            user_id = subscription_mirror.get_user_id_for_subscription(subscription)
 
             if not user_id:
-                print(f"Could not find user_id for checkout session {session['id']}")
+                logger.warning("Could not find user_id for checkout session", extra={"checkout_session_id": session['id']})
                 return
 
             # Determine tier from price (safe access for Stripe objects)
@@ -229,7 +290,6 @@ class StripeService:
             trial_end = datetime.fromtimestamp(subscription['trial_end']) if subscription.get('trial_end') else None
 
             cancel_at_period_end = subscription.get('cancel_at_period_end', False)
-            print(f"Checkout completed - Updating user {user_id} to {status} ({tier})")
 
             # Update database - build update_data safely
             update_data = {
@@ -249,45 +309,40 @@ class StripeService:
             if trial_end:
                 update_data['trial_ends_at'] = trial_end.isoformat()
 
-            result = supabase.table('user_profiles').update(update_data).eq('uid', user_id).execute()
+            result = get_supabase().table('user_profiles').update(update_data).eq('uid', user_id).execute()
 
-            print(f"✓ Checkout completed for user {user_id}: {status} ({tier}) - Updated {len(result.data)} rows")
+            logger.info(
+                "Checkout completed",
+                extra={"uid": user_id, "status": status, "tier": tier, "rows_updated": len(result.data)},
+            )
 
-        except Exception as e:
-            print(f"Error handling checkout completion: {e}")
+            StripeService._reissue_entitlements(result.data)
+
+        except Exception:
+            logger.exception("Error handling checkout completion")
 
     @staticmethod
     def _handle_subscription_created(subscription: Dict[str, Any]) -> None:
         """Handle subscription.created webhook"""
-        print(f"Processing subscription.created for subscription {subscription['id']}")
-
-        # Try to get user_id from subscription metadata
-        user_id = subscription['metadata'].get('user_id')
-        print(f"User ID from subscription metadata: {user_id}")
+        # Get user_id from subscription metadata, falling back to the customer mapping
+        user_id = subscription_mirror.get_user_id_for_subscription(subscription)
 
         if not user_id:
-            # Fallback: get user_id from customer metadata
-            print(f"Retrieving customer {subscription['customer']} for user_id fallback")
-            customer = stripe.Customer.retrieve(subscription['customer'])
-            user_id = customer.metadata.get('user_id')
-            print(f"User ID from customer metadata: {user_id}")
-
-        if not user_id:
-            print(f"❌ ERROR: Could not find user_id for subscription {subscription['id']}")
-            print(f"Subscription metadata: {subscription.get('metadata', {})}")
+            logger.error(
+                "Could not find user_id for subscription",
+                extra={"subscription_id": subscription['id'], "metadata": subscription.get('metadata', {})},
+            )
             return
 
         try:
             # Determine tier from price
             price_id = subscription['items']['data'][0]['price']['id']
             tier = StripeService._get_tier_from_price_id(price_id)
-            print(f"Subscription tier: {tier} (price: {price_id})")
 
             # Check if in trial
             status = 'trialing' if subscription.get('status') == 'trialing' else 'active'
             trial_end = datetime.fromtimestamp(subscription['trial_end']) if subscription.get('trial_end') else None
             cancel_at_period_end = subscription.get('cancel_at_period_end', False)
-            print(f"Subscription status: {status}, trial_end: {trial_end}, cancel_at_period_end: {cancel_at_period_end}")
 
             # Build update data with safe access
             update_data = {
@@ -307,62 +362,75 @@ class StripeService:
             if trial_end:
                 update_data['trial_ends_at'] = trial_end.isoformat()
 
-            print(f"Updating user_profiles for uid={user_id} with: {update_data}")
+            result = get_supabase().table('user_profiles').update(update_data).eq('uid', user_id).execute()
 
-            result = supabase.table('user_profiles').update(update_data).eq('uid', user_id).execute()
+            logger.info(
+                "Subscription created",
+                extra={
+                    "uid": user_id,
+                    "subscription_id": subscription['id'],
+                    "price_id": price_id,
+                    "update": update_data,
+                    "rows_updated": len(result.data),
+                },
+            )
 
-            print(f"✓ Subscription created for user {user_id}: {status} ({tier}) - Updated {len(result.data)} rows")
+            StripeService._reissue_entitlements(result.data)
 
-        except Exception as e:
-            print(f"❌ ERROR handling subscription.created: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Error handling subscription.created", extra={"subscription_id": subscription['id']})
 
     @staticmethod
-    def _handle_subscription_updated(subscription: Dict[str, Any]) -> None:
-        """Handle subscription.updated webhook"""
-        subscription_id = subscription['id']
-        print(f"Processing subscription.updated for subscription {subscription_id}")
-
-        status_map = {
-            'active': 'active',
-            'trialing': 'trialing',
-            'past_due': 'past_due',
-            'canceled': 'canceled',
-            'unpaid': 'canceled'
-        }
+    def build_subscription_update(subscription: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Map a Stripe subscription onto user_profiles subscription fields
 
-        stripe_status = subscription['status']
-        status = status_map.get(stripe_status, 'free')
-        trial_end = datetime.fromtimestamp(subscription['trial_end']) if subscription.get('trial_end') else None
-        cancel_at_period_end = subscription.get('cancel_at_period_end', False)
+        Only fields present in the payload are included, so the result can be
+        applied as a partial update.
 
-        print(f"Stripe status: {stripe_status} → Our status: {status}, trial_end: {trial_end}, cancel_at_period_end: {cancel_at_period_end}")
+        Args:
+            subscription: Stripe subscription object
 
-        try:
-            # Update database - only include fields that exist in payload
-            update_data = {
-                'subscription_status': status,
-                'cancel_at_period_end': cancel_at_period_end,
-            }
+        Returns:
+            Dict of user_profiles columns to update
+        """
+        status = SUBSCRIPTION_STATUS_MAP.get(subscription['status'], 'free')
+        update_data = {
+            'subscription_status': status,
+            'cancel_at_period_end': subscription.get('cancel_at_period_end', False),
+        }
 
-            # Add optional fields if present
-            if subscription.get('current_period_end'):
-                update_data['subscription_end_date'] = datetime.fromtimestamp(subscription['current_period_end']).isoformat()
+        if subscription.get('current_period_end'):
+            update_data['subscription_end_date'] = datetime.fromtimestamp(subscription['current_period_end']).isoformat()
 
-            if trial_end:
-                update_data['trial_ends_at'] = trial_end.isoformat()
+        if subscription.get('trial_end'):
+            update_data['trial_ends_at'] = datetime.fromtimestamp(subscription['trial_end']).isoformat()
 
-            print(f"Updating user_profiles for stripe_subscription_id={subscription_id} with: {update_data}")
+        return update_data
 
-            result = supabase.table('user_profiles').update(update_data).eq('stripe_subscription_id', subscription_id).execute()
+    @staticmethod
+    def _handle_subscription_updated(subscription: Dict[str, Any]) -> None:
+        """Handle subscription.updated webhook"""
+        subscription_id = subscription['id']
+        update_data = StripeService.build_subscription_update(subscription)
 
-            print(f"✓ Subscription {subscription_id} updated to status: {status}, cancel_at_period_end: {cancel_at_period_end} - Updated {len(result.data)} rows")
+        try:
+            result = get_supabase().table('user_profiles').update(update_data).eq('stripe_subscription_id', subscription_id).execute()
+
+            logger.info(
+                "Subscription updated",
+                extra={
+                    "subscription_id": subscription_id,
+                    "stripe_status": subscription['status'],
+                    "update": update_data,
+                    "rows_updated": len(result.data),
+                },
+            )
+
+            StripeService._reissue_entitlements(result.data)
 
-        except Exception as e:
-            print(f"❌ ERROR handling subscription.updated: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Error handling subscription.updated", extra={"subscription_id": subscription_id})
 
     @staticmethod
     def _handle_subscription_deleted(subscription: Dict[str, Any]) -> None:
@@ -370,36 +438,39 @@ class StripeService:
         subscription_id = subscription['id']
 
         # Update database
-        supabase.table('user_profiles').update({
+        result = get_supabase().table('user_profiles').update({
             'subscription_status': 'canceled',
             'subscription_tier': None,
             'stripe_subscription_id': None,
             'cancel_at_period_end': False,
         }).eq('stripe_subscription_id', subscription_id).execute()
 
-        print(f"Subscription {subscription_id} canceled")
+        logger.info("Subscription canceled", extra={"subscription_id": subscription_id, "rows_updated": len(result.data)})
+
+        StripeService._reissue_entitlements(result.data)
 
     @staticmethod
     def _handle_payment_succeeded(invoice: Dict[str, Any]) -> None:
         """Handle invoice.payment_succeeded webhook"""
         subscription_id = invoice.get('subscription')
-        print(f"Processing invoice.payment_succeeded for invoice {invoice['id']}, subscription: {subscription_id}")
-
         if subscription_id:
             try:
                 # Ensure subscription is marked as active
-                result = supabase.table('user_profiles').update({
+                result = get_supabase().table('user_profiles').update({
                     'subscription_status': 'active',
                 }).eq('stripe_subscription_id', subscription_id).execute()
 
-                print(f"✓ Payment succeeded for subscription {subscription_id} - Updated {len(result.data)} rows to active")
+                logger.info(
+                    "Payment succeeded",
+                    extra={"invoice_id": invoice['id'], "subscription_id": subscription_id, "rows_updated": len(result.data)},
+                )
 
-            except Exception as e:
-                print(f"❌ ERROR handling payment.succeeded: {e}")
-                import traceback
-                traceback.print_exc()
+                StripeService._reissue_entitlements(result.data)
+
+            except Exception:
+                logger.exception("Error handling payment.succeeded", extra={"subscription_id": subscription_id})
         else:
-            print(f"Skipping payment.succeeded: No subscription ID in invoice")
+            logger.debug("Skipping payment.succeeded: no subscription ID in invoice", extra={"invoice_id": invoice['id']})
 
     @staticmethod
     def _handle_payment_failed(invoice: Dict[str, Any]) -> None:
@@ -407,11 +478,13 @@ class StripeService:
         subscription_id = invoice.get('subscription')
         if subscription_id:
             # Mark subscription as past_due
-            supabase.table('user_profiles').update({
+            result = get_supabase().table('user_profiles').update({
                 'subscription_status': 'past_due',
             }).eq('stripe_subscription_id', subscription_id).execute()
 
-            print(f"Payment failed for subscription {subscription_id}")
+            logger.warning("Payment failed", extra={"subscription_id": subscription_id, "rows_updated": len(result.data)})
+
+            StripeService._reissue_entitlements(result.data)
 
     @staticmethod
     def _get_tier_from_price_id(price_id: str) -> str:
@@ -426,20 +499,63 @@ class StripeService:
             return 'unknown'
 
     @staticmethod
-    def get_subscription_status(user_id: str) -> Dict[str, Any]:
+    def _status_from_profile(data: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the subscription status dict from a user_profiles row"""
+        status = data.get('subscription_status') or 'free'
+        cancel_at_period_end = data.get('cancel_at_period_end') or False
+
+        # Check if user has active access
+        has_access = status in ('active', 'trialing')
+
+        # Check if trial is still valid
+        trial_ends_at = data.get('trial_ends_at')
+        if trial_ends_at:
+            trial_end_date = datetime.fromisoformat(trial_ends_at.replace('Z', '+00:00'))
+            if trial_end_date.tzinfo is None:
+                trial_end_date = trial_end_date.replace(tzinfo=timezone.utc)
+            if datetime.now(timezone.utc) < trial_end_date:
+                has_access = True
+
+        return {
+            'status': status,
+            'tier': data.get('subscription_tier'),
+            'trial_ends_at': trial_ends_at,
+            'subscription_end_date': data.get('subscription_end_date'),
+            'cancel_at_period_end': cancel_at_period_end,
+            'has_access': has_access
+        }
+
+    @staticmethod
+    def _reissue_entitlements(rows: Optional[List[Dict[str, Any]]]) -> None:
+        """Reissue entitlement tokens for users whose profile a webhook just updated"""
+        for row in rows or []:
+            user_id = row.get('uid')
+            if not user_id:
+                continue
+            try:
+                reissue_entitlement_token(user_id, StripeService._status_from_profile(row))
+            except Exception as e:
+                logger.warning("Could not reissue entitlement token", extra={"uid": user_id, "error": str(e)})
+
+    @staticmethod
+    def get_subscription_status(user_id: str, raise_errors: bool = False) -> Dict[str, Any]:
         """
         Get current subscription status for a user
 
         Args:
             user_id: Supabase user ID
+            raise_errors: Raise when the profile cannot be read instead of
+                returning the free-tier fallback (for callers that cache)
 
         Returns:
             Dict with subscription details
         """
         try:
             # Check if Supabase is available
-            if supabase is None:
-                print("Supabase client not initialized - returning free tier")
+            if get_supabase() is None:
+                if raise_errors:
+                    raise RuntimeError("Supabase client not initialized")
+                logger.warning("Supabase client not initialized - returning free tier")
                 return {
                     'status': 'free',
                     'tier': None,
@@ -449,7 +565,7 @@ class StripeService:
                     'has_access': False
                 }
 
-            response = supabase.table('user_profiles').select(
+            response = get_supabase().table('user_profiles').select(
                 'subscription_status, subscription_tier, trial_ends_at, subscription_end_date, cancel_at_period_end'
             ).eq('uid', user_id).execute()
 
@@ -457,7 +573,7 @@ class StripeService:
             if not response.data or len(response.data) == 0:
                 # User profile doesn't exist - return free tier status
                 # Profile should be created during user signup in the Flutter app
-                print(f"User profile not found for {user_id}, returning free tier status")
+                logger.info("User profile not found, returning free tier status", extra={"uid": user_id})
                 return {
                     'status': 'free',
                     'tier': None,
@@ -467,31 +583,12 @@ class StripeService:
                     'has_access': False
                 }
 
-            data = response.data[0]
-            status = data.get('subscription_status', 'free')
-            cancel_at_period_end = data.get('cancel_at_period_end', False)
-
-            # Check if user has active access
-            has_access = status in ('active', 'trialing')
-
-            # Check if trial is still valid
-            trial_ends_at = data.get('trial_ends_at')
-            if trial_ends_at:
-                trial_end_date = datetime.fromisoformat(trial_ends_at.replace('Z', '+00:00'))
-                if datetime.now() < trial_end_date:
-                    has_access = True
-
-            return {
-                'status': status,
-                'tier': data.get('subscription_tier'),
-                'trial_ends_at': trial_ends_at,
-                'subscription_end_date': data.get('subscription_end_date'),
-                'cancel_at_period_end': cancel_at_period_end,
-                'has_access': has_access
-            }
+            return StripeService._status_from_profile(response.data[0])
 
-        except Exception as e:
-            print(f"Error getting subscription status: {e}")
+        except Exception:
+            if raise_errors:
+                raise
+            logger.exception("Error getting subscription status", extra={"uid": user_id})
             return {
                 'status': 'free',
                 'tier': None,
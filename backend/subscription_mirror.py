@@ -0,0 +1,104 @@
+"""Local mirror of Stripe subscriptions and the customer -> user mapping.
+
+Webhook handlers need the full subscription object and the Supabase user that
+owns a Stripe customer. Both arrive in webhook payloads anyway, so we keep the
+latest copy in memory and only call the Stripe API on a cache miss.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+from cache import TTLCache
+from lazy_imports import lazy_module
+
+stripe = lazy_module("stripe")
+
+# Subscriptions are refreshed by every customer.subscription.* event; the TTL
+# only bounds staleness on instances that missed an event.
+SUBSCRIPTION_TTL_SECONDS = 60 * 60
+MIRROR_MAX_ENTRIES = 50_000
+
+
+class StripeAPI:
+    """Thin adapter over the Stripe SDK calls the mirror falls back to."""
+
+    def retrieve_subscription(self, subscription_id: str) -> Dict[str, Any]:
+        return stripe.Subscription.retrieve(subscription_id)
+
+    def retrieve_customer(self, customer_id: str) -> Dict[str, Any]:
+        return stripe.Customer.retrieve(customer_id)
+
+
+def _metadata_user_id(obj: Dict[str, Any]) -> Optional[str]:
+    metadata = obj.get('metadata') or {}
+    return metadata.get('user_id') or None
+
+
+class SubscriptionMirror:
+    """In-memory copy of Stripe subscriptions kept current from webhooks"""
+
+    def __init__(self, api: Optional[Any] = None, maxsize: int = MIRROR_MAX_ENTRIES) -> None:
+        self.api = api if api is not None else StripeAPI()
+        self._subscriptions = TTLCache(maxsize=maxsize, ttl=SUBSCRIPTION_TTL_SECONDS)
+        self._customer_users = TTLCache(maxsize=maxsize)
+
+    def observe_event(self, event: Dict[str, Any]) -> None:
+        """Update the mirror from a webhook event payload"""
+        event_type = event['type']
+        data = event['data']['object']
+
+        if event_type in ('customer.subscription.created', 'customer.subscription.updated'):
+            self.record_subscription(data)
+        elif event_type == 'customer.subscription.deleted':
+            self._subscriptions.delete(data['id'])
+        elif event_type in ('customer.created', 'customer.updated'):
+            self.record_customer(data)
+        elif event_type == 'customer.deleted':
+            self._customer_users.delete(data['id'])
+
+    def record_subscription(self, subscription: Dict[str, Any]) -> None:
+        self._subscriptions.set(subscription['id'], subscription)
+        user_id = _metadata_user_id(subscription)
+        if user_id and subscription.get('customer'):
+            self.remember_customer_user(subscription['customer'], user_id)
+
+    def record_customer(self, customer: Dict[str, Any]) -> None:
+        user_id = _metadata_user_id(customer)
+        if user_id:
+            self.remember_customer_user(customer['id'], user_id)
+
+    def remember_customer_user(self, customer_id: str, user_id: str) -> None:
+        self._customer_users.set(customer_id, user_id)
+
+    def get_subscription(self, subscription_id: str) -> Dict[str, Any]:
+        """Return the mirrored subscription, retrieving it from Stripe on a miss"""
+        subscription = self._subscriptions.get(subscription_id)
+        if subscription is None:
+            subscription = self.api.retrieve_subscription(subscription_id)
+            self.record_subscription(subscription)
+        return subscription
+
+    def get_user_id_for_customer(self, customer_id: str) -> Optional[str]:
+        """Return the Supabase user for a Stripe customer, retrieving it on a miss"""
+        user_id = self._customer_users.get(customer_id)
+        if user_id is None:
+            customer = self.api.retrieve_customer(customer_id)
+            user_id = _metadata_user_id(customer)
+            if user_id:
+                self.remember_customer_user(customer_id, user_id)
+        return user_id
+
+    def get_user_id_for_subscription(self, subscription: Dict[str, Any]) -> Optional[str]:
+        """Resolve the owning user from subscription metadata, then from its customer"""
+        user_id = _metadata_user_id(subscription)
+        if user_id:
+            return user_id
+        customer_id = subscription.get('customer')
+        if not customer_id:
+            return None
+        return self.get_user_id_for_customer(customer_id)
+
+    def clear(self) -> None:
+        self._subscriptions.clear()
+        self._customer_users.clear()
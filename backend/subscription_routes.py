@@ -1,14 +1,17 @@
 from fastapi import APIRouter, HTTPException, Header, Request, Depends
 from pydantic import BaseModel
 from typing import Optional
-import stripe
+import logging
 import os
-from stripe_service import StripeService
+from stripe_service import StripeService, stripe
 from middleware.auth import get_current_user
+from middleware.entitlements import issue_entitlement_token
 
 router = APIRouter(prefix="/subscription", tags=["subscription"])
 webhook_router = APIRouter(prefix="/stripe", tags=["stripe"])
 
+logger = logging.getLogger(__name__)
+
 
 # Request/Response Models
 class CreateCheckoutRequest(BaseModel):
@@ -31,6 +34,8 @@ class SubscriptionStatusResponse(BaseModel):
     subscription_end_date: Optional[str]
     cancel_at_period_end: bool
     has_access: bool
+    # Short-lived signed token to send as X-Entitlement-Token on premium calls
+    entitlement_token: Optional[str] = None
 
 
 # Endpoints
@@ -73,7 +78,7 @@ async def create_checkout_session(
         )
 
     except Exception as e:
-        print(f"Error creating checkout session: {e}")
+        logger.exception("Error creating checkout session")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -89,7 +94,7 @@ async def create_customer_portal_session(user_id: str = Depends(get_current_user
         return CreatePortalResponse(portal_url=result['portal_url'])
 
     except Exception as e:
-        print(f"Error creating portal session: {e}")
+        logger.exception("Error creating portal session")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -108,11 +113,12 @@ async def get_subscription_status(user_id: str = Depends(get_current_user)):
             trial_ends_at=status['trial_ends_at'],
             subscription_end_date=status['subscription_end_date'],
             cancel_at_period_end=status['cancel_at_period_end'],
-            has_access=status['has_access']
+            has_access=status['has_access'],
+            entitlement_token=issue_entitlement_token(user_id, status)
         )
 
     except Exception as e:
-        print(f"Error getting subscription status: {e}")
+        logger.exception("Error getting subscription status")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -147,7 +153,7 @@ async def stripe_webhook(
                 secret=webhook_secret
             )
         except stripe.error.SignatureVerificationError as e:
-            print(f"Webhook signature verification failed: {e}")
+            logger.warning("Webhook signature verification failed: %s", e)
             raise HTTPException(status_code=400, detail="Invalid signature")
 
         # Handle the event
@@ -158,5 +164,5 @@ async def stripe_webhook(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error processing webhook: {e}")
+        logger.exception("Error processing webhook")
         raise HTTPException(status_code=500, detail=str(e))
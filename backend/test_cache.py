@@ -0,0 +1,111 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import jwt
+
+import cache
+from middleware import auth
+from middleware.rate_limit import BucketPolicy, SQLiteBucketStore
+
+
+class SharedCacheTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.path = os.path.join(tempfile.mkdtemp(), "cache.db")
+
+    def test_entries_and_invalidations_are_visible_to_every_worker(self) -> None:
+        # Two instances over one file stand in for two worker processes
+        worker_a = cache.SQLiteCache(self.path, "entitlements", ttl=60)
+        worker_b = cache.SQLiteCache(self.path, "entitlements", ttl=60)
+
+        worker_a.set("user-1", {"has_access": True})
+        self.assertEqual(worker_b.get("user-1"), {"has_access": True})
+
+        worker_b.delete("user-1")
+        self.assertIsNone(worker_a.get("user-1"))
+        self.assertNotIn("user-1", cache.SQLiteCache(self.path, "other"))
+
+    def test_entries_expire_and_namespaces_are_trimmed_to_maxsize(self) -> None:
+        shared = cache.SQLiteCache(self.path, "results", maxsize=3)
+        shared._TRIM_EVERY = 1
+
+        shared.set("short", 1, ttl=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(shared.get("short"))
+
+        for index in range(5):
+            shared.set(f"key-{index}", index)
+        self.assertEqual(len(shared), 3)
+        self.assertIsNone(shared.get("key-0"))
+        self.assertEqual(shared.get("key-4"), 4)
+
+    def test_factory_picks_the_backend_from_the_environment(self) -> None:
+        with mock.patch.dict("os.environ", {"SHARED_CACHE_URL": ""}):
+            self.assertIsInstance(cache.shared_cache("a"), cache.TTLCache)
+        with mock.patch.dict("os.environ", {"SHARED_CACHE_URL": f"sqlite://{self.path}"}):
+            self.assertIsInstance(cache.shared_cache("a"), cache.SQLiteCache)
+        with mock.patch.dict("os.environ", {"SHARED_CACHE_URL": "memcached://localhost"}):
+            with self.assertRaises(ValueError):
+                cache.shared_cache("a")
+
+    def test_sqlite_bucket_store_shares_budgets(self) -> None:
+        policy = BucketPolicy(capacity=2, refill_per_second=0.001)
+        worker_a, worker_b = SQLiteBucketStore(self.path), SQLiteBucketStore(self.path)
+
+        self.assertTrue(worker_a.take("user-1", 1, policy)[0])
+        self.assertTrue(worker_b.take("user-1", 1, policy)[0])
+        allowed, retry_after = worker_a.take("user-1", 1, policy)
+
+        self.assertFalse(allowed)
+        self.assertGreater(retry_after, 0)
+
+    def test_sqlite_bucket_store_prunes_refilled_buckets(self) -> None:
+        policy = BucketPolicy(capacity=1, refill_per_second=100)  # full again after 10 ms
+        store = SQLiteBucketStore(self.path)
+        store._PRUNE_EVERY = 3
+
+        store.take("idle-1", 1, policy)
+        store.take("idle-2", 1, policy)
+        time.sleep(0.02)
+        store.take("active", 1, policy)
+
+        keys = [row[0] for row in store._db.connection().execute("SELECT key FROM ratelimit_buckets")]
+        self.assertEqual(keys, ["active"])
+
+
+class JwtClaimsCacheTests(unittest.TestCase):
+    def setUp(self) -> None:
+        patcher = mock.patch.dict("os.environ", {"SUPABASE_JWT_SECRET": "jwt-test-secret-0123456789abcdef0123"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        auth.get_supabase_jwt_secret.cache_clear()
+        self.addCleanup(auth.get_supabase_jwt_secret.cache_clear)
+        auth._claims_cache.clear()
+
+    def _token(self, exp_in: float) -> str:
+        claims = {"sub": "user-1", "aud": "authenticated", "exp": int(time.time() + exp_in)}
+        return jwt.encode(claims, os.environ["SUPABASE_JWT_SECRET"], algorithm="HS256")
+
+    def test_verified_claims_are_reused_until_the_token_expires(self) -> None:
+        token = self._token(exp_in=120)
+
+        with mock.patch.object(auth.jwt, "decode", wraps=jwt.decode) as decode:
+            first = asyncio.run(auth.get_current_user(f"Bearer {token}"))
+            second = asyncio.run(auth.get_current_user(f"Bearer {token}"))
+
+        self.assertEqual((first, second), ("user-1", "user-1"))
+        self.assertEqual(decode.call_count, 1)
+
+    def test_invalid_tokens_are_not_cached(self) -> None:
+        token = self._token(exp_in=120) + "x"
+
+        for _ in range(2):
+            self.assertIsNone(asyncio.run(auth.get_optional_user(f"Bearer {token}")))
+        self.assertEqual(len(auth._claims_cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+import app as backend_app
+import bench_asgi
+from cassette import AUTO, RECORD, CassetteClient, CassetteMiss, completion_key
+
+TEXT_RESPONSE = json.dumps(
+    {"meal_name": "Eggs on toast", "calories": 420, "protein": 22, "carbs": 35, "fats": 20}
+)
+
+
+class _FakeOpenAI:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(
+            model=kwargs["model"],
+            choices=[SimpleNamespace(message=SimpleNamespace(content=TEXT_RESPONSE))],
+            usage=SimpleNamespace(
+                prompt_tokens=300,
+                completion_tokens=40,
+                prompt_tokens_details=SimpleNamespace(cached_tokens=0),
+            ),
+        )
+
+
+def _format(name):
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": {}}}
+
+
+class CassetteTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+
+    def test_key_ignores_image_encoding_size_but_not_schema(self) -> None:
+        messages = [{"role": "user", "content": [{"type": "image_url", "image_url": {"url": "data:x"}}]}]
+
+        self.assertEqual(completion_key(messages, _format("a")), completion_key(messages, _format("a")))
+        self.assertNotEqual(completion_key(messages, _format("a")), completion_key(messages, _format("b")))
+        self.assertNotIn("data:x", completion_key(messages, _format("a")))
+
+    def test_record_then_replay_without_inner_client(self) -> None:
+        inner = _FakeOpenAI()
+        recorder = CassetteClient(self.directory, mode=RECORD, inner=inner)
+        kwargs = {"model": "gpt-5-nano", "messages": [{"role": "user", "content": "eggs"}], "response_format": _format("t")}
+        recorder.chat.completions.create(**kwargs)
+
+        player = CassetteClient(self.directory, latency="none")
+        replayed = player.chat.completions.create(**kwargs)
+
+        self.assertEqual(inner.calls, 1)
+        self.assertEqual(replayed.choices[0].message.content, TEXT_RESPONSE)
+        self.assertEqual(replayed.usage.prompt_tokens, 300)
+        with self.assertRaises(CassetteMiss):
+            player.chat.completions.create(**{**kwargs, "messages": [{"role": "user", "content": "other"}]})
+
+    def test_benchmark_runner_drives_text_endpoint(self) -> None:
+        inner = _FakeOpenAI()
+        cassette_client = CassetteClient(self.directory, mode=AUTO, inner=inner, latency="none")
+        payloads = [("/analyze_food/text", {"text": "Two eggs on toast"})]
+
+        with mock.patch.dict("os.environ", {"RATE_LIMIT_ENABLED": "0"}):
+            result = bench_asgi.run_benchmark(backend_app, cassette_client, payloads, 5, 2, trace_allocations=False)
+
+        self.assertEqual(result.errors, 0)
+        self.assertEqual(result.requests, 5)
+        self.assertEqual(inner.calls, 1)  # recorded during warm-up, replayed afterwards
+        self.assertEqual(cassette_client.hits, 5)
+        self.assertIsNot(backend_app.client, cassette_client)
+
+
+if __name__ == "__main__":
+    unittest.main()
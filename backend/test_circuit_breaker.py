@@ -0,0 +1,181 @@
+import os
+import unittest
+from unittest import mock
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from fastapi.testclient import TestClient
+
+import app as backend_app
+import circuit_breaker as cb
+import metrics
+
+# Stand in for openai's exceptions without building httpx requests and responses
+UpstreamError = type("APIConnectionError", (Exception,), {"__module__": "openai"})
+APIStatusError = type("APIStatusError", (Exception,), {"__module__": "openai"})
+LengthFinishReasonError = type("LengthFinishReasonError", (Exception,), {"__module__": "openai"})
+
+
+def _status_error(status_code):
+    exc = APIStatusError()
+    exc.status_code = status_code
+    return exc
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class UpstreamFailureTests(unittest.TestCase):
+    def test_only_connection_rate_limit_and_server_errors_count(self) -> None:
+        self.assertTrue(cb.is_upstream_failure(UpstreamError()))
+        self.assertTrue(cb.is_upstream_failure(_status_error(429)))
+        self.assertTrue(cb.is_upstream_failure(_status_error(503)))
+        self.assertTrue(cb.is_upstream_failure(TimeoutError()))
+
+        self.assertFalse(cb.is_upstream_failure(_status_error(400)))
+        self.assertFalse(cb.is_upstream_failure(LengthFinishReasonError()))
+        self.assertFalse(cb.is_upstream_failure(ValueError()))
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = _Clock()
+        self.breaker = cb.CircuitBreaker(
+            "test-model", failure_rate=0.5, min_calls=4, open_seconds=30, slow_call_seconds=5, clock=self.clock
+        )
+
+    def _state_metric(self) -> float:
+        return metrics.CIRCUIT_STATE.value(model="test-model")
+
+    def test_opens_once_the_bad_share_reaches_the_threshold(self) -> None:
+        for failed in (False, True, False):
+            self.breaker.record(0.1, failed=failed)
+        self.assertEqual(self.breaker.state, cb.CLOSED)
+
+        self.breaker.record(6.0)  # slow counts as bad: 2 of 4
+
+        self.assertEqual(self.breaker.state, cb.OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.retry_after(), 30)
+        self.assertEqual(self._state_metric(), 2)
+
+    def test_half_open_lets_one_probe_through_and_its_outcome_decides(self) -> None:
+        for _ in range(4):
+            self.breaker.record(0.1, failed=True)
+        self.clock.now += 30
+
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self._state_metric(), 1)
+
+        self.breaker.record(0.1, failed=True)
+        self.assertEqual(self.breaker.state, cb.OPEN)
+
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record(0.1)
+        self.assertEqual(self.breaker.state, cb.CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_outcomes_older_than_the_window_are_forgotten(self) -> None:
+        for _ in range(3):
+            self.breaker.record(0.1, failed=True)
+        self.clock.now += 61
+
+        self.breaker.record(0.1, failed=True)
+
+        self.assertEqual(self.breaker.state, cb.CLOSED)
+
+
+class CallWithFallbackTests(unittest.TestCase):
+    def setUp(self) -> None:
+        cb.reset_breakers()
+        self.addCleanup(cb.reset_breakers)
+        env = mock.patch.dict("os.environ", {"CIRCUIT_MIN_CALLS": "1", "CIRCUIT_OPEN_SECONDS": "30"})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def test_upstream_failures_fail_over_and_open_the_primary(self) -> None:
+        calls = []
+
+        def _call(model):
+            calls.append(model)
+            if model == "primary":
+                raise UpstreamError()
+            return model
+
+        self.assertEqual(cb.call_with_fallback(["primary", "backup"], _call), "backup")
+        self.assertEqual(cb.call_with_fallback(["primary", "backup"], _call), "backup")
+        self.assertEqual(calls, ["primary", "backup", "backup"])
+        self.assertEqual(cb.get_breaker("primary").state, cb.OPEN)
+
+    def test_request_errors_are_raised_without_failover(self) -> None:
+        calls = []
+
+        def _call(model):
+            calls.append(model)
+            raise ValueError("bad payload")
+
+        with self.assertRaises(ValueError):
+            cb.call_with_fallback(["primary", "backup"], _call)
+        self.assertEqual(calls, ["primary"])
+        self.assertEqual(cb.get_breaker("primary").state, cb.CLOSED)
+
+    def test_interrupted_probe_frees_the_half_open_slot(self) -> None:
+        breaker = cb.get_breaker("primary")
+        breaker.record(0.1, failed=True)
+        breaker._opened_at -= 30
+
+        with self.assertRaises(KeyboardInterrupt):
+            cb.call_with_fallback(["primary"], mock.Mock(side_effect=KeyboardInterrupt))
+
+        self.assertEqual(breaker.state, cb.HALF_OPEN)
+        self.assertEqual(cb.call_with_fallback(["primary"], lambda model: model), "primary")
+        self.assertEqual(breaker.state, cb.CLOSED)
+
+    def test_fails_fast_when_every_breaker_is_open(self) -> None:
+        for model in ("primary", "backup"):
+            cb.get_breaker(model).record(0.1, failed=True)
+        call = mock.Mock()
+
+        with self.assertRaises(cb.CircuitOpenError) as raised:
+            cb.call_with_fallback(["primary", "backup"], call)
+
+        call.assert_not_called()
+        self.assertEqual(raised.exception.models, ["primary", "backup"])
+        self.assertGreater(raised.exception.retry_after, 0)
+
+
+class EndpointFailureTests(unittest.TestCase):
+    def setUp(self) -> None:
+        patches = [
+            mock.patch.dict("os.environ", {"RATE_LIMIT_ENABLED": "0"}),
+            mock.patch.object(backend_app, "get_client", return_value=object()),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.client = TestClient(backend_app.app)
+
+    def test_open_circuit_is_a_503_with_retry_after(self) -> None:
+        with mock.patch.object(backend_app.fa, "analyze_text", side_effect=cb.CircuitOpenError(["gpt-5-nano"], 12.2)):
+            response = self.client.post("/analyze_food/text", json={"text": "toast"}, headers={"X-User-ID": "u"})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["retry-after"], "13")
+
+    def test_audio_failures_are_errors_not_zero_calorie_meals(self) -> None:
+        with mock.patch.object(backend_app.fa, "transcribe_audio", side_effect=UpstreamError()):
+            response = self.client.post("/analyze_food/audio", json={"audio": "AAAA"}, headers={"X-User-ID": "u"})
+
+        self.assertEqual(response.status_code, 500)
+        self.assertNotIn("calories", response.json())
+
+
+if __name__ == "__main__":
+    unittest.main()
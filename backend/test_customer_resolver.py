@@ -0,0 +1,57 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from customer_resolver import CustomerResolver
+
+
+class CustomerResolverTests(unittest.TestCase):
+    def test_concurrent_calls_share_one_creation(self) -> None:
+        calls = []
+        lock = threading.Lock()
+
+        def loader(user_id, create):
+            with lock:
+                calls.append((user_id, create))
+            time.sleep(0.05)
+            return f"cus_{len(calls)}"
+
+        resolver = CustomerResolver(loader)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: resolver.resolve("user-1", create=True), range(8)))
+
+        self.assertEqual(set(results), {"cus_1"})
+        self.assertEqual(calls, [("user-1", True)])
+        self.assertEqual(resolver.resolve("user-1"), "cus_1")
+        self.assertEqual(len(calls), 1)
+
+    def test_lookup_miss_is_not_cached_and_create_still_runs(self) -> None:
+        customers = {}
+
+        def loader(user_id, create):
+            if user_id not in customers and create:
+                customers[user_id] = "cus_new"
+            return customers.get(user_id)
+
+        resolver = CustomerResolver(loader)
+
+        self.assertIsNone(resolver.resolve("user-1"))
+        self.assertEqual(resolver.resolve("user-1", create=True), "cus_new")
+
+    def test_loader_errors_propagate_to_every_waiter(self) -> None:
+        def loader(user_id, create):
+            time.sleep(0.05)
+            raise RuntimeError("profile missing")
+
+        resolver = CustomerResolver(loader)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(resolver.resolve, "user-1", True) for _ in range(4)]
+
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result()
+
+
+if __name__ == "__main__":
+    unittest.main()
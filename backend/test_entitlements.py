@@ -0,0 +1,104 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException, Response
+
+import stripe_service
+from fakes import FakeSupabase
+from middleware import entitlements
+from middleware.subscription_check import require_subscription
+from stripe_service import StripeService
+
+ACTIVE = {"status": "active", "tier": "monthly", "trial_ends_at": None, "has_access": True}
+FREE = {"status": "free", "tier": None, "trial_ends_at": None, "has_access": False}
+
+
+class EntitlementTokenTests(unittest.TestCase):
+    def setUp(self) -> None:
+        patcher = mock.patch.dict("os.environ", {"ENTITLEMENT_TOKEN_SECRET": "entitlement-test-secret-0123456789abcdef"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        entitlements.get_entitlement_secret.cache_clear()
+        self.addCleanup(entitlements.get_entitlement_secret.cache_clear)
+        entitlements._revoked_before.clear()
+        entitlements._reissued_tokens.clear()
+
+    def _require(self, user_id, token=None):
+        response = Response()
+        result = asyncio.run(require_subscription(response, user_id=user_id, entitlement_token=token))
+        return result, response
+
+    def test_token_round_trip_is_bound_to_user(self) -> None:
+        token = entitlements.issue_entitlement_token("user-1", ACTIVE)
+
+        claims = entitlements.verify_entitlement_token(token, "user-1")
+
+        self.assertTrue(claims["has_access"])
+        self.assertEqual(claims["tier"], "monthly")
+        self.assertIsNone(entitlements.verify_entitlement_token(token, "user-2"))
+        self.assertIsNone(entitlements.verify_entitlement_token(token + "x", "user-1"))
+
+    def test_valid_token_skips_subscription_lookup(self) -> None:
+        token = entitlements.issue_entitlement_token("user-1", ACTIVE)
+
+        with mock.patch.object(StripeService, "get_subscription_status") as lookup:
+            user_id, response = self._require("user-1", token)
+
+        self.assertEqual(user_id, "user-1")
+        lookup.assert_not_called()
+        self.assertNotIn(entitlements.ENTITLEMENT_HEADER, response.headers)
+
+    def test_missing_token_falls_back_and_issues_one(self) -> None:
+        with mock.patch.object(StripeService, "get_subscription_status", return_value=ACTIVE):
+            _, response = self._require("user-1")
+
+        token = response.headers[entitlements.ENTITLEMENT_HEADER]
+        self.assertIsNotNone(entitlements.verify_entitlement_token(token, "user-1"))
+
+    def test_webhook_change_revokes_old_token_and_reissues(self) -> None:
+        issued_at = entitlements.time.time() - 5
+        with mock.patch("middleware.entitlements.time.time", return_value=issued_at):
+            old_token = entitlements.issue_entitlement_token("user-1", ACTIVE)
+        db = FakeSupabase(
+            {
+                "user_profiles": [
+                    {"uid": "user-1", "stripe_subscription_id": "sub_1", "subscription_status": "active"}
+                ]
+            }
+        )
+
+        self.assertIsNotNone(entitlements.verify_entitlement_token(old_token, "user-1"))
+        with mock.patch.object(stripe_service, "supabase", db):
+            StripeService._handle_subscription_deleted({"id": "sub_1"})
+        reissued_claims = entitlements.verify_entitlement_token(
+            entitlements.get_reissued_token("user-1"), "user-1"
+        )
+
+        self.assertIsNone(entitlements.verify_entitlement_token(old_token, "user-1"))
+        self.assertEqual(reissued_claims["status"], "canceled")
+        self.assertFalse(reissued_claims["has_access"])
+
+    def test_token_from_earlier_in_the_revocation_second_is_rejected(self) -> None:
+        second = int(entitlements.time.time()) - 2
+        with mock.patch("middleware.entitlements.time.time", return_value=second + 0.2):
+            old_token = entitlements.issue_entitlement_token("user-1", ACTIVE)
+        with mock.patch("middleware.entitlements.time.time", return_value=second + 0.7):
+            new_token = entitlements.reissue_entitlement_token("user-1", ACTIVE)
+
+        self.assertIsNone(entitlements.verify_entitlement_token(old_token, "user-1"))
+        self.assertIsNotNone(entitlements.verify_entitlement_token(new_token, "user-1"))
+
+    def test_token_without_access_is_rejected_locally(self) -> None:
+        token = entitlements.issue_entitlement_token("user-1", FREE)
+
+        with mock.patch.object(StripeService, "get_subscription_status") as lookup:
+            with self.assertRaises(HTTPException) as ctx:
+                self._require("user-1", token)
+
+        self.assertEqual(ctx.exception.status_code, 403)
+        lookup.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
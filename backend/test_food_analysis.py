@@ -1,4 +1,8 @@
+import base64
+import io
+import json
 import unittest
+from unittest import mock
 
 import food_analysis as fa
 
@@ -116,5 +120,93 @@ class FoodAnalysisNormalizationTests(unittest.TestCase):
         self.assertEqual(parsed["fats"], 18)
 
 
+class PromptLayoutTests(unittest.TestCase):
+    @staticmethod
+    def _prefix(messages):
+        """Everything before the per-request text: system prompt and leading user parts"""
+        user_content = messages[1]["content"]
+        return [messages[0], user_content[:-1] if isinstance(user_content, list) else None]
+
+    def test_image_stages_share_a_byte_identical_prefix_with_variable_text_last(self) -> None:
+        stage1 = fa.ImageUnderstandingResponse(meal_name="Rice bowl", visible_items=["rice", "chicken"])
+        builds = [
+            fa.build_image_understanding_messages("aW1n", None),
+            fa.build_image_understanding_messages("aW1n", None, "cooked in butter"),
+            fa.build_image_synthesis_messages("aW1n", None, stage1, "cooked in butter"),
+            fa.build_image_fused_messages("aW1n", None),
+        ]
+
+        prefixes = {json.dumps(self._prefix(messages)) for messages in builds}
+
+        self.assertEqual(len(prefixes), 1)
+        self.assertEqual(builds[0][0]["content"], fa.IMAGE_SYSTEM_PROMPT)
+        self.assertIn("cooked in butter", builds[1][1]["content"][-1]["text"])
+
+    def test_stage1_findings_are_compact_and_skip_empty_fields(self) -> None:
+        stage1 = fa.ImageUnderstandingResponse(meal_name="Rice bowl", visible_items=["rice"], needs_clarification=True)
+
+        text = fa.build_image_synthesis_messages("aW1n", None, stage1)[1]["content"][-1]["text"]
+
+        self.assertTrue(text.endswith('Stage 1 findings: {"meal_name":"Rice bowl","visible_items":["rice"]}'))
+
+    def test_text_prompt_keeps_the_description_out_of_the_system_prefix(self) -> None:
+        first = fa.build_text_analysis_messages("two eggs")
+        second = fa.build_text_analysis_messages("a bagel")
+
+        self.assertEqual(first[0], second[0])
+        self.assertEqual(second[1]["content"], "Description: 'a bagel'")
+
+
+class MealImagesTests(unittest.TestCase):
+    def _run(self, **kwargs):
+        calls = []
+
+        def _complete(client, *, model, messages, schema_model, schema_name):
+            calls.append(messages)
+            if schema_model is fa.ImageUnderstandingResponse:
+                return fa.ImageUnderstandingResponse(meal_name="Rice, chicken and beans")
+            return schema_model(meal_name="Rice, chicken and beans", calories=700, protein=50, carbs=80, fats=18)
+
+        with mock.patch.object(fa, "_run_structured_chat_completion", side_effect=_complete), mock.patch.object(
+            fa, "resize_for_api", side_effect=lambda image, max_px: image
+        ):
+            result, state = fa.analyze_meal_images_with_state(object(), **kwargs)
+        return result, state, calls
+
+    def test_all_photos_go_to_one_two_stage_pass_as_image_parts(self) -> None:
+        result, state, calls = self._run(images=["aW1nMQ==", "aW1nMg=="], image_urls=["https://example.com/3.jpg"])
+
+        self.assertEqual(len(calls), 2)
+        for messages in calls:
+            parts = messages[1]["content"]
+            self.assertEqual(
+                [part["image_url"]["url"] for part in parts[:-1]],
+                ["data:image/jpeg;base64,aW1nMQ==", "data:image/jpeg;base64,aW1nMg==", "https://example.com/3.jpg"],
+            )
+            self.assertIn("The 3 photos show the same meal", parts[-1]["text"])
+        self.assertEqual(calls[0][0]["content"], fa.IMAGE_SYSTEM_PROMPT)
+        self.assertEqual(result.calories, 700)
+        self.assertEqual(state.extra_image_urls, ["data:image/jpeg;base64,aW1nMg==", "https://example.com/3.jpg"])
+
+    def test_image_count_is_bounded(self) -> None:
+        with self.assertRaises(ValueError):
+            self._run(image_urls=[f"https://example.com/{i}.jpg" for i in range(fa.MAX_MEAL_IMAGES + 1)])
+        with self.assertRaises(ValueError):
+            self._run()
+
+    @unittest.skipIf(fa._pil_image() is None, "Pillow not installed")
+    def test_parallel_resize_keeps_order(self) -> None:
+        images = []
+        for width in (2000, 1500, 300):
+            buffer = io.BytesIO()
+            fa._pil_image().new("RGB", (width, 100)).save(buffer, format="JPEG")
+            images.append(base64.b64encode(buffer.getvalue()).decode("ascii"))
+
+        resized = fa.resize_all_for_api(images, max_px=1024)
+
+        sizes = [fa._pil_image().open(io.BytesIO(base64.b64decode(image))).size[0] for image in resized]
+        self.assertEqual(sizes, [1024, 1024, 300])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,121 @@
+import json
+import os
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from fastapi.testclient import TestClient
+
+import app as backend_app
+import food_analysis as fa
+from json_stream import IncrementalJSONObjectParser
+
+PAYLOAD = {"meal_name": "Two eggs {fried}", "calories": 180, "protein": 12, "carbs": 1, "fats": 14}
+
+
+def _feed(text, chunk_size):
+    parser = IncrementalJSONObjectParser()
+    fields = []
+    for start in range(0, len(text), chunk_size):
+        fields.extend(parser.feed(text[start : start + chunk_size]))
+    return fields, parser.done
+
+
+def _chunk(content=None, usage=None):
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=content))] if content is not None else []
+    return SimpleNamespace(choices=choices, usage=usage, model="gpt-5-nano")
+
+
+class _StreamingClient:
+    def __init__(self, text, chunk_size=4):
+        self.text = text
+        self.chunk_size = chunk_size
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        self.requests.append(kwargs)
+        for start in range(0, len(self.text), self.chunk_size):
+            yield _chunk(self.text[start : start + self.chunk_size])
+        usage = SimpleNamespace(prompt_tokens=50, completion_tokens=20, prompt_tokens_details=None)
+        yield _chunk(usage=usage)
+
+
+class IncrementalJSONObjectParserTests(unittest.TestCase):
+    def test_fields_match_json_loads_for_every_chunk_size(self) -> None:
+        text = json.dumps({**PAYLOAD, "notes": ["a \"quoted\" ]", {"x": None}], "ok": True}, indent=2)
+
+        for chunk_size in (1, 2, 5, len(text)):
+            fields, done = _feed(text, chunk_size)
+            self.assertEqual(dict(fields), json.loads(text))
+            self.assertTrue(done)
+
+    def test_fields_are_reported_before_the_object_closes(self) -> None:
+        parser = IncrementalJSONObjectParser()
+
+        self.assertEqual(parser.feed('{"meal_name": "Toast", "calories": 9'), [("meal_name", "Toast")])
+        self.assertEqual(parser.feed("0,"), [("calories", 90)])
+        self.assertFalse(parser.done)
+
+    def test_tolerates_the_wrappers_extract_json_payload_accepts(self) -> None:
+        wrapped = [
+            "Here you go:\n```json\n" + json.dumps(PAYLOAD, indent=2) + "\n```\nAnything else?",
+            "[" + json.dumps(PAYLOAD) + "]",
+            "Estimate: " + json.dumps(PAYLOAD) + " (rough)",
+        ]
+
+        for text in wrapped:
+            fields, done = _feed(text, 3)
+            self.assertEqual(dict(fields), PAYLOAD)
+            self.assertTrue(done)
+
+    def test_values_that_are_not_json_are_skipped(self) -> None:
+        fields, _ = _feed('{"meal_name": "Soup", "calories": about, "fats": 3}', 4)
+
+        self.assertEqual(fields, [("meal_name", "Soup"), ("fats", 3)])
+
+
+class TextStreamTests(unittest.TestCase):
+    def test_emits_fields_as_they_complete_then_the_normalized_result(self) -> None:
+        client = _StreamingClient("```json\n" + json.dumps({**PAYLOAD, "calories": "180"}) + "\n```")
+
+        events = list(fa.analyze_text_stream(client, "two fried eggs"))
+
+        self.assertEqual(
+            [(event["name"], event["value"]) for event in events[:-1]],
+            [("meal_name", "Two eggs {fried}"), ("calories", 180), ("protein", 12), ("carbs", 1), ("fats", 14)],
+        )
+        self.assertEqual(events[-1], {"type": "result", "data": {**PAYLOAD}})
+        self.assertTrue(client.requests[0]["stream"])
+
+    def test_endpoint_streams_ndjson_events(self) -> None:
+        client = _StreamingClient(json.dumps(PAYLOAD))
+        with mock.patch.dict("os.environ", {"RATE_LIMIT_ENABLED": "0"}), mock.patch.object(
+            backend_app, "get_client", return_value=client
+        ):
+            response = TestClient(backend_app.app).post(
+                "/analyze_food/text/stream", json={"text": "two eggs"}, headers={"X-User-ID": "user-1"}
+            )
+
+        events = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        self.assertEqual(events[0], {"type": "field", "name": "meal_name", "value": "Two eggs {fried}"})
+        self.assertEqual(events[-1]["type"], "result")
+        self.assertEqual(events[-1]["data"]["calories"], 180)
+
+    def test_endpoint_reports_failures_as_an_error_event(self) -> None:
+        failing = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=mock.Mock(side_effect=RuntimeError))))
+        with mock.patch.dict("os.environ", {"RATE_LIMIT_ENABLED": "0"}), mock.patch.object(
+            backend_app, "get_client", return_value=failing
+        ):
+            response = TestClient(backend_app.app).post(
+                "/analyze_food/text/stream", json={"text": "two eggs"}, headers={"X-User-ID": "user-1"}
+            )
+
+        self.assertEqual(response.text, '{"type":"error","detail":"Text analysis failed"}\n')
+
+
+if __name__ == "__main__":
+    unittest.main()
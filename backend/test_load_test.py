@@ -0,0 +1,43 @@
+import json
+import random
+import unittest
+
+import food_analysis as fa
+import load_test
+
+
+class LoadTestToolTests(unittest.TestCase):
+    def test_schema_examples_validate_against_pipeline_models(self) -> None:
+        for model, name in (
+            (fa.LegacyNutritionResponse, "text_food_analysis"),
+            (fa.ImageUnderstandingResponse, "food_image_understanding"),
+            (fa.ImageNutritionSynthesisResponse, "food_image_nutrition"),
+        ):
+            schema = fa._build_response_format(model, name)["json_schema"]["schema"]
+            payload = json.loads(json.dumps(load_test.example_from_schema(schema)))
+
+            model.model_validate(payload)
+
+    def test_latency_specs(self) -> None:
+        rng = random.Random(0)
+
+        self.assertEqual(load_test.parse_latency("fixed:0.25")(rng), 0.25)
+        self.assertTrue(0.1 <= load_test.parse_latency("uniform:0.1:0.2")(rng) <= 0.2)
+        self.assertGreater(load_test.parse_latency("lognormal:0.5:0.3")(rng), 0)
+        with self.assertRaises(ValueError):
+            load_test.parse_latency("gamma:1")
+
+    def test_lag_window_uses_bucket_deltas_between_scrapes(self) -> None:
+        before = ([(0.01, 10.0), (0.1, 10.0), (float("inf"), 10.0)], 0.05)
+        after = ([(0.01, 108.0), (0.1, 109.0), (float("inf"), 110.0)], 0.65)
+
+        window = load_test.lag_window(before, after)
+
+        self.assertEqual(window["samples"], 100)
+        self.assertAlmostEqual(window["mean_ms"], 6.0)
+        self.assertEqual(window["p99_ms"], 100.0)
+        self.assertIsNone(window["max_ms"])
+
+
+if __name__ == "__main__":
+    unittest.main()
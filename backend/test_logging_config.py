@@ -0,0 +1,89 @@
+import io
+import json
+import logging
+import os
+import queue
+import unittest
+from unittest import mock
+
+import logging_config
+from request_context import request_id_var, user_id_var
+
+
+class LoggingConfigTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.stream = io.StringIO()
+        self.addCleanup(logging_config.shutdown_logging)
+        self.addCleanup(logging.getLogger("chatty").setLevel, logging.NOTSET)
+        self.addCleanup(logging.getLogger().setLevel, logging.getLogger().level)
+
+    def _setup(self, **env) -> None:
+        with mock.patch.dict(os.environ, env):
+            logging_config.setup_logging(self.stream, force=True)
+
+    def _records(self):
+        logging_config.shutdown_logging()
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_json_lines_carry_correlation_ids_and_extra_fields(self) -> None:
+        self._setup(LOG_LEVEL="INFO")
+        request_token = request_id_var.set("req-1")
+        user_token = user_id_var.set("user-1")
+        try:
+            logging.getLogger("stripe_service").info("Subscription updated", extra={"rows_updated": 2})
+        finally:
+            request_id_var.reset(request_token)
+            user_id_var.reset(user_token)
+
+        [record] = self._records()
+        self.assertEqual(record["msg"], "Subscription updated")
+        self.assertEqual(record["logger"], "stripe_service")
+        self.assertEqual(record["request_id"], "req-1")
+        self.assertEqual(record["user_id"], "user-1")
+        self.assertEqual(record["rows_updated"], 2)
+
+    def test_exceptions_are_formatted_into_the_record(self) -> None:
+        self._setup()
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logging.getLogger("app").exception("Text analysis failed")
+
+        [record] = self._records()
+        self.assertEqual(record["level"], "ERROR")
+        self.assertIn("ValueError: boom", record["exc"])
+
+    def test_per_module_levels_override_the_root_level(self) -> None:
+        self._setup(LOG_LEVEL="WARNING", LOG_LEVELS="chatty=DEBUG")
+        logging.getLogger("quiet").info("dropped")
+        logging.getLogger("chatty").debug("kept")
+
+        self.assertEqual([record["msg"] for record in self._records()], ["kept"])
+
+    def test_debug_sampling_and_per_record_sample_rate(self) -> None:
+        self._setup(LOG_LEVEL="DEBUG", LOG_DEBUG_SAMPLE_RATE="0")
+        logger = logging.getLogger("chatty")
+        logger.debug("sampled out")
+        logger.info("info always kept")
+        logger.info("rare", extra={"sample_rate": 0.0})
+        logger.debug("forced", extra={"sample_rate": 1.0})
+
+        self.assertEqual([record["msg"] for record in self._records()], ["info always kept", "forced"])
+
+    def test_full_queue_drops_instead_of_blocking(self) -> None:
+        handler = logging_config.DroppingQueueHandler(queue.Queue(maxsize=1))
+        logger = logging.getLogger("flood")
+        logger.propagate = False
+        logger.addHandler(handler)
+        self.addCleanup(setattr, logger, "propagate", True)
+        self.addCleanup(logger.removeHandler, handler)
+
+        for index in range(5):
+            logger.warning("line %d", index)
+
+        self.assertEqual(handler.queue.qsize(), 1)
+        self.assertEqual(handler.dropped, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import json
+import os
+import unittest
+from unittest import mock
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+import flask
+
+import food_analysis as fa
+import main
+
+
+def _complete_result(**overrides):
+    return {
+        "analysis_version": "v2",
+        "status": "complete",
+        "meal_name": "Rice bowl",
+        "calories": 600,
+        "protein": 30,
+        "carbs": 80,
+        "fats": 15,
+        "confidence": 0.8,
+        "confidence_label": "high",
+        "estimation_method": "image_only",
+        "clarifying_question": None,
+        "assumptions": [],
+        "flags": [],
+        "items": [],
+        **overrides,
+    }
+
+
+class CloudFunctionTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.flask_app = flask.Flask(__name__)
+        self.client = object()
+        patcher = mock.patch.object(main, "get_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _call(self, path, body=None, method="POST", headers=None):
+        with self.flask_app.test_request_context(path, method=method, json=body, headers=headers or {}):
+            body, status, response_headers = main.japer_api(flask.request)
+        return (json.loads(body) if body else None), status, response_headers
+
+    def test_image_request_returns_the_full_v2_response(self) -> None:
+        result = fa.FoodAnalysisResponseV2(**_complete_result())
+        with mock.patch.object(main.fa, "analyze_image_with_state", return_value=(result, None)) as analyze_image:
+            body, status, headers = self._call(
+                "/analyze_food/image",
+                {"image": "aGVsbG8=", "context_text": "white rice"},
+                headers={"X-Request-ID": "req-1"},
+            )
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body, fa.FoodAnalysisResponseV2(**_complete_result()).model_dump())
+        self.assertEqual(headers["X-Request-ID"], "req-1")
+        analyze_image.assert_called_once_with(
+            self.client, image_data="aGVsbG8=", image_url=None, context_text="white rice"
+        )
+
+    def test_audio_is_transcribed_then_analyzed_as_text(self) -> None:
+        legacy = {"meal_name": "Eggs", "calories": 300, "protein": 20, "carbs": 2, "fats": 22}
+        with mock.patch.object(main.fa, "transcribe_audio", return_value="two eggs") as transcribe, mock.patch.object(
+            main.fa, "analyze_text", return_value=legacy
+        ) as analyze_text:
+            body, status, _ = self._call("/analyze_food/audio", {"audio": "AAAA", "format": "m4a"})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body["analysis_version"], "v2")
+        self.assertEqual(body["calories"], 300)
+        transcribe.assert_called_once_with(self.client, "AAAA", "m4a")
+        analyze_text.assert_called_once_with(self.client, "two eggs")
+
+    def test_missing_input_is_a_400_and_failures_are_a_500(self) -> None:
+        missing, missing_status, _ = self._call("/analyze_food/text", {"text": "  "})
+        with mock.patch.object(main.fa, "analyze_text", side_effect=RuntimeError("upstream down")):
+            failed, failed_status, _ = self._call("/analyze_food/text", {"text": "toast"})
+
+        self.assertEqual((missing_status, missing["error"]), (400, "No text description provided"))
+        self.assertEqual((failed_status, failed["error"]), (500, "Analysis failed"))
+
+    def test_response_formats_are_built_once_and_shared(self) -> None:
+        first = fa._build_response_format(fa.LegacyNutritionResponse, "text_food_analysis")
+
+        self.assertIs(fa._build_response_format(fa.LegacyNutritionResponse, "text_food_analysis"), first)
+
+
+if __name__ == "__main__":
+    unittest.main()
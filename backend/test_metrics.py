@@ -0,0 +1,64 @@
+import os
+import unittest
+from unittest import mock
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from fastapi.testclient import TestClient
+
+import app as backend_app
+import metrics
+
+
+class MetricsRenderingTests(unittest.TestCase):
+    def test_histogram_renders_cumulative_buckets(self) -> None:
+        histogram = metrics.Histogram("demo_seconds", "Demo", ("stage",), buckets=(0.1, 1))
+        histogram.observe(0.05, stage="a")
+        histogram.observe(0.5, stage="a")
+        histogram.observe(5, stage="a")
+
+        rendered = "\n".join(histogram.render())
+
+        self.assertIn('demo_seconds_bucket{stage="a",le="0.1"} 1', rendered)
+        self.assertIn('demo_seconds_bucket{stage="a",le="1"} 2', rendered)
+        self.assertIn('demo_seconds_bucket{stage="a",le="+Inf"} 3', rendered)
+        self.assertIn('demo_seconds_sum{stage="a"} 5.55', rendered)
+        self.assertIn('demo_seconds_count{stage="a"} 3', rendered)
+
+    def test_stage_timer_counts_errors_by_exception_type(self) -> None:
+        before = metrics.STAGE_ERRORS.value(stage="unit", model="m", exception="ValueError")
+
+        with self.assertRaises(ValueError):
+            with metrics.stage_timer("unit", "m"):
+                raise ValueError("boom")
+
+        self.assertEqual(
+            metrics.STAGE_ERRORS.value(stage="unit", model="m", exception="ValueError"), before + 1
+        )
+        self.assertGreaterEqual(metrics.STAGE_SECONDS.count(stage="unit", model="m"), 1)
+
+
+class MetricsEndpointTests(unittest.TestCase):
+    def test_metrics_endpoint_exposes_request_histograms(self) -> None:
+        client = TestClient(backend_app.app)
+        client.get("/subscription/unknown-route")
+
+        response = client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        self.assertIn("# TYPE http_request_duration_seconds histogram", response.text)
+        self.assertIn('endpoint="other",method="GET",status="404"', response.text)
+        self.assertIn("# TYPE food_analysis_stage_seconds histogram", response.text)
+
+    def test_multi_worker_series_carry_the_worker_pid(self) -> None:
+        with mock.patch.dict("os.environ", {"METRICS_WORKER_LABEL": "1"}):
+            response = TestClient(backend_app.app).get("/metrics")
+
+        samples = [line for line in response.text.splitlines() if line and not line.startswith("#")]
+        self.assertTrue(samples)
+        self.assertTrue(all(f'worker="{os.getpid()}"' in line for line in samples))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import random
+import unittest
+
+import food_analysis as fa
+import microbench
+
+
+class MicrobenchTests(unittest.TestCase):
+    def test_generated_payloads_exercise_the_real_parsers(self) -> None:
+        raw = microbench.generate_fenced_output(random.Random(0))
+        payload = fa._extract_json_payload(raw)
+        normalized = fa.normalize_food_analysis(payload)
+
+        self.assertTrue(raw.startswith("Sure!"))
+        self.assertEqual(len(normalized.items), 6)
+        self.assertEqual(normalized.assumptions, ["Rice cooked without oil", "Chicken grilled"])
+
+    def test_compare_flags_only_slowdowns_past_threshold(self) -> None:
+        baseline = {"results": {"a": {"us_per_call": 5000, "normalized": 1.0}, "b": {"us_per_call": 5000, "normalized": 1.0}}}
+        current = {"results": {"a": {"us_per_call": 6000, "normalized": 1.2}, "b": {"us_per_call": 7500, "normalized": 1.5}, "new": {"us_per_call": 1, "normalized": 0.1}}}
+
+        rows = {row["name"]: row for row in microbench.compare(current, baseline, threshold=0.3)}
+
+        self.assertFalse(rows["a"]["regressed"])
+        self.assertTrue(rows["b"]["regressed"])
+        self.assertNotIn("new", rows)
+
+    def test_sub_millisecond_benchmarks_get_the_wider_threshold(self) -> None:
+        baseline = {"results": {"fast": {"us_per_call": 10, "normalized": 1.0}}}
+
+        within = microbench.compare({"results": {"fast": {"us_per_call": 14, "normalized": 1.4}}}, baseline, 0.3)
+        past = microbench.compare({"results": {"fast": {"us_per_call": 16, "normalized": 1.6}}}, baseline, 0.3)
+
+        self.assertFalse(within[0]["regressed"])
+        self.assertTrue(past[0]["regressed"])
+
+    def test_baseline_covers_every_benchmark(self) -> None:
+        baseline = microbench.load_baseline()
+
+        self.assertIsNotNone(baseline)
+        self.assertEqual(set(baseline["results"]), {bench.name for bench in microbench.BENCHMARKS})
+
+    @unittest.skipUnless(os.getenv("RUN_MICROBENCH"), "set RUN_MICROBENCH=1 to run the performance gate")
+    def test_no_regressions_against_baseline(self) -> None:
+        report = microbench.run_suite()
+        rows = microbench.compare(report, microbench.load_baseline(), microbench.DEFAULT_THRESHOLD)
+
+        self.assertEqual([row["name"] for row in rows if row["regressed"]], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
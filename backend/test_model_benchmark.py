@@ -0,0 +1,225 @@
+import csv
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+from openai import RateLimitError
+
+import model_benchmark as mb
+from circuit_breaker import CircuitOpenError
+
+
+def _rate_limit_error(retry_after="0"):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, request=request, headers={"retry-after": retry_after})
+    return RateLimitError("Rate limit reached", response=response, body=None)
+
+
+def _fake_run(client, model, description):
+    base = {"gpt-5": 520, "gpt-5-mini": 540, "gpt-5-nano": 560}[model]
+    return mb.RunResult(
+        model=model, calories=base, protein=50, carbs=30, fats=20, meal_name="Chicken", duration_s=0.01
+    )
+
+
+class ConcurrentBenchmarkTests(unittest.TestCase):
+    def _run(self, **kwargs):
+        with mock.patch.object(mb, "build_client", return_value=object()), mock.patch.object(
+            mb, "run_single_prompt", side_effect=_fake_run
+        ), mock.patch("builtins.print"):
+            return mb.run_benchmark(
+                ["gpt-5", "gpt-5-mini", "gpt-5-nano"], 3, "chicken", mb.DEFAULT_GROUND_TRUTH, **kwargs
+            )
+
+    def test_concurrent_summaries_match_sequential(self) -> None:
+        sequential = self._run()
+        concurrent = self._run(concurrency=4, per_model_concurrency=2)
+
+        self.assertEqual(sequential[0], concurrent[0])
+        self.assertEqual(list(sequential[0]), list(concurrent[0]))
+        self.assertEqual(mb.format_summary_table(sequential[0]), mb.format_summary_table(concurrent[0]))
+
+    def test_per_model_limit_is_respected(self) -> None:
+        lock = threading.Lock()
+        active = {}
+        peak = {}
+
+        def _slow(model, job):
+            with lock:
+                active[model] = active.get(model, 0) + 1
+                peak[model] = max(peak.get(model, 0), active[model])
+            time.sleep(0.02)
+            with lock:
+                active[model] -= 1
+            return job
+
+        scheduler = mb.TrialScheduler(concurrency=6, per_model_concurrency=2)
+        jobs = [(model, i) for model in ("a", "b", "c") for i in range(4)]
+        results = list(scheduler.map(jobs, _slow))
+
+        self.assertEqual(len(results), 12)
+        self.assertEqual(max(peak.values()), 2)
+
+    def test_rate_limit_backs_off_and_retries(self) -> None:
+        calls = []
+
+        def _flaky():
+            calls.append(time.monotonic())
+            if len(calls) < 3:
+                raise _rate_limit_error("0.05")
+            return "ok"
+
+        scheduler = mb.TrialScheduler(concurrency=2)
+        with mock.patch("builtins.print"):
+            self.assertEqual(scheduler.call("gpt-5", _flaky), "ok")
+
+        self.assertEqual(scheduler.rate_limited, 2)
+        self.assertGreaterEqual(calls[1] - calls[0], 0.05)
+
+    def test_open_circuit_waits_for_retry_after(self) -> None:
+        calls = []
+
+        def _circuit_open():
+            calls.append(time.monotonic())
+            if len(calls) < 2:
+                raise CircuitOpenError(["gpt-5"], retry_after=0.05)
+            return "ok"
+
+        scheduler = mb.TrialScheduler()
+        with mock.patch("builtins.print"):
+            self.assertEqual(scheduler.call("gpt-5", _circuit_open), "ok")
+
+        self.assertEqual(scheduler.circuit_open, 1)
+        self.assertEqual(scheduler.rate_limited, 0)
+        self.assertGreaterEqual(calls[1] - calls[0], 0.05)
+
+    def test_rate_limit_gives_up_after_max_retries(self) -> None:
+        scheduler = mb.TrialScheduler(max_retries=1, base_backoff_s=0)
+
+        def _always_limited():
+            raise _rate_limit_error("")
+
+        with mock.patch("builtins.print"), self.assertRaises(RateLimitError):
+            scheduler.call("gpt-5", _always_limited)
+
+
+class _FakeTextClient:
+    def __init__(self) -> None:
+        self.models = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        self.models.append(kwargs["model"])
+        content = {"meal_name": "Eggs", "calories": 300, "protein": 20, "carbs": 10, "fats": 20}
+        return SimpleNamespace(
+            model=kwargs["model"],
+            choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(content)))],
+            usage=SimpleNamespace(
+                prompt_tokens=200, completion_tokens=50, prompt_tokens_details=SimpleNamespace(cached_tokens=0)
+            ),
+        )
+
+
+class DatasetBenchmarkTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.dataset = os.path.join(self.directory, "cases.jsonl")
+        with open(self.dataset, "w", encoding="utf-8") as dataset_file:
+            dataset_file.write('# comment\n')
+            dataset_file.write('{"id": "eggs", "description": "two eggs", "truth": {"calories": 280, "protein": 24}}\n')
+            dataset_file.write('{"description": "more eggs", "calories": 330}\n')
+
+    def test_load_dataset_reads_truth_from_either_place(self) -> None:
+        cases = mb.load_dataset(self.dataset)
+
+        self.assertEqual([c.case_id for c in cases], ["eggs", "case-3"])
+        self.assertEqual(cases[0].truth, {"calories": 280, "protein": 24})
+        self.assertEqual(cases[1].truth, {"calories": 330})
+
+    def test_bundled_datasets_load(self) -> None:
+        directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "datasets")
+        for name in os.listdir(directory):
+            self.assertTrue(mb.load_dataset(os.path.join(directory, name)))
+
+    def test_dataset_run_uses_production_pipeline_and_streams_csv(self) -> None:
+        client = _FakeTextClient()
+        output = os.path.join(self.directory, "runs.csv")
+
+        with mock.patch("builtins.print"):
+            summaries, results = mb.run_dataset_benchmark(
+                ["gpt-5-nano", "gpt-5-mini"], 2, mb.load_dataset(self.dataset), csv_output=output,
+                concurrency=3, client=client,
+            )
+
+        with open(output, newline="", encoding="utf-8") as csv_file:
+            rows = list(csv.DictReader(csv_file))
+        self.assertEqual(len(rows), 8)
+        self.assertEqual(sorted(set(client.models)), ["gpt-5-mini", "gpt-5-nano"])
+        nano = summaries["gpt-5-nano"]
+        self.assertEqual(nano["mae_calories"], 25)  # |300-280| and |300-330|
+        self.assertEqual(nano["mae_protein"], 4)
+        self.assertIsNone(nano["mae_carbs"])
+        self.assertEqual(nano["tokens_per_case"], 250)
+        self.assertGreater(nano["cost_per_case_usd"], 0)
+
+
+class _FakeImageClient:
+    def __init__(self) -> None:
+        self.schemas = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        name = kwargs["response_format"]["json_schema"]["name"]
+        self.schemas.append(name)
+        content = {"meal_name": "Rice bowl", "calories": 620, "protein": 40, "carbs": 70, "fats": 20}
+        if name != "food_image_nutrition":
+            content.update(needs_clarification=True, clarifying_question="Was oil used?")
+        return SimpleNamespace(
+            model=kwargs["model"],
+            choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(content)))],
+            usage=None,
+        )
+
+
+class ImageBenchmarkTests(unittest.TestCase):
+    def _run(self, fused):
+        client = _FakeImageClient()
+        cases = mb.load_image_dir_cases(["fs"])
+        with mock.patch("builtins.print"):
+            summaries, results = mb.run_dataset_benchmark(["gpt-5-mini"], 1, cases, client=client, fused=fused)
+        return client, summaries["gpt-5-mini"], results
+
+    def test_image_dir_cases_pick_up_bundled_truth(self) -> None:
+        cases = mb.load_image_dir_cases(["fs"])
+
+        self.assertEqual(len(cases), 3)
+        self.assertTrue(all(case.kind == "image" and case.truth.get("calories") for case in cases))
+
+    def test_sequential_pipeline_reports_stages_payload_and_clarifications(self) -> None:
+        client, summary, results = self._run(fused=False)
+
+        self.assertEqual(client.schemas.count("food_image_understanding"), 3)
+        self.assertEqual(client.schemas.count("food_image_nutrition"), 3)
+        self.assertIn("resize", summary["stage_latency_s"])
+        self.assertIn("food_image_nutrition", summary["stage_latency_s"])
+        self.assertGreater(summary["payload_kb"], 100)
+        self.assertEqual(summary["clarification_rate"], 1.0)
+        self.assertIsNotNone(summary["mae_calories"])
+        self.assertTrue(results[0].to_row()["resize_s"])
+
+    def test_fused_pipeline_makes_one_call_per_image(self) -> None:
+        client, summary, _ = self._run(fused=True)
+
+        self.assertEqual(client.schemas, ["food_image_fused"] * 3)
+        self.assertNotIn("food_image_understanding", summary["stage_latency_s"])
+        self.assertEqual(summary["clarification_rate"], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
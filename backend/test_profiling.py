@@ -0,0 +1,116 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from fastapi.testclient import TestClient
+
+import app as backend_app
+import food_analysis as fa
+
+
+def _slow_analyze_text(client, text, model=None):
+    deadline = time.perf_counter() + 0.1
+    while time.perf_counter() < deadline:
+        payload = fa._extract_json_payload('```json\n{"meal_name": "Eggs", "calories": "300"}\n```')
+        fa.LegacyNutritionResponse.model_validate({**payload, "calories": 300})
+    return {"meal_name": "Eggs", "calories": 300, "protein": 20, "carbs": 10, "fats": 20}
+
+
+def _busy_elsewhere(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class ProfilingMiddlewareTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.output_dir = tempfile.mkdtemp()
+        env = {
+            "PROFILE_OUTPUT_DIR": self.output_dir,
+            "ADMIN_API_KEY": "admin-secret",
+            "RATE_LIMIT_ENABLED": "0",
+            "PROFILE_SAMPLE_RATE": "0",
+        }
+        patches = [
+            mock.patch.dict("os.environ", env),
+            mock.patch.object(backend_app.fa, "analyze_text", side_effect=_slow_analyze_text),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.client = TestClient(backend_app.app)
+
+    def _post(self, headers=None):
+        return self.client.post(
+            "/analyze_food/text",
+            json={"text": "two eggs"},
+            headers={"X-User-ID": "user-1", **(headers or {})},
+        )
+
+    def test_admin_header_writes_collapsed_stacks_and_summary(self) -> None:
+        response = self._post({"X-Profile": "1", "X-Admin-Key": "admin-secret"})
+
+        profile_id = response.headers["x-profile-id"]
+        with open(os.path.join(self.output_dir, f"{profile_id}.collapsed"), encoding="utf-8") as stacks_file:
+            lines = stacks_file.read().splitlines()
+        with open(os.path.join(self.output_dir, f"{profile_id}.json"), encoding="utf-8") as summary_file:
+            summary = json.load(summary_file)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(lines)
+        self.assertTrue(all(line.rsplit(" ", 1)[1].isdigit() for line in lines))
+        self.assertTrue(any("test_profiling.py:_slow_analyze_text" in line for line in lines))
+        self.assertGreater(summary["components"]["pydantic_validation"], 0)
+        self.assertGreater(summary["components"]["json_parsing"], 0)
+        self.assertTrue(summary["top_allocations"])
+
+    def test_other_threads_are_not_sampled(self) -> None:
+        stop = threading.Event()
+        other = threading.Thread(target=_busy_elsewhere, args=(stop,))
+        other.start()
+        try:
+            response = self._post({"X-Profile": "1", "X-Admin-Key": "admin-secret"})
+        finally:
+            stop.set()
+            other.join()
+
+        profile_id = response.headers["x-profile-id"]
+        with open(os.path.join(self.output_dir, f"{profile_id}.collapsed"), encoding="utf-8") as stacks_file:
+            stacks = stacks_file.read()
+
+        self.assertIn("test_profiling.py:_slow_analyze_text", stacks)
+        self.assertNotIn("_busy_elsewhere", stacks)
+
+    def test_profiling_requires_a_valid_admin_key(self) -> None:
+        response = self._post({"X-Profile": "1", "X-Admin-Key": "wrong"})
+
+        self.assertNotIn("x-profile-id", response.headers)
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+    def test_sampling_profiles_one_in_n_analysis_requests(self) -> None:
+        with mock.patch.dict("os.environ", {"PROFILE_SAMPLE_RATE": "2"}):
+            profiled = ["x-profile-id" in self._post().headers for _ in range(4)]
+
+        self.assertEqual(sum(profiled), 2)
+
+    def test_client_request_id_never_reaches_the_file_path(self) -> None:
+        with mock.patch.dict("os.environ", {"PROFILE_SAMPLE_RATE": "1"}):
+            response = self._post({"X-Request-ID": "../escaped"})
+
+        profile_id = response.headers["x-profile-id"]
+        with open(os.path.join(self.output_dir, f"{profile_id}.json"), encoding="utf-8") as summary_file:
+            summary = json.load(summary_file)
+
+        self.assertRegex(profile_id, r"^[0-9a-f]{32}$")
+        self.assertEqual(sorted(os.listdir(self.output_dir)), [f"{profile_id}.collapsed", f"{profile_id}.json"])
+        self.assertFalse(any("escaped" in name for name in os.listdir(os.path.dirname(self.output_dir))))
+        self.assertEqual(summary["request_id"], "../escaped")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import time
+import unittest
+from unittest import mock
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+import jwt
+from fastapi.testclient import TestClient
+
+import app as backend_app
+from middleware import auth
+from middleware import rate_limit as rl
+
+
+class InMemoryBucketStoreTests(unittest.TestCase):
+    def test_bucket_allows_burst_then_reports_retry_after(self) -> None:
+        store = rl.InMemoryBucketStore()
+        policy = rl.BucketPolicy(capacity=8, refill_per_second=1)
+
+        self.assertEqual(store.take("user-1", 4, policy), (True, 0.0))
+        self.assertEqual(store.take("user-1", 4, policy), (True, 0.0))
+        allowed, retry_after = store.take("user-1", 4, policy)
+
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 4.0, places=1)
+        self.assertTrue(store.take("user-2", 4, policy)[0])
+
+    def test_tracked_users_are_bounded(self) -> None:
+        store = rl.InMemoryBucketStore(max_users=2)
+        policy = rl.BucketPolicy(capacity=1, refill_per_second=0.001)
+
+        for user_id in ("a", "b", "c"):
+            store.take(user_id, 1, policy)
+
+        self.assertEqual(len(store._buckets), 2)
+        self.assertTrue(store.take("a", 1, policy)[0])
+
+
+class RateLimitDependencyTests(unittest.TestCase):
+    def setUp(self) -> None:
+        rl._tier_cache.clear()
+        patches = [
+            mock.patch.object(rl, "_store", rl.InMemoryBucketStore()),
+            mock.patch.object(
+                rl,
+                "_policies",
+                {
+                    "free": rl.BucketPolicy(capacity=1, refill_per_second=0.5),
+                    "monthly": rl.BucketPolicy(capacity=3, refill_per_second=0.5),
+                },
+            ),
+            mock.patch.object(
+                backend_app.fa,
+                "analyze_text",
+                return_value={"meal_name": "Toast", "calories": 80, "protein": 3, "carbs": 14, "fats": 1},
+            ),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = TestClient(backend_app.app)
+
+    def _post_text(self, user_id):
+        return self.client.post(
+            "/analyze_food/text", json={"text": "toast"}, headers={"X-User-ID": user_id}
+        )
+
+    def test_free_user_gets_429_with_retry_after(self) -> None:
+        free = {"tier": None, "has_access": False}
+        with mock.patch.object(rl.StripeService, "get_subscription_status", return_value=free) as lookup:
+            first = self._post_text("user-1")
+            second = self._post_text("user-1")
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 429)
+        self.assertEqual(second.headers["Retry-After"], "2")
+        self.assertEqual(lookup.call_count, 1)
+
+    def test_paid_tier_gets_larger_budget(self) -> None:
+        paid = {"tier": "monthly", "has_access": True}
+        with mock.patch.object(rl.StripeService, "get_subscription_status", return_value=paid):
+            codes = [self._post_text("user-2").status_code for _ in range(4)]
+
+        self.assertEqual(codes, [200, 200, 200, 429])
+
+    def test_meal_image_cost_scales_with_photo_count(self) -> None:
+        result = (backend_app.fa.FoodAnalysisResponseV2(meal_name="Toast"), None)
+        policies = {"free": rl.BucketPolicy(capacity=10, refill_per_second=0.01)}
+        with mock.patch.object(rl, "_policies", policies), mock.patch.object(
+            backend_app.fa, "analyze_meal_images_with_state", return_value=result
+        ), mock.patch.object(rl.StripeService, "get_subscription_status", return_value={"has_access": False}):
+            codes = [
+                self.client.post(
+                    "/analyze_food/images",
+                    json={"image_urls": [f"https://example.com/{n}.jpg" for n in range(photos)]},
+                    headers={"X-User-ID": "user-4"},
+                ).status_code
+                for photos in (2, 2, 1)
+            ]
+
+        self.assertEqual(codes, [200, 429, 200])
+
+    def test_verified_token_subject_is_the_bucket_key(self) -> None:
+        secret = "jwt-test-secret-0123456789abcdef0123"
+        token = jwt.encode(
+            {"sub": "user-5", "aud": "authenticated", "exp": int(time.time() + 120)}, secret, algorithm="HS256"
+        )
+        auth.get_supabase_jwt_secret.cache_clear()
+        self.addCleanup(auth.get_supabase_jwt_secret.cache_clear)
+        free = {"tier": None, "has_access": False}
+        with mock.patch.dict("os.environ", {"SUPABASE_JWT_SECRET": secret}), mock.patch.object(
+            rl.StripeService, "get_subscription_status", return_value=free
+        ) as lookup:
+            codes = [
+                self.client.post(
+                    "/analyze_food/text",
+                    json={"text": "toast"},
+                    headers={"X-User-ID": spoofed, "Authorization": f"Bearer {token}"},
+                ).status_code
+                for spoofed in ("a", "b")
+            ]
+
+        self.assertEqual(codes, [200, 429])
+        lookup.assert_called_once_with("user-5", raise_errors=True)
+
+    def test_failed_lookups_are_not_cached(self) -> None:
+        outcomes = [RuntimeError("supabase down"), {"tier": "monthly", "has_access": True}]
+        with mock.patch.object(rl.StripeService, "get_subscription_status", side_effect=outcomes) as lookup:
+            self.assertEqual(rl.resolve_tier("user-3"), "free")
+            self.assertEqual(rl.resolve_tier("user-3"), "monthly")
+            self.assertEqual(rl.resolve_tier("user-3"), "monthly")
+
+        self.assertEqual(lookup.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
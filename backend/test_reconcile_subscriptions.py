@@ -0,0 +1,147 @@
+import unittest
+from unittest import mock
+
+import reconcile_subscriptions as rs
+from fakes import FakeSupabase
+
+
+def _subscription(subscription_id, customer, status, created=1, **overrides):
+    subscription = {
+        "id": subscription_id,
+        "customer": customer,
+        "status": status,
+        "created": created,
+        "metadata": {},
+        "items": {"data": [{"price": {"id": "price_yearly"}}]},
+        "cancel_at_period_end": False,
+        "current_period_end": 1_735_689_600,
+    }
+    subscription.update(overrides)
+    return subscription
+
+
+class ReconcileSubscriptionsTests(unittest.TestCase):
+    def setUp(self) -> None:
+        patcher = mock.patch.dict("os.environ", {"STRIPE_YEARLY_PRICE_ID": "price_yearly"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.end_date = rs.StripeService.build_subscription_update(
+            _subscription("sub_x", "cus_x", "active")
+        )["subscription_end_date"]
+
+    def _profiles(self):
+        return FakeSupabase(
+            {
+                "user_profiles": [
+                    {
+                        "uid": "in-sync",
+                        "stripe_customer_id": "cus_1",
+                        "stripe_subscription_id": "sub_1",
+                        "subscription_status": "active",
+                        "subscription_tier": "yearly",
+                        "subscription_end_date": self.end_date,
+                        "cancel_at_period_end": False,
+                    },
+                    {
+                        "uid": "missed-update",
+                        "stripe_customer_id": "cus_2",
+                        "stripe_subscription_id": "sub_2",
+                        "subscription_status": "active",
+                        "subscription_tier": "yearly",
+                        "subscription_end_date": self.end_date,
+                        "cancel_at_period_end": False,
+                    },
+                    {
+                        "uid": "missed-create",
+                        "stripe_customer_id": None,
+                        "stripe_subscription_id": None,
+                        "subscription_status": "free",
+                    },
+                    {
+                        "uid": "missed-delete",
+                        "stripe_customer_id": "cus_4",
+                        "stripe_subscription_id": "sub_4",
+                        "subscription_status": "active",
+                        "subscription_tier": "yearly",
+                    },
+                ]
+            }
+        )
+
+    def _subscriptions(self):
+        return [
+            _subscription("sub_1", "cus_1", "active"),
+            _subscription("sub_old", "cus_2", "canceled", created=1),
+            _subscription("sub_2", "cus_2", "past_due", created=2),
+            _subscription("sub_3", "cus_3", "trialing", metadata={"user_id": "missed-create"}),
+        ]
+
+    def test_dry_run_reports_only_changed_rows(self) -> None:
+        db = self._profiles()
+
+        report = rs.reconcile(db, self._subscriptions(), dry_run=True, batch_size=2, concurrency=2)
+
+        changes = {change["uid"]: change["set"] for change in report.changes}
+        self.assertEqual(report.subscriptions_seen, 4)
+        self.assertEqual(report.customers_seen, 3)
+        self.assertNotIn("in-sync", changes)
+        self.assertEqual(changes["missed-update"], {"subscription_status": "past_due"})
+        self.assertEqual(changes["missed-create"]["subscription_status"], "trialing")
+        self.assertEqual(changes["missed-create"]["stripe_customer_id"], "cus_3")
+        self.assertEqual(changes["missed-delete"], rs.DELETED_SUBSCRIPTION_UPDATE)
+        self.assertEqual(db.tables["user_profiles"].upserts, [])
+
+    def test_apply_writes_changes_and_converges(self) -> None:
+        db = self._profiles()
+
+        report = rs.reconcile(db, self._subscriptions(), dry_run=False, batch_size=2, concurrency=2)
+        rerun = rs.reconcile(db, self._subscriptions(), dry_run=True, batch_size=2, concurrency=2)
+
+        self.assertEqual(report.rows_updated, 3)
+        self.assertEqual(rerun.changes, [])
+
+    def test_rows_with_different_end_dates_are_written_in_one_request(self) -> None:
+        profiles = [
+            {"uid": f"user-{n}", "stripe_customer_id": f"cus_{n}", "subscription_status": "free", "gender": "female"}
+            for n in range(3)
+        ]
+        db = FakeSupabase({"user_profiles": profiles})
+        subscriptions = [
+            _subscription(f"sub_{n}", f"cus_{n}", "active", current_period_end=1_735_689_600 + n * 86_400)
+            for n in range(3)
+        ]
+
+        report = rs.reconcile(db, subscriptions, dry_run=False, batch_size=200)
+
+        upserts = db.tables["user_profiles"].upserts
+        self.assertEqual(report.rows_updated, 3)
+        self.assertEqual(len(upserts), 1)
+        self.assertEqual(len({row["subscription_end_date"] for row in upserts[0]}), 3)
+        self.assertTrue(all(row["gender"] == "female" for row in upserts[0]))
+
+    def test_customer_with_only_a_canceled_subscription_loses_access(self) -> None:
+        db = FakeSupabase(
+            {
+                "user_profiles": [
+                    {
+                        "uid": "canceled",
+                        "stripe_customer_id": "cus_5",
+                        "stripe_subscription_id": "sub_5",
+                        "subscription_status": "active",
+                        "subscription_tier": "yearly",
+                        "cancel_at_period_end": True,
+                    }
+                ]
+            }
+        )
+        subscriptions = [_subscription("sub_5", "cus_5", "canceled", cancel_at_period_end=True)]
+
+        report = rs.reconcile(db, subscriptions, dry_run=False)
+        rerun = rs.reconcile(db, subscriptions, dry_run=True)
+
+        self.assertEqual(report.changes, [{"uid": "canceled", "set": rs.DELETED_SUBSCRIPTION_UPDATE}])
+        self.assertEqual(rerun.changes, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+import os
+import unittest
+from unittest import mock
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from fastapi.testclient import TestClient
+
+import app as backend_app
+import food_analysis as fa
+from refinement import RefinementSessions
+
+
+class _FakeModel:
+    """Stands in for the structured completion call, recording schema names"""
+
+    def __init__(self, needs_clarification=True):
+        self.needs_clarification = needs_clarification
+        self.calls = []
+
+    def __call__(self, client, *, model, messages, schema_model, schema_name):
+        self.calls.append((schema_name, messages))
+        if schema_model is fa.ImageUnderstandingResponse:
+            return fa.ImageUnderstandingResponse(
+                meal_name="Pasta",
+                visible_items=["pasta", "sauce"],
+                needs_clarification=self.needs_clarification,
+                clarifying_question="Was the sauce cream-based?" if self.needs_clarification else None,
+            )
+        return schema_model(meal_name="Pasta", calories=650, protein=20, carbs=80, fats=25, confidence=0.7)
+
+
+class RefinementSessionsTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sessions = RefinementSessions(ttl=60, maxsize=8)
+        self.state = fa.ImageRefinementState(
+            image_url="https://example.com/pasta.jpg",
+            stage1=fa.ImageUnderstandingResponse(meal_name="Pasta"),
+            model="gpt-5-mini",
+        )
+
+    def test_round_trips_state_for_the_owner_only(self) -> None:
+        session_id = self.sessions.create(self.state, "user-1")
+
+        self.assertEqual(self.sessions.get(session_id, "user-1"), self.state)
+        self.assertIsNone(self.sessions.get(session_id, "user-2"))
+
+    def test_discarded_sessions_are_gone(self) -> None:
+        session_id = self.sessions.create(self.state, "user-1")
+        self.sessions.discard(session_id)
+
+        self.assertIsNone(self.sessions.get(session_id, "user-1"))
+
+
+class ImageRefinementEndpointTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.model = _FakeModel()
+        patches = [
+            mock.patch.dict("os.environ", {"RATE_LIMIT_ENABLED": "0"}),
+            mock.patch.object(backend_app, "get_client", return_value=object()),
+            mock.patch.object(fa, "_run_structured_chat_completion", side_effect=self.model),
+            mock.patch.object(backend_app, "refinement_sessions", RefinementSessions(ttl=60, maxsize=8)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.client = TestClient(backend_app.app)
+
+    def _post(self, body, user_id="user-1"):
+        return self.client.post("/analyze_food/image", json=body, headers={"X-User-ID": user_id})
+
+    def test_clarification_reply_runs_only_stage_two(self) -> None:
+        first = self._post({"image_url": "https://example.com/pasta.jpg"}).json()
+        self.model.calls.clear()
+
+        reply = self._post({"session_id": first["session_id"], "context_text": "cream sauce"})
+
+        self.assertEqual(first["status"], "needs_clarification")
+        self.assertEqual(reply.status_code, 200)
+        self.assertEqual(reply.json()["status"], "complete")
+        self.assertIsNone(reply.json()["session_id"])
+        self.assertEqual([name for name, _ in self.model.calls], ["food_image_nutrition"])
+        self.assertIn("cream sauce", self.model.calls[0][1][1]["content"][-1]["text"])
+
+    def test_sessions_are_single_use_and_per_user(self) -> None:
+        session_id = self._post({"image_url": "https://example.com/pasta.jpg"}).json()["session_id"]
+
+        other_user = self._post({"session_id": session_id, "context_text": "cream"}, user_id="user-2")
+        self._post({"session_id": session_id, "context_text": "cream"})
+        reused = self._post({"session_id": session_id, "context_text": "cream"})
+
+        self.assertEqual(other_user.status_code, 410)
+        self.assertEqual(reused.status_code, 410)
+        self.assertEqual(reused.json()["detail"], "refinement_session_expired")
+
+    def test_expired_session_falls_back_to_a_resent_image(self) -> None:
+        response = self._post(
+            {"session_id": "missing", "context_text": "cream", "image_url": "https://example.com/pasta.jpg"}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [name for name, _ in self.model.calls], ["food_image_understanding", "food_image_nutrition"]
+        )
+
+    def test_complete_responses_do_not_open_a_session(self) -> None:
+        self.model.needs_clarification = False
+
+        body = self._post({"image_url": "https://example.com/pasta.jpg"}).json()
+
+        self.assertEqual(body["status"], "complete")
+        self.assertIsNone(body["session_id"])
+
+    def test_multi_photo_sessions_refine_with_every_photo(self) -> None:
+        first = self.client.post(
+            "/analyze_food/images",
+            json={"image_urls": ["https://example.com/a.jpg", "https://example.com/b.jpg"]},
+            headers={"X-User-ID": "user-1"},
+        ).json()
+        self.model.calls.clear()
+
+        self._post({"session_id": first["session_id"], "context_text": "cream sauce"})
+
+        parts = self.model.calls[0][1][1]["content"]
+        self.assertEqual(
+            [part["image_url"]["url"] for part in parts[:-1]], ["https://example.com/a.jpg", "https://example.com/b.jpg"]
+        )
+
+    def test_cache_failures_return_the_analysis_without_a_session(self) -> None:
+        with mock.patch.object(
+            backend_app.refinement_sessions._cache, "set", side_effect=OSError("database or disk is full")
+        ):
+            response = self._post({"image_url": "https://example.com/pasta.jpg"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "needs_clarification")
+        self.assertIsNone(response.json()["session_id"])
+
+    def test_session_id_requires_context_text(self) -> None:
+        self.assertEqual(self._post({"session_id": "abc"}).status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
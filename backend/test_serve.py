@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import serve
+
+
+class WorkerCountTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.root = tempfile.mkdtemp()
+        patcher = mock.patch.object(serve, "available_cpus", return_value=8)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        env = mock.patch.dict("os.environ")
+        env.start()
+        self.addCleanup(env.stop)
+        os.environ.pop("WEB_CONCURRENCY", None)
+
+    def _write(self, path: str, content: str) -> None:
+        full_path = self.root + path
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w", encoding="ascii") as cgroup_file:
+            cgroup_file.write(content)
+
+    def test_cgroup_v2_quota_rounds_up_to_whole_workers(self) -> None:
+        self._write(serve.CGROUP_V2_CPU_MAX, "250000 100000\n")
+
+        self.assertEqual(serve.cgroup_cpu_limit(self.root), 2.5)
+        self.assertEqual(serve.worker_count(self.root), 3)
+
+    def test_cgroup_v1_quota_and_unlimited_quota(self) -> None:
+        self._write(serve.CGROUP_V1_QUOTA, "100000")
+        self._write(serve.CGROUP_V1_PERIOD, "100000")
+        self.assertEqual(serve.worker_count(self.root), 1)
+
+        self._write(serve.CGROUP_V2_CPU_MAX, "max 100000")
+        self.assertEqual(serve.worker_count(self.root), 8)
+
+    def test_web_concurrency_overrides_the_quota(self) -> None:
+        self._write(serve.CGROUP_V2_CPU_MAX, "100000 100000")
+        os.environ["WEB_CONCURRENCY"] = "4"
+
+        self.assertEqual(serve.worker_count(self.root), 4)
+
+
+class SharedCacheDefaultTests(unittest.TestCase):
+    def test_small_shm_falls_back_to_tmp(self) -> None:
+        shm_dir = tempfile.mkdtemp()
+
+        with mock.patch.object(serve, "MIN_SHM_BYTES", 1):
+            self.assertEqual(serve.default_shared_cache_url(shm_dir), serve.DEFAULT_SHARED_CACHE_URL)
+        with mock.patch.object(serve, "MIN_SHM_BYTES", float("inf")):
+            self.assertEqual(serve.default_shared_cache_url(shm_dir), serve.FALLBACK_SHARED_CACHE_URL)
+        self.assertEqual(serve.default_shared_cache_url(shm_dir + "/missing"), serve.FALLBACK_SHARED_CACHE_URL)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import subprocess
+import sys
+import unittest
+
+import lazy_imports
+import startup_bench
+
+IMPORTTIME_SAMPLE = """\
+import time: self [us] | cumulative | imported package
+import time:       100 |        100 |     pydantic.fields
+import time:       400 |        500 |   pydantic
+import time:      2000 |       2000 |   openai.types
+import time:       300 |       2300 |   openai
+import time:        50 |       2850 | app
+"""
+
+
+class StartupBenchTests(unittest.TestCase):
+    def test_parse_importtime_sums_top_level_and_groups_by_package(self) -> None:
+        summary = startup_bench.summarize_imports(startup_bench.parse_importtime(IMPORTTIME_SAMPLE))
+
+        self.assertEqual(summary["total_ms"], 2.9)
+        self.assertEqual(summary["modules"], 5)
+        self.assertEqual(list(summary["top_packages_ms"]), ["openai", "pydantic", "app"])
+        self.assertEqual(summary["eager_deferred_modules"], ["openai"])
+
+    def test_importing_the_app_does_not_load_request_time_sdks(self) -> None:
+        code = (
+            "import sys, app; "
+            f"print(','.join(m for m in {startup_bench.DEFERRED_MODULES!r} if m in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=startup_bench.BACKEND_DIR,
+            env=startup_bench._bench_env(),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        self.assertEqual(result.stdout.strip(), "")
+
+
+class LazyModuleTests(unittest.TestCase):
+    def test_module_is_imported_and_hooked_on_first_attribute_access(self) -> None:
+        loaded = []
+        proxy = lazy_imports.lazy_module("colorsys", on_load=lambda module: loaded.append(module.__name__))
+        self.addCleanup(lazy_imports._proxies.pop, "colorsys", None)
+
+        self.assertEqual(loaded, [])
+        self.assertEqual(proxy.rgb_to_hsv(1.0, 0.0, 0.0), (0.0, 1.0, 1.0))
+        self.assertEqual(loaded, ["colorsys"])
+        self.assertIs(lazy_imports.lazy_module("colorsys"), proxy)
+
+    def test_hook_registered_after_load_runs_immediately(self) -> None:
+        proxy = lazy_imports.lazy_module("colorsys")
+        self.addCleanup(lazy_imports._proxies.pop, "colorsys", None)
+        proxy.ONE_THIRD
+        loaded = []
+
+        lazy_imports.lazy_module("colorsys", on_load=lambda module: loaded.append(module.__name__))
+
+        self.assertEqual(loaded, ["colorsys"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+from unittest import mock
+
+import stripe_service
+from fakes import FakeStripeAPI, FakeSupabase
+from stripe_service import StripeService
+from subscription_mirror import SubscriptionMirror
+
+
+def _subscription(subscription_id: str = "sub_1", **overrides):
+    subscription = {
+        "id": subscription_id,
+        "customer": "cus_1",
+        "status": "trialing",
+        "metadata": {"user_id": "user-1"},
+        "items": {"data": [{"price": {"id": "price_monthly"}}]},
+        "trial_end": None,
+        "cancel_at_period_end": False,
+        "current_period_start": 1_700_000_000,
+        "current_period_end": 1_702_592_000,
+    }
+    subscription.update(overrides)
+    return subscription
+
+
+class SubscriptionMirrorTests(unittest.TestCase):
+    def test_cache_miss_falls_back_to_stripe_once(self) -> None:
+        api = FakeStripeAPI(subscriptions={"sub_1": _subscription()})
+        mirror = SubscriptionMirror(api=api)
+
+        first = mirror.get_subscription("sub_1")
+        second = mirror.get_subscription("sub_1")
+
+        self.assertEqual(first["id"], "sub_1")
+        self.assertIs(first, second)
+        self.assertEqual(api.calls, [("subscription", "sub_1")])
+
+    def test_webhook_payloads_keep_mirror_current(self) -> None:
+        api = FakeStripeAPI()
+        mirror = SubscriptionMirror(api=api)
+
+        mirror.observe_event(
+            {
+                "type": "customer.subscription.updated",
+                "data": {"object": _subscription(status="past_due")},
+            }
+        )
+        mirror.observe_event(
+            {
+                "type": "customer.updated",
+                "data": {"object": {"id": "cus_2", "metadata": {"user_id": "user-2"}}},
+            }
+        )
+
+        self.assertEqual(mirror.get_subscription("sub_1")["status"], "past_due")
+        self.assertEqual(mirror.get_user_id_for_customer("cus_1"), "user-1")
+        self.assertEqual(mirror.get_user_id_for_customer("cus_2"), "user-2")
+        self.assertEqual(api.calls, [])
+
+    def test_subscription_without_metadata_resolves_user_through_customer(self) -> None:
+        api = FakeStripeAPI(customers={"cus_1": {"id": "cus_1", "metadata": {"user_id": "user-1"}}})
+        mirror = SubscriptionMirror(api=api)
+        subscription = _subscription(metadata={})
+
+        self.assertEqual(mirror.get_user_id_for_subscription(subscription), "user-1")
+        self.assertEqual(mirror.get_user_id_for_subscription(subscription), "user-1")
+        self.assertEqual(api.calls, [("customer", "cus_1")])
+
+    def test_deleted_subscription_is_refetched(self) -> None:
+        api = FakeStripeAPI(subscriptions={"sub_1": _subscription(status="canceled")})
+        mirror = SubscriptionMirror(api=api)
+        mirror.record_subscription(_subscription())
+
+        mirror.observe_event(
+            {"type": "customer.subscription.deleted", "data": {"object": _subscription()}}
+        )
+
+        self.assertEqual(mirror.get_subscription("sub_1")["status"], "canceled")
+        self.assertEqual(api.calls, [("subscription", "sub_1")])
+
+
+class CheckoutWebhookTests(unittest.TestCase):
+    def test_checkout_completed_uses_mirrored_subscription(self) -> None:
+        api = FakeStripeAPI()
+        mirror = SubscriptionMirror(api=api)
+        db = FakeSupabase({"user_profiles": [{"uid": "user-1", "subscription_status": "free"}]})
+        created = {"type": "customer.subscription.created", "data": {"object": _subscription()}}
+        completed = {
+            "type": "checkout.session.completed",
+            "data": {"object": {"id": "cs_1", "mode": "subscription", "subscription": "sub_1"}},
+        }
+
+        with mock.patch.object(stripe_service, "subscription_mirror", mirror), mock.patch.object(
+            stripe_service, "supabase", db
+        ), mock.patch.dict("os.environ", {"STRIPE_MONTHLY_PRICE_ID": "price_monthly"}):
+            StripeService.handle_webhook_event(created)
+            StripeService.handle_webhook_event(completed)
+
+        row = db.tables["user_profiles"].rows[0]
+        self.assertEqual(row["subscription_status"], "trialing")
+        self.assertEqual(row["subscription_tier"], "monthly")
+        self.assertEqual(row["stripe_subscription_id"], "sub_1")
+        self.assertEqual(api.calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from fastapi.testclient import TestClient
+
+import app as backend_app
+import metrics
+import request_context
+import usage
+from fakes import FakeSupabase
+
+
+def _response(prompt=1000, cached=400, completion=200, model="gpt-5-mini-2025-08-07"):
+    return SimpleNamespace(
+        model=model,
+        usage=SimpleNamespace(
+            prompt_tokens=prompt,
+            completion_tokens=completion,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=cached),
+        ),
+    )
+
+
+class UsageAccountingTests(unittest.TestCase):
+    def setUp(self) -> None:
+        usage.AGGREGATOR.reset()
+        self.addCleanup(usage.AGGREGATOR.reset)
+
+    def test_cost_uses_cached_rate_and_snapshot_prefix_match(self) -> None:
+        record = usage.record_completion_usage("gpt-5-mini", "food_image_nutrition", _response())
+
+        # 600 uncached * 0.25 + 400 cached * 0.025 + 200 out * 2.0, per 1M tokens
+        self.assertAlmostEqual(record.cost_usd, (600 * 0.25 + 400 * 0.025 + 200 * 2.0) / 1e6)
+
+    def test_price_table_override_from_env(self) -> None:
+        with mock.patch.dict("os.environ", {"OPENAI_PRICE_TABLE": '{"gpt-5-nano": {"output": 1.0}}'}):
+            table = usage.load_price_table()
+
+        self.assertEqual(table["gpt-5-nano"]["output"], 1.0)
+        self.assertEqual(table["gpt-5-nano"]["input"], 0.05)
+
+    def test_records_attach_to_request_and_aggregate_per_user(self) -> None:
+        async def _request():
+            request_context.user_id_var.set("user-1")
+            request_context.usage_var.set([])
+            usage.record_completion_usage("gpt-5-nano", "text_food_analysis", _response(model="gpt-5-nano"))
+            usage.record_transcription_usage("whisper-1", 30)
+            return request_context.get_usage_records(), usage.request_cost_usd()
+
+        records, cost = asyncio.run(_request())
+        snapshot = usage.AGGREGATOR.snapshot()
+
+        self.assertEqual([r.operation for r in records], ["text_food_analysis", "transcription"])
+        self.assertAlmostEqual(cost, sum(r.cost_usd for r in records))
+        self.assertEqual(snapshot["top_users"]["user-1"]["requests"], 2)
+        self.assertAlmostEqual(snapshot["by_model"]["whisper-1"]["cost_usd"], 0.003)
+
+    def test_cached_token_ratio_is_tracked_per_operation_and_exported(self) -> None:
+        hits_before = metrics.PROMPT_TOKENS.value(model="gpt-5-mini", operation="food_image_nutrition", cache="hit")
+        usage.record_completion_usage("gpt-5-mini", "food_image_nutrition", _response(prompt=1000, cached=400))
+        usage.record_completion_usage("gpt-5-mini", "food_image_nutrition", _response(prompt=1000, cached=800))
+
+        by_operation = usage.AGGREGATOR.snapshot()["by_operation"]
+
+        self.assertEqual(by_operation["food_image_nutrition"]["cached_token_ratio"], 0.6)
+        self.assertEqual(
+            metrics.PROMPT_TOKENS.value(model="gpt-5-mini", operation="food_image_nutrition", cache="hit") - hits_before,
+            1200,
+        )
+
+    def test_flush_writes_deltas_once(self) -> None:
+        db = FakeSupabase()
+        flusher = usage.UsageFlusher(db, interval_s=60)
+        usage.record_usage(usage.UsageRecord(model="gpt-5-nano", operation="t", prompt_tokens=10, user_id="u"))
+
+        self.assertEqual(flusher.flush(), 1)
+        self.assertEqual(flusher.flush(), 0)
+        row = db.tables["api_usage"].rows[0]
+        self.assertEqual((row["uid"], row["model"], row["prompt_tokens"]), ("u", "gpt-5-nano", 10))
+
+    def test_rows_the_database_rejects_are_dropped_not_retried(self) -> None:
+        db = _RejectingSupabase(bad_uid="not-a-user")
+        flusher = usage.UsageFlusher(db, interval_s=60)
+        for user in ("u1", "not-a-user", "u2"):
+            usage.record_usage(usage.UsageRecord(model="gpt-5-nano", operation="t", prompt_tokens=10, user_id=user))
+
+        self.assertEqual(flusher.flush(), 2)
+        self.assertEqual(flusher.flush(), 0)
+        self.assertEqual(sorted(row["uid"] for row in db.tables["api_usage"].rows), ["u1", "u2"])
+
+    def test_outages_keep_rows_for_the_next_flush_folding_past_the_cap(self) -> None:
+        db = _RejectingSupabase(outage=True)
+        flusher = usage.UsageFlusher(db, interval_s=60)
+        for user in ("u1", "u2", "u3"):
+            usage.record_usage(usage.UsageRecord(model="gpt-5-nano", operation="t", prompt_tokens=10, user_id=user))
+
+        with mock.patch.object(usage, "MAX_PENDING_ROWS", 2), self.assertRaises(ConnectionError):
+            flusher.flush()
+        db.outage = False
+
+        self.assertEqual(flusher.flush(), 3)
+        rows = db.tables["api_usage"].rows
+        self.assertEqual(sorted(row["uid"] for row in rows), ["other", "u1", "u2"])
+        self.assertEqual(sum(row["prompt_tokens"] for row in rows), 30)
+
+    def test_users_past_the_tracking_cap_still_reach_api_usage(self) -> None:
+        db = FakeSupabase()
+        with mock.patch.object(usage, "MAX_TRACKED_USERS", 1):
+            for user in ("u1", "u2", "u3"):
+                usage.record_usage(usage.UsageRecord(model="gpt-5-nano", operation="t", prompt_tokens=10, user_id=user))
+            tracked = usage.AGGREGATOR.snapshot()["tracked_users"]
+            usage.UsageFlusher(db, interval_s=60).flush()
+
+        rows = {row["uid"]: row["prompt_tokens"] for row in db.tables["api_usage"].rows}
+        self.assertEqual(tracked, 1)
+        self.assertEqual(rows, {"u1": 10, "other": 20})
+
+
+class _DatabaseError(Exception):
+    def __init__(self, code: str) -> None:
+        super().__init__(code)
+        self.code = code
+
+
+class _RejectingSupabase(FakeSupabase):
+    """Fails inserts like PostgREST: a bad uid rejects the whole batch, an outage fails everything"""
+
+    def __init__(self, bad_uid=None, outage=False) -> None:
+        super().__init__()
+        self.bad_uid = bad_uid
+        self.outage = outage
+
+    def table(self, name):
+        query = super().table(name)
+        execute = query.execute
+
+        def _execute():
+            if self.outage:
+                raise ConnectionError("supabase unreachable")
+            if any(row["uid"] == self.bad_uid for row in query._insert or []):
+                raise _DatabaseError("22P02")
+            return execute()
+
+        query.execute = _execute
+        return query
+
+
+class AdminUsageEndpointTests(unittest.TestCase):
+    def test_requires_admin_key(self) -> None:
+        client = TestClient(backend_app.app)
+        with mock.patch.dict("os.environ", {"ADMIN_API_KEY": "secret"}):
+            denied = client.get("/admin/usage", headers={"X-Admin-Key": "wrong"})
+            allowed = client.get("/admin/usage", headers={"X-Admin-Key": "secret"})
+
+        self.assertEqual(denied.status_code, 403)
+        self.assertEqual(allowed.status_code, 200)
+        self.assertIn("by_model", allowed.json())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,340 @@
+"""Token usage and cost accounting for OpenAI calls.
+
+Every completion and transcription records a ``UsageRecord``. Records are
+attached to the current request context and aggregated in memory per model
+and per user; ``UsageFlusher`` can periodically bulk-insert the aggregated
+deltas into Supabase.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from metrics import PROMPT_TOKENS
+from request_context import attach_usage, get_usage_records, get_user_id
+
+PRICE_TABLE_ENV = "OPENAI_PRICE_TABLE"
+USAGE_TABLE = "api_usage"
+logger = logging.getLogger(__name__)
+MAX_TRACKED_USERS = 50_000
+# Unflushed (user, model) rows kept across failed flushes; new rows beyond this are folded into OVERFLOW_USER
+MAX_PENDING_ROWS = 10_000
+# Pending usage of users past the caps is flushed under this uid, so api_usage cost stays complete
+OVERFLOW_USER = "other"
+
+# USD per 1M tokens (input, cached input, output), or per audio minute.
+DEFAULT_PRICE_TABLE: Dict[str, Dict[str, float]] = {
+    "gpt-5": {"input": 1.25, "cached_input": 0.125, "output": 10.0},
+    "gpt-5-mini": {"input": 0.25, "cached_input": 0.025, "output": 2.0},
+    "gpt-5-nano": {"input": 0.05, "cached_input": 0.005, "output": 0.4},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.6},
+    "whisper-1": {"audio_minute": 0.006},
+}
+
+
+def load_price_table() -> Dict[str, Dict[str, float]]:
+    """Default prices, overridden by OPENAI_PRICE_TABLE (inline JSON or a path to a JSON file)"""
+    table = {model: dict(prices) for model, prices in DEFAULT_PRICE_TABLE.items()}
+    raw = os.getenv(PRICE_TABLE_ENV)
+    if raw:
+        if not raw.lstrip().startswith("{"):
+            with open(raw, "r", encoding="utf-8") as price_file:
+                raw = price_file.read()
+        for model, prices in json.loads(raw).items():
+            table.setdefault(model, {}).update({k: float(v) for k, v in prices.items()})
+    return table
+
+
+def _prices_for(model: str, table: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+    if model in table:
+        return table[model]
+    # Dated snapshots ("gpt-5-mini-2025-08-07") fall back to the longest matching prefix
+    matches = [name for name in table if model.startswith(name)]
+    return table[max(matches, key=len)] if matches else {}
+
+
+@dataclass
+class UsageRecord:
+    model: str
+    operation: str
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    image_count: int = 0
+    audio_seconds: float = 0.0
+    cost_usd: float = 0.0
+    user_id: Optional[str] = None
+
+
+def compute_cost(record: UsageRecord, table: Dict[str, Dict[str, float]]) -> float:
+    prices = _prices_for(record.model, table)
+    uncached = max(0, record.prompt_tokens - record.cached_tokens)
+    cost = (
+        uncached * prices.get("input", 0.0)
+        + record.cached_tokens * prices.get("cached_input", prices.get("input", 0.0))
+        + record.completion_tokens * prices.get("output", 0.0)
+    ) / 1_000_000
+    cost += record.audio_seconds / 60 * prices.get("audio_minute", 0.0)
+    return cost
+
+
+@dataclass
+class UsageTotals:
+    requests: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    image_count: int = 0
+    audio_seconds: float = 0.0
+    cost_usd: float = 0.0
+
+    def add(self, record: UsageRecord) -> None:
+        self.requests += 1
+        self.prompt_tokens += record.prompt_tokens
+        self.cached_tokens += record.cached_tokens
+        self.completion_tokens += record.completion_tokens
+        self.image_count += record.image_count
+        self.audio_seconds += record.audio_seconds
+        self.cost_usd += record.cost_usd
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["cost_usd"] = round(self.cost_usd, 6)
+        data["audio_seconds"] = round(self.audio_seconds, 2)
+        data["cached_token_ratio"] = (
+            round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0
+        )
+        return data
+
+
+@dataclass
+class _Bucket:
+    by_model: Dict[str, UsageTotals] = field(default_factory=dict)
+    by_operation: Dict[str, UsageTotals] = field(default_factory=dict)
+    by_user: Dict[str, UsageTotals] = field(default_factory=dict)
+    by_user_model: Dict[tuple, UsageTotals] = field(default_factory=dict)
+    # Where users past MAX_TRACKED_USERS go; None leaves them out of the per-user maps
+    overflow_user: Optional[str] = None
+
+    def add(self, record: UsageRecord) -> None:
+        self.by_model.setdefault(record.model, UsageTotals()).add(record)
+        self.by_operation.setdefault(record.operation, UsageTotals()).add(record)
+        user = record.user_id or "anonymous"
+        if user not in self.by_user and len(self.by_user) >= MAX_TRACKED_USERS:
+            if self.overflow_user is None:
+                return
+            user = self.overflow_user
+        self.by_user.setdefault(user, UsageTotals()).add(record)
+        self.by_user_model.setdefault((user, record.model), UsageTotals()).add(record)
+
+
+class UsageAggregator:
+    """Process-wide usage totals plus the delta not yet flushed to Supabase"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._totals = _Bucket()
+        self._pending = _Bucket(overflow_user=OVERFLOW_USER)
+        self.started_at = datetime.now(timezone.utc)
+
+    def add(self, record: UsageRecord) -> None:
+        with self._lock:
+            self._totals.add(record)
+            self._pending.add(record)
+
+    def snapshot(self, top_users: int = 50) -> Dict[str, Any]:
+        with self._lock:
+            by_model = {model: totals.to_dict() for model, totals in self._totals.by_model.items()}
+            # Per pipeline stage; cached_token_ratio here shows how well prompt prefixes are reused
+            by_operation = {op: totals.to_dict() for op, totals in self._totals.by_operation.items()}
+            users = sorted(self._totals.by_user.items(), key=lambda kv: kv[1].cost_usd, reverse=True)
+            by_user = {user: totals.to_dict() for user, totals in users[:top_users]}
+            tracked_users = len(self._totals.by_user)
+        return {
+            "since": self.started_at.isoformat(),
+            "total_cost_usd": round(sum(m["cost_usd"] for m in by_model.values()), 6),
+            "by_model": by_model,
+            "by_operation": by_operation,
+            "top_users": by_user,
+            "tracked_users": tracked_users,
+        }
+
+    def drain_pending(self) -> Dict[tuple, UsageTotals]:
+        """Hand over per (user, model) deltas since the last drain"""
+        with self._lock:
+            pending, self._pending = self._pending.by_user_model, _Bucket(overflow_user=OVERFLOW_USER)
+        return pending
+
+    def restore_pending(self, pending: Dict[tuple, UsageTotals]) -> None:
+        """Put back deltas whose flush failed so they are retried next time"""
+        with self._lock:
+            by_user_model = self._pending.by_user_model
+            for key, totals in pending.items():
+                if key not in by_user_model and len(by_user_model) >= MAX_PENDING_ROWS:
+                    key = (OVERFLOW_USER, key[1])
+                current = by_user_model.setdefault(key, UsageTotals())
+                for name in ("requests", "prompt_tokens", "cached_tokens", "completion_tokens",
+                             "image_count", "audio_seconds", "cost_usd"):
+                    setattr(current, name, getattr(current, name) + getattr(totals, name))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._totals = _Bucket()
+            self._pending = _Bucket(overflow_user=OVERFLOW_USER)
+            self.started_at = datetime.now(timezone.utc)
+
+
+AGGREGATOR = UsageAggregator()
+_price_table: Optional[Dict[str, Dict[str, float]]] = None
+
+
+def get_price_table() -> Dict[str, Dict[str, float]]:
+    global _price_table
+    if _price_table is None:
+        _price_table = load_price_table()
+    return _price_table
+
+
+def record_usage(record: UsageRecord) -> UsageRecord:
+    if record.user_id is None:
+        record.user_id = get_user_id()
+    record.cost_usd = compute_cost(record, get_price_table())
+    attach_usage(record)
+    AGGREGATOR.add(record)
+    return record
+
+
+def _count_images(messages: List[Dict[str, Any]]) -> int:
+    count = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            count += sum(1 for part in content if isinstance(part, dict) and part.get("type") == "image_url")
+    return count
+
+
+def record_completion_usage(
+    model: str, operation: str, response: Any, messages: Optional[List[Dict[str, Any]]] = None
+) -> Optional[UsageRecord]:
+    """Record ``response.usage`` from a chat completion; no-op if the response has none"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    record = record_usage(
+        UsageRecord(
+            model=getattr(response, "model", None) or model,
+            operation=operation,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            cached_tokens=(getattr(details, "cached_tokens", 0) or 0) if details is not None else 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+            image_count=_count_images(messages or []),
+        )
+    )
+    PROMPT_TOKENS.inc(record.cached_tokens, model=model, operation=operation, cache="hit")
+    PROMPT_TOKENS.inc(max(0, record.prompt_tokens - record.cached_tokens), model=model, operation=operation, cache="miss")
+    return record
+
+
+def record_transcription_usage(model: str, audio_seconds: float) -> UsageRecord:
+    return record_usage(UsageRecord(model=model, operation="transcription", audio_seconds=audio_seconds))
+
+
+def _rejected_by_database(exc: BaseException) -> bool:
+    """PostgREST errors carrying a data exception (22xxx) or constraint violation (23xxx) SQLSTATE"""
+    code = getattr(exc, "code", None)
+    return isinstance(code, str) and code[:2] in ("22", "23")
+
+
+class UsageFlusher:
+    """Background thread bulk-inserting aggregated usage deltas into Supabase"""
+
+    def __init__(self, client: Any, interval_s: float, aggregator: UsageAggregator = AGGREGATOR) -> None:
+        self.client = client
+        self.interval_s = interval_s
+        self.aggregator = aggregator
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def flush(self) -> int:
+        pending = self.aggregator.drain_pending()
+        if not pending:
+            return 0
+        flushed_at = datetime.now(timezone.utc).isoformat()
+        batch = [
+            (
+                (user, model),
+                {
+                    "flushed_at": flushed_at,
+                    "uid": None if user == "anonymous" else user,
+                    "model": model,
+                    **{k: v for k, v in totals.to_dict().items() if k != "cached_token_ratio"},
+                },
+            )
+            for (user, model), totals in pending.items()
+        ]
+        settled: Set[tuple] = set()
+        try:
+            return self._insert(batch, settled)
+        except Exception:
+            self.aggregator.restore_pending({key: t for key, t in pending.items() if key not in settled})
+            raise
+
+    def _insert(self, batch: List[Tuple[tuple, Dict[str, Any]]], settled: Set[tuple]) -> int:
+        """
+        Insert ``(key, row)`` pairs, returning how many rows were written
+
+        A batch the database rejects is halved until the offending rows are
+        isolated; those are logged and dropped, since retrying them can only
+        fail again. Any other error (network, auth) is raised so the rows not
+        yet in ``settled`` are kept for the next flush.
+        """
+        try:
+            self.client.table(USAGE_TABLE).insert([row for _, row in batch]).execute()
+        except Exception as exc:
+            if not _rejected_by_database(exc):
+                raise
+            if len(batch) == 1:
+                key, row = batch[0]
+                settled.add(key)
+                logger.error(
+                    "Dropping usage row rejected by the database",
+                    extra={"uid": row["uid"], "model": row["model"], "error": str(exc)},
+                )
+                return 0
+            middle = len(batch) // 2
+            return self._insert(batch[:middle], settled) + self._insert(batch[middle:], settled)
+        settled.update(key for key, _ in batch)
+        return len(batch)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("Usage flush failed: %s", e)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="usage-flusher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        try:
+            self.flush()
+        except Exception as e:
+            logger.warning("Final usage flush failed: %s", e)
+
+
+def request_cost_usd() -> float:
+    """Total cost recorded so far for the current request"""
+    return sum(record.cost_usd for record in get_usage_records())
@@ -0,0 +1,26 @@
+-- OpenAI usage and cost table for Supabase
+-- Written by the backend usage flusher (USAGE_FLUSH_INTERVAL_SECONDS):
+-- one row per (user, model) with the deltas aggregated since the previous flush.
+-- uid is the caller's X-User-ID as sent, so it is plain TEXT rather than a
+-- foreign key: a value that is not a known auth user must not fail the batch.
+
+CREATE TABLE IF NOT EXISTS public.api_usage (
+    id BIGSERIAL PRIMARY KEY,
+    flushed_at TIMESTAMPTZ NOT NULL DEFAULT timezone('utc', now()),
+    uid TEXT,
+    model TEXT NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    cached_tokens BIGINT NOT NULL DEFAULT 0,
+    completion_tokens BIGINT NOT NULL DEFAULT 0,
+    image_count INTEGER NOT NULL DEFAULT 0,
+    audio_seconds DECIMAL(12,2) NOT NULL DEFAULT 0,
+    cost_usd DECIMAL(14,6) NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_api_usage_uid_flushed_at ON public.api_usage(uid, flushed_at);
+CREATE INDEX IF NOT EXISTS idx_api_usage_model_flushed_at ON public.api_usage(model, flushed_at);
+
+-- Backend-only table: no anon/authenticated access
+ALTER TABLE public.api_usage ENABLE ROW LEVEL SECURITY;
+GRANT ALL ON TABLE public.api_usage TO service_role;
@@ -1,29 +1,117 @@
 import requests
 import base64
 import argparse
+import hashlib
+import json
 import os
 import glob
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from requests.adapters import HTTPAdapter
 from deepeval import evaluate
 from deepeval.metrics import GEval
 from deepeval.test_case import LLMTestCase, LLMTestCaseParams
 from deepeval.evaluate import DisplayConfig
 
-def get_food_analysis(image_path):
+DEFAULT_URL = 'http://localhost:5001/analyze_food'
+DEFAULT_CACHE_DIR = '.eval_cache'
+DEFAULT_REPORT_DIR = 'eval_results'
+IMAGE_EXTENSIONS = ["*.jpg", "*.jpeg", "*.png", "*.JPG", "*.JPEG", "*.PNG"]
+
+# Special expected ranges for fs directory (original test cases)
+EXPECTED_RANGES = {
+    "fs": {
+        "f1.jpg": "550-650",
+        "f2.jpeg": "500-600",
+        "f3.jpg": "550-650"
+    }
+}
+DEFAULT_RANGE = "400-800"
+
+_session_lock = threading.Lock()
+_session = None
+
+
+def get_session(pool_size=4):
+    """One HTTP session (and connection pool) shared by every worker"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+
+def backend_version(backend_dir="backend"):
+    """Identify the backend code: git tree hash of backend/ plus any uncommitted diff"""
+    try:
+        tree = subprocess.run(
+            ['git', 'rev-parse', f'HEAD:{backend_dir}'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+        diff = subprocess.run(
+            ['git', 'diff', 'HEAD', '--', backend_dir],
+            capture_output=True, check=True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    if diff:
+        return f"{tree[:12]}-dirty-{hashlib.sha256(diff).hexdigest()[:12]}"
+    return tree[:12]
+
+
+class ResponseCache:
+    """Backend responses on disk, keyed by image hash and backend version"""
+
+    def __init__(self, directory, version):
+        self.directory = directory
+        self.version = version
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, image_hash):
+        key = hashlib.sha256(f"{self.version}:{image_hash}".encode()).hexdigest()
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, image_hash):
+        try:
+            with open(self._path(image_hash), encoding='utf-8') as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, image_hash, entry):
+        path = self._path(image_hash)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as cache_file:
+            json.dump(entry, cache_file)
+        os.replace(tmp_path, path)
+
+
+def get_food_analysis(image_path, image_bytes=None, url=DEFAULT_URL, session=None):
     """Get food analysis from backend API"""
-    with open(image_path, 'rb') as image_file:
-        base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-    
-    response = requests.post(
-        'http://localhost:5001/analyze_food',
-        headers={'Content-Type': 'application/json'},
-        json={'image': base64_image, 'filename': image_path}
+    if image_bytes is None:
+        with open(image_path, 'rb') as image_file:
+            image_bytes = image_file.read()
+    base64_image = base64.b64encode(image_bytes).decode('utf-8')
+
+    response = (session or get_session()).post(
+        url,
+        headers={'Content-Type': 'application/json', 'X-User-ID': 'eval'},
+        json={'image': base64_image, 'filename': image_path},
+        timeout=300
     )
-    
+
     if response.status_code == 200:
         return response.json()
     else:
         raise Exception(f"API Error: {response.text}")
 
+
 def create_calories_test_case(image_path, actual_result, expected_range):
     """Create test case for calories evaluation"""
     return LLMTestCase(
@@ -33,11 +121,41 @@ def create_calories_test_case(image_path, actual_result, expected_range):
         context=[f"Image path: {image_path}"]
     )
 
-def run_test_directory(test_dir):
-    """Run tests on images from a specific test directory"""
-    
-    # Define evaluation metrics
-    calories_metric = GEval(
+
+def in_range(calories, expected_range):
+    low, _, high = expected_range.partition('-')
+    return float(low) <= calories <= float(high)
+
+
+def find_images(test_dir):
+    test_dir_path = os.path.join("test_cases", test_dir)
+    image_files = []
+    for ext in IMAGE_EXTENSIONS:
+        image_files.extend(glob.glob(os.path.join(test_dir_path, ext)))
+    # glob is case-sensitive only on some filesystems; avoid double entries
+    return sorted(set(image_files))
+
+
+def analyze_case(image_path, cache, url, session):
+    """Fetch one case from the cache or the backend, recording latency"""
+    with open(image_path, 'rb') as image_file:
+        image_bytes = image_file.read()
+    image_hash = hashlib.sha256(image_bytes).hexdigest()
+
+    entry = cache.get(image_hash) if cache else None
+    if entry is not None:
+        return {**entry, 'image_hash': image_hash, 'cached': True}
+
+    start = time.perf_counter()
+    result = get_food_analysis(image_path, image_bytes, url=url, session=session)
+    entry = {'response': result, 'latency_s': round(time.perf_counter() - start, 3)}
+    if cache:
+        cache.put(image_hash, entry)
+    return {**entry, 'image_hash': image_hash, 'cached': False}
+
+
+def build_calories_metric():
+    return GEval(
         name="Calories Accuracy",
         criteria="Determine if the calorie estimate is reasonable for the given image (e.g., within ±50 calories of a plausible value).",
         evaluation_params=[LLMTestCaseParams.ACTUAL_OUTPUT, LLMTestCaseParams.EXPECTED_OUTPUT],
@@ -49,78 +167,137 @@ def run_test_directory(test_dir):
         ],
         model="gpt-5-nano"
     )
-    
-    # Find all image files in the test directory
-    test_dir_path = os.path.join("test_cases", test_dir)
-    image_extensions = ["*.jpg", "*.jpeg", "*.png", "*.JPG", "*.JPEG", "*.PNG"]
-    image_files = []
-    
-    for ext in image_extensions:
-        image_files.extend(glob.glob(os.path.join(test_dir_path, ext)))
-    
-    if not image_files:
-        print(f"❌ No images found in {test_dir_path}")
+
+
+def judge_cases(cases):
+    """Run GEval over every successful case in one batched evaluate() call"""
+    judged = [case for case in cases if case.get('response')]
+    if not judged:
         return
-    
-    print(f"Running tests for {test_dir} with {len(image_files)} images...")
-    
-    # Special expected ranges for fs directory (original test cases)
-    if test_dir == "fs":
-        expected_ranges = {
-            "f1.jpg": "550-650",
-            "f2.jpeg": "500-600", 
-            "f3.jpg": "550-650"
+    test_cases = [
+        create_calories_test_case(case['image'], case['response'], case['expected_range'])
+        for case in judged
+    ]
+    display_config = DisplayConfig(
+        verbose_mode=False,
+        print_results=False,
+        show_indicator=False
+    )
+    evaluation = evaluate(
+        test_cases=test_cases,
+        metrics=[build_calories_metric()],
+        display_config=display_config
+    )
+    by_input = {result.input: result for result in evaluation.test_results}
+    for case, test_case in zip(judged, test_cases):
+        result = by_input.get(test_case.input)
+        if result is None or not result.metrics_data:
+            continue
+        metric = result.metrics_data[0]
+        case['geval'] = {'passed': metric.success, 'score': metric.score, 'reason': metric.reason}
+
+
+def run_test_directory(test_dir, workers=4, url=DEFAULT_URL, cache_dir=DEFAULT_CACHE_DIR,
+                       use_cache=True, judge=True):
+    """Run tests on images from a specific test directory"""
+    image_files = find_images(test_dir)
+    if not image_files:
+        print(f"❌ No images found in {os.path.join('test_cases', test_dir)}")
+        return None
+
+    version = backend_version()
+    cache = ResponseCache(cache_dir, version) if use_cache else None
+    session = get_session(workers)
+    expected_ranges = EXPECTED_RANGES.get(test_dir, {})
+    print(f"Running tests for {test_dir} with {len(image_files)} images "
+          f"(backend {version}, {workers} workers)...")
+
+    cases = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(analyze_case, image_path, cache, url, session): image_path
+            for image_path in image_files
         }
-    else:
-        # Default expected range for other directories
-        expected_ranges = {}
-        default_range = "400-800"
-    
-    for image_path in image_files:
-        image_name = os.path.basename(image_path)
-        print(f"\n--- Testing {image_name} ---")
-        
-        # Get expected range for this specific image or use default
-        if test_dir == "fs":
-            expected_range = expected_ranges.get(image_name, "400-800")
-        else:
-            expected_range = default_range
-        
-        try:
-            # Get analysis from backend
-            result = get_food_analysis(image_path)
-            print(f"Calories: {result['calories']}")
-            
-            # Create test cases
-            calories_test = create_calories_test_case(image_path, result, expected_range)
-            
-            # Evaluate calories with suppressed verbose output
-            display_config = DisplayConfig(
-                verbose_mode=False,
-                print_results=False,
-                show_indicator=False
-            )
-            
-            calories_result = evaluate(
-                test_cases=[calories_test], 
-                metrics=[calories_metric],
-                display_config=display_config
-            )
-            
-            # Show simplified result
-            passed = calories_result.test_results[0].metrics_data[0].success
-            status = "✅ PASS" if passed else "❌ FAIL"
-            print(f"{status} {image_name}: {result['calories']} calories")
-            
-        except Exception as e:
-            print(f"❌ Error testing {image_name}: {e}")
+        for future in as_completed(futures):
+            image_path = futures[future]
+            image_name = os.path.basename(image_path)
+            case = {
+                'image': image_path,
+                'expected_range': expected_ranges.get(image_name, DEFAULT_RANGE),
+            }
+            try:
+                case.update(future.result())
+                calories = case['response']['calories']
+                case['calories'] = calories
+                case['in_range'] = in_range(calories, case['expected_range'])
+                source = "cached" if case['cached'] else f"{case['latency_s']:.2f}s"
+                print(f"  {image_name}: {calories} calories ({source})")
+            except Exception as e:
+                case['error'] = str(e)
+                print(f"❌ Error testing {image_name}: {e}")
+            cases.append(case)
+    wall_s = time.perf_counter() - started
+
+    if judge:
+        judge_cases(cases)
+
+    cases.sort(key=lambda case: case['image'])
+    for case in cases:
+        if 'error' in case:
+            continue
+        passed = case.get('geval', {}).get('passed', case['in_range'])
+        status = "✅ PASS" if passed else "❌ FAIL"
+        print(f"{status} {os.path.basename(case['image'])}: {case['calories']} calories")
+
+    fetched = [case['latency_s'] for case in cases if case.get('cached') is False]
+    return {
+        'test_dir': test_dir,
+        'backend_version': version,
+        'url': url,
+        'workers': workers,
+        'wall_s': round(wall_s, 3),
+        'cached': sum(1 for case in cases if case.get('cached')),
+        'fetched': len(fetched),
+        'errors': sum(1 for case in cases if 'error' in case),
+        'passed': sum(1 for case in cases if case.get('geval', {}).get('passed', case.get('in_range'))),
+        'mean_latency_s': round(sum(fetched) / len(fetched), 3) if fetched else None,
+        'cases': cases,
+    }
+
+
+def write_report(report, path=None):
+    if path is None:
+        os.makedirs(DEFAULT_REPORT_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        path = os.path.join(DEFAULT_REPORT_DIR, f"eval_{report['test_dir']}_{stamp}.json")
+    with open(path, 'w', encoding='utf-8') as report_file:
+        json.dump(report, report_file, indent=2)
+    return path
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Run food analysis tests')
     parser.add_argument('--test', type=str, help='Test directory name (e.g., rice-breast-beans)')
-    
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent backend requests (default: 4)')
+    parser.add_argument('--url', type=str, default=DEFAULT_URL, help=f'Analysis endpoint (default: {DEFAULT_URL})')
+    parser.add_argument('--cache-dir', type=str, default=DEFAULT_CACHE_DIR, help='Response cache directory')
+    parser.add_argument('--no-cache', action='store_true', help='Always call the backend')
+    parser.add_argument('--no-judge', action='store_true', help='Skip GEval and use the expected range check only')
+    parser.add_argument('--report', type=str, help=f'Report path (default: {DEFAULT_REPORT_DIR}/eval_<dir>_<ts>.json)')
+
     args = parser.parse_args()
-    
+
     test_dir = args.test if args.test else "fs"
-    run_test_directory(test_dir)
+    report = run_test_directory(
+        test_dir,
+        workers=max(1, args.workers),
+        url=args.url,
+        cache_dir=args.cache_dir,
+        use_cache=not args.no_cache,
+        judge=not args.no_judge
+    )
+    if report is not None:
+        print(f"\n{report['passed']}/{len(report['cases'])} passed, {report['cached']} cached, "
+              f"{report['fetched']} fetched in {report['wall_s']:.1f}s")
+        print(f"Report: {write_report(report, args.report)}")